@@ -0,0 +1,21 @@
+import os
+from sqlalchemy import text
+from .database import SessionLocal
+
+AUDIT_DRAIN_ENABLED = os.getenv("AUDIT_DRAIN_ENABLED", "1") == "1"
+AUDIT_DRAIN_INTERVAL = float(os.getenv("AUDIT_DRAIN_INTERVAL", "1.0"))
+AUDIT_DRAIN_BATCH = int(os.getenv("AUDIT_DRAIN_BATCH", "1000"))
+
+
+def drain_audit_queue(batch_size: int = AUDIT_DRAIN_BATCH):
+    moved_total = 0
+    with SessionLocal() as db:
+        while True:
+            moved = db.execute(
+                text("SELECT drain_audit_log_queue(:batch_size)"),
+                {"batch_size": batch_size}).scalar()
+            db.commit()
+            moved_total += moved
+            if moved < batch_size:
+                break
+    return moved_total
@@ -0,0 +1,77 @@
+import logging
+import select
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.func()
+            except Exception:
+                logger.exception(f"Ошибка фоновой задачи {self.name}")
+
+
+class NotificationListener(PeriodicTask):
+    def __init__(self, name, engine, channel, callback, on_connect=None,
+                 poll_interval=1.0, reconnect_delay=5.0):
+        super().__init__(name, reconnect_delay, callback)
+        self.engine = engine
+        self.channel = channel
+        self.on_connect = on_connect
+        self.poll_interval = poll_interval
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception(f"Ошибка фоновой задачи {self.name}")
+                self._stop.wait(self.interval)
+
+    def _listen(self):
+        # Соединение LISTEN живёт всё время работы задачи, поэтому
+        # оно отсоединяется от пула и не занимает в нём место
+        connection = self.engine.raw_connection()
+        connection.detach()
+        try:
+            dbapi_connection = connection.dbapi_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            # Уведомления, пришедшие до подписки, потеряны
+            if self.on_connect is not None:
+                self.on_connect()
+
+            while not self._stop.is_set():
+                if not select.select([dbapi_connection], [], [], self.poll_interval)[0]:
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notify = dbapi_connection.notifies.pop(0)
+                    self.func(notify.payload)
+        finally:
+            connection.close()
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+from sqlalchemy import text
+
+CATEGORY_TREE_CHECK_INTERVAL = float(os.getenv("CATEGORY_TREE_CHECK_INTERVAL", "5"))
+
+VERSION_SQL = "SELECT version FROM cache_versions WHERE name = 'equipment_categories'"
+CATEGORIES_SQL = "SELECT id, name, description, parent_id FROM equipment_categories ORDER BY id"
+
+
+class CategoryTree:
+    def __init__(self, version, rows):
+        self.version = version
+        self.categories = {row["id"]: dict(row) for row in rows}
+        self.children = {category_id: [] for category_id in self.categories}
+        self.roots = []
+        for category in self.categories.values():
+            parent_id = category["parent_id"]
+            if parent_id in self.children:
+                self.children[parent_id].append(category["id"])
+            else:
+                self.roots.append(category["id"])
+
+    def __contains__(self, category_id):
+        return category_id in self.categories
+
+    def node(self, category_id):
+        return {**self.categories[category_id],
+                "children": [self.node(child_id) for child_id in self.children[category_id]]}
+
+    def nodes(self):
+        return [self.node(category_id) for category_id in self.roots]
+
+    def subtree(self, category_id):
+        result = []
+        stack = [(category_id, 0)]
+        while stack:
+            current_id, depth = stack.pop()
+            result.append({**self.categories[current_id], "depth": depth})
+            stack.extend((child_id, depth + 1)
+                         for child_id in reversed(self.children[current_id]))
+        return result
+
+
+class CategoryTreeCache:
+    def __init__(self, check_interval=CATEGORY_TREE_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._tree = None
+        self._checked_at = 0.0
+
+    def get(self, db):
+        tree = self._tree
+        if tree is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return tree
+
+        with self._lock:
+            if self._tree is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._tree
+            version = db.execute(text(VERSION_SQL)).scalar()
+            # Без строки версии изменения не отследить: дерево перечитывается
+            if self._tree is None or version is None or self._tree.version != version:
+                rows = db.execute(text(CATEGORIES_SQL)).mappings().fetchall()
+                self._tree = CategoryTree(version, rows)
+            self._checked_at = time.monotonic()
+            return self._tree
+
+
+category_tree = CategoryTreeCache()
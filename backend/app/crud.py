@@ -1,9 +1,35 @@
-from sqlalchemy.orm import Session, joinedload
-from . import models, schemas
+from sqlalchemy import insert, select, text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session, joinedload, selectinload
+from . import models, rental_cache, schemas
 from datetime import date
 from typing import List, Optional
 
 
+EXCLUSION_VIOLATION = "23P01"
+
+
+class EquipmentUnavailableError(ValueError):
+    pass
+
+
+def is_booking_conflict(e):
+    orig = getattr(e, "orig", None)
+    cause = getattr(orig, "__cause__", None) or orig
+    return (getattr(cause, "pgcode", None) or getattr(cause, "sqlstate", None)) == EXCLUSION_VIOLATION
+
+
+def booking_conflict_error(db: Session, rental: schemas.RentalCreate):
+    busy = [item.equipment_id for item in rental.items if not db.execute(
+        text("SELECT is_equipment_available(:equipment_id, :start_date, :end_date)"),
+        {"equipment_id": item.equipment_id, "start_date": rental.start_date,
+         "end_date": rental.return_date or rental.end_date}).scalar()]
+    if not busy:
+        return EquipmentUnavailableError("Оборудование уже занято на эти даты")
+    return EquipmentUnavailableError(
+        f"Оборудование уже занято на эти даты: {', '.join(map(str, busy))}")
+
+
 def create_rental(db: Session, rental: schemas.RentalCreate):
     db_rental = models.Rentals(
         user_id=rental.user_id,
@@ -24,7 +50,13 @@ def create_rental(db: Session, rental: schemas.RentalCreate):
         )
         db.add(db_item)
 
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_booking_conflict(e):
+            raise booking_conflict_error(db, rental)
+        raise
     db.refresh(db_rental)
     return db_rental
 
@@ -56,6 +88,7 @@ def return_rental(db: Session, rental_id: int, return_date: date):
     rental.status = "Завершён"
 
     db.commit()
+    rental_cache.invalidate(rental_id)
     db.refresh(rental)
     return rental
 
@@ -71,5 +104,111 @@ def cancel_rental(db: Session, rental_id: int):
 
     rental.status = "Отменён"
     db.commit()
+    rental_cache.invalidate(rental_id)
     db.refresh(rental)
     return rental
+
+
+BULK_MODES = ("all_or_nothing", "best_effort")
+BULK_MAX_RENTALS = 500
+
+
+def _error_message(e):
+    if is_booking_conflict(e):
+        return "Оборудование уже занято на эти даты"
+    orig = getattr(e, "orig", None) or e
+    # asyncpg оборачивается адаптером SQLAlchemy, исходная ошибка в __cause__
+    return str(orig.__cause__ or orig).strip().split("\n")[0]
+
+
+def validate_rental(rental: schemas.RentalCreate):
+    if rental.end_date < rental.start_date:
+        raise ValueError("Дата окончания не может быть раньше даты начала")
+    equipment_ids = [item.equipment_id for item in rental.items]
+    if len(equipment_ids) != len(set(equipment_ids)):
+        raise ValueError("Оборудование повторяется в одной аренде")
+
+
+def _insert_rentals(db: Session, rentals: List[schemas.RentalCreate]):
+    rental_ids = db.scalars(
+        insert(models.Rentals).returning(
+            models.Rentals.id, sort_by_parameter_order=True),
+        [{
+            "user_id": rental.user_id,
+            "employee_id": rental.employee_id,
+            "start_date": rental.start_date,
+            "end_date": rental.end_date,
+            "return_date": rental.return_date,
+            "status": "Активен",
+        } for rental in rentals]
+    ).all()
+
+    items = [{
+        "rental_id": rental_id,
+        "equipment_id": item.equipment_id,
+        "damage_fee": item.damage_fee,
+    } for rental_id, rental in zip(rental_ids, rentals) for item in rental.items]
+    if items:
+        db.execute(insert(models.RentalItems), items)
+    return rental_ids
+
+
+def _insert_rentals_isolated(db: Session, rentals, indexes):
+    created, errors = {}, {}
+    for index in indexes:
+        try:
+            with db.begin_nested():
+                created[index] = _insert_rentals(db, [rentals[index]])[0]
+        except SQLAlchemyError as e:
+            errors[index] = _error_message(e)
+    return created, errors
+
+
+def create_rentals_bulk(db: Session, rentals: List[schemas.RentalCreate],
+                        mode: str = "all_or_nothing"):
+    if mode not in BULK_MODES:
+        raise ValueError(f"Неизвестный режим: {mode}. Доступны: {', '.join(BULK_MODES)}")
+    if len(rentals) > BULK_MAX_RENTALS:
+        raise ValueError(f"В одном запросе не более {BULK_MAX_RENTALS} аренд")
+
+    errors = {}
+    for index, rental in enumerate(rentals):
+        try:
+            validate_rental(rental)
+        except ValueError as ve:
+            errors[index] = str(ve)
+    valid = [index for index in range(len(rentals)) if index not in errors]
+
+    created = {}
+    if valid and not (errors and mode == "all_or_nothing"):
+        try:
+            with db.begin_nested():
+                rental_ids = _insert_rentals(db, [rentals[index] for index in valid])
+            created = dict(zip(valid, rental_ids))
+        except SQLAlchemyError:
+            # Пакетная вставка не сообщает, какая аренда вызвала ошибку,
+            # поэтому аренды повторно вставляются по одной
+            created, failed = _insert_rentals_isolated(db, rentals, valid)
+            errors.update(failed)
+
+    if errors and mode == "all_or_nothing":
+        db.rollback()
+        created = {}
+        for index in range(len(rentals)):
+            errors.setdefault(
+                index, "Аренда не создана: пакет отменён из-за ошибок в других арендах")
+    else:
+        db.commit()
+
+    loaded = {}
+    if created:
+        loaded = {rental.id: rental for rental in db.scalars(
+            select(models.Rentals)
+            .options(selectinload(models.Rentals.items))
+            .where(models.Rentals.id.in_(created.values()))
+        )}
+    return [{
+        "index": index,
+        "rental": loaded.get(created.get(index)),
+        "error": errors.get(index),
+    } for index in range(len(rentals))]
@@ -0,0 +1,101 @@
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from . import models, rental_cache, schemas
+from .crud import EquipmentUnavailableError, is_booking_conflict
+from datetime import date
+
+
+async def _load_rental(db: AsyncSession, rental_id: int):
+    result = await db.execute(
+        select(models.Rentals)
+        .options(
+            selectinload(models.Rentals.items)
+            .selectinload(models.RentalItems.equipment)
+            .selectinload(models.Equipment.model)
+        )
+        .where(models.Rentals.id == rental_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+
+async def booking_conflict_error(db: AsyncSession, rental: schemas.RentalCreate):
+    busy = []
+    for item in rental.items:
+        available = (await db.execute(
+            text("SELECT is_equipment_available(:equipment_id, :start_date, :end_date)"),
+            {"equipment_id": item.equipment_id, "start_date": rental.start_date,
+             "end_date": rental.return_date or rental.end_date})).scalar()
+        if not available:
+            busy.append(item.equipment_id)
+    if not busy:
+        return EquipmentUnavailableError("Оборудование уже занято на эти даты")
+    return EquipmentUnavailableError(
+        f"Оборудование уже занято на эти даты: {', '.join(map(str, busy))}")
+
+
+async def create_rental(db: AsyncSession, rental: schemas.RentalCreate):
+    db_rental = models.Rentals(
+        user_id=rental.user_id,
+        employee_id=rental.employee_id,
+        start_date=rental.start_date,
+        end_date=rental.end_date,
+        return_date=rental.return_date,
+        status="Активен"
+    )
+    db.add(db_rental)
+    await db.flush()
+
+    for item in rental.items:
+        db_item = models.RentalItems(
+            rental_id=db_rental.id,
+            equipment_id=item.equipment_id,
+            damage_fee=item.damage_fee
+        )
+        db.add(db_item)
+
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_booking_conflict(e):
+            raise await booking_conflict_error(db, rental)
+        raise
+    return await _load_rental(db, db_rental.id)
+
+
+async def get_rental(db: AsyncSession, rental_id: int):
+    return await _load_rental(db, rental_id)
+
+
+async def return_rental(db: AsyncSession, rental_id: int, return_date: date):
+    rental = await db.get(models.Rentals, rental_id)
+    if not rental:
+        raise ValueError("Аренда не найдена")
+    if rental.status in ("Завершён", "Отменён"):
+        raise ValueError("Аренда уже завершена или отменена")
+    if return_date < rental.start_date:
+        raise ValueError("Дата возврата не может быть раньше даты начала")
+
+    rental.return_date = return_date
+    rental.status = "Завершён"
+
+    await db.commit()
+    await rental_cache.invalidate_async(rental_id)
+    return await _load_rental(db, rental_id)
+
+
+async def cancel_rental(db: AsyncSession, rental_id: int):
+    rental = await db.get(models.Rentals, rental_id)
+    if not rental:
+        raise ValueError("Аренда не найдена")
+    if rental.status not in ("Активен", "Просрочен срок аренды"):
+        raise ValueError(
+            "Можно отменять только активные или просроченные аренды")
+
+    rental.status = "Отменён"
+    await db.commit()
+    await rental_cache.invalidate_async(rental_id)
+    return await _load_rental(db, rental_id)
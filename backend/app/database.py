@@ -1,8 +1,13 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
+import time
+import uuid
 from dotenv import load_dotenv
+from . import metrics, sql_trace
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -10,8 +15,124 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL не задан в переменных окружения!")
 
-engine = create_engine(DATABASE_URL)
+DB_MODE = os.getenv("DB_MODE", "sync")
+if DB_MODE not in ("sync", "async"):
+    raise ValueError("DB_MODE должен быть sync или async")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+metrics.describe("db_pool_checkout_wait_seconds",
+                 "Время ожидания соединения из пула")
+metrics.describe("db_pool_checkout_failures_total",
+                 "Неудачные попытки получить соединение из пула")
+metrics.describe("db_pool_checked_out", "Соединения, выданные из пула")
+metrics.describe("db_pool_overflow", "Соединения сверх размера пула")
+metrics.describe("db_pool_size", "Размер пула соединений")
+metrics.describe("db_pool_max_overflow", "Допустимое число соединений сверх размера пула")
+
+
+class InstrumentedQueuePool(QueuePool):
+    metrics_label = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.inc("db_pool_checkout_failures_total",
+                        pool=self.metrics_label, reason="timeout")
+            raise
+        except Exception:
+            metrics.inc("db_pool_checkout_failures_total",
+                        pool=self.metrics_label, reason="error")
+            raise
+        finally:
+            metrics.observe("db_pool_checkout_wait_seconds",
+                            time.perf_counter() - started, pool=self.metrics_label)
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+
+def register_pool_metrics(engine, label):
+    metrics.register_gauge("db_pool_size", lambda: engine.pool.size(), pool=label)
+    metrics.register_gauge(
+        "db_pool_checked_out", lambda: engine.pool.checkedout(), pool=label)
+    metrics.register_gauge(
+        "db_pool_overflow", lambda: max(engine.pool.overflow(), 0), pool=label)
+    metrics.register_gauge(
+        "db_pool_max_overflow", lambda: DB_MAX_OVERFLOW, pool=label)
+
+
+def set_transaction_timeout(connection):
+    connection.exec_driver_sql(
+        f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT}")
+
+
+def engine_options(connect_args):
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+sync_connect_args = {}
+if DB_STATEMENT_TIMEOUT and not DB_PGBOUNCER:
+    sync_connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool,
+                       **engine_options(sync_connect_args))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+register_pool_metrics(engine, "sync")
+if sql_trace.SQL_TRACE_ENABLED:
+    sql_trace.instrument(engine)
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_MODE == "async":
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or make_url(
+        DATABASE_URL).set(drivername="postgresql+asyncpg")
+    async_connect_args = {}
+    if DB_STATEMENT_TIMEOUT and not DB_PGBOUNCER:
+        async_connect_args["server_settings"] = {
+            "statement_timeout": str(DB_STATEMENT_TIMEOUT)}
+    if DB_PGBOUNCER:
+        # В режиме пула транзакций PgBouncer соединение с сервером меняется
+        # между транзакциями, поэтому кэш подготовленных выражений отключён,
+        # а имена выражений не повторяются
+        async_connect_args["statement_cache_size"] = 0
+        async_connect_args["prepared_statement_cache_size"] = 0
+        async_connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool,
+        **engine_options(async_connect_args))
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False)
+    register_pool_metrics(async_engine, "async")
+    if sql_trace.SQL_TRACE_ENABLED:
+        sql_trace.instrument(async_engine.sync_engine)
+
+if DB_STATEMENT_TIMEOUT and DB_PGBOUNCER:
+    # Параметры запуска соединения PgBouncer не передаёт серверу,
+    # поэтому таймаут выставляется в начале каждой транзакции
+    event.listen(engine, "begin", set_transaction_timeout)
+    if async_engine is not None:
+        event.listen(async_engine.sync_engine, "begin", set_transaction_timeout)
 
 Base = declarative_base()
 
@@ -22,3 +143,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
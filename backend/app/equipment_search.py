@@ -0,0 +1,130 @@
+import re
+from sqlalchemy import text
+
+SEARCH_MIN_LENGTH = 2
+SEARCH_MAX_LENGTH = 100
+EQUIPMENT_STATUSES = ("Доступно", "В аренде", "На обслуживании/В ремонте", "Списано")
+
+FULL_TEXT_MATCH = """
+    SELECT s.equipment_id AS id, ts_rank_cd(s.search_vector, query) AS rank
+    FROM equipment_search s, to_tsquery('russian', :tsquery) AS query
+    WHERE s.search_vector @@ query
+"""
+
+PREFIX_MATCH = """
+    SELECT e.id, 1.0 AS rank
+    FROM equipment e
+    WHERE upper(e.inventory_number) LIKE :prefix
+"""
+
+# Поиск с опечатками: только при установленном pg_trgm
+TRIGRAM_MATCHES = (
+    """
+    SELECT e.id, similarity(e.inventory_number, :q) AS rank
+    FROM equipment e
+    WHERE e.inventory_number % :q
+    """,
+    """
+    SELECT e.id, similarity(em.name, :q) AS rank
+    FROM equipment_models em
+    JOIN equipment e ON e.model_id = em.id
+    WHERE em.name % :q
+    """,
+)
+
+# Страница ранжируется и отрезается до соединения с моделями и
+# категориями: детали читаются только для её строк
+SEARCH_SQL = """
+    WITH matches AS ({matches}),
+    page AS (
+        SELECT m.id, max(m.rank) AS rank
+        FROM matches m
+        {filters}
+        GROUP BY m.id
+        ORDER BY rank DESC, id
+        LIMIT :limit OFFSET :offset
+    )
+    SELECT
+        e.id AS equipment_id,
+        e.inventory_number,
+        e.status,
+        e.category_id,
+        ec.name AS category_name,
+        e.model_id,
+        em.name AS model_name,
+        em.brand,
+        em.rental_price_per_day,
+        p.rank
+    FROM page p
+    JOIN equipment e ON e.id = p.id
+    JOIN equipment_models em ON em.id = e.model_id
+    JOIN equipment_categories ec ON ec.id = e.category_id
+    ORDER BY p.rank DESC, e.id
+"""
+
+_trigram = None
+
+
+def trigram_available(db):
+    global _trigram
+    if _trigram is None:
+        _trigram = db.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")).scalar()
+    return _trigram
+
+
+def build_tsquery(q):
+    # Каждое слово ищется по префиксу: «перфор» находит «перфоратор»
+    words = re.findall(r"[^\W_]+", q.lower())
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_search_query(q, status=None, category_id=None, limit=20, offset=0, trigram=False):
+    q = q.strip()
+    if len(q) < SEARCH_MIN_LENGTH:
+        raise ValueError(f"Строка поиска короче {SEARCH_MIN_LENGTH} символов")
+    if status is not None and status not in EQUIPMENT_STATUSES:
+        raise ValueError(
+            f"Неизвестный статус: {status}. Доступны: {', '.join(EQUIPMENT_STATUSES)}")
+
+    params = {"q": q, "prefix": escape_like(q.upper()) + "%",
+              "limit": limit + 1, "offset": offset}
+    matches = [PREFIX_MATCH]
+    tsquery = build_tsquery(q)
+    if tsquery:
+        matches.append(FULL_TEXT_MATCH)
+        params["tsquery"] = tsquery
+    if trigram:
+        matches.extend(TRIGRAM_MATCHES)
+
+    conditions = []
+    if status is not None:
+        conditions.append("e.status = :status")
+        params["status"] = status
+    if category_id is not None:
+        conditions.append("""e.category_id IN (
+            SELECT descendant_id FROM equipment_category_closure
+            WHERE ancestor_id = :category_id
+        )""")
+        params["category_id"] = category_id
+
+    filters = ""
+    if conditions:
+        filters = "JOIN equipment e ON e.id = m.id WHERE " + " AND ".join(conditions)
+    sql = SEARCH_SQL.format(matches=" UNION ALL ".join(matches), filters=filters)
+    return sql, params
+
+
+def search_equipment(db, q, status=None, category_id=None, limit=20, offset=0):
+    sql, params = build_search_query(
+        q, status, category_id, limit, offset, trigram_available(db))
+    rows = db.execute(text(sql), params).mappings().fetchall()
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = offset + limit
+    return rows, next_offset
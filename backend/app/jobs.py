@@ -0,0 +1,302 @@
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+import psycopg2
+from psycopg2.extras import Json
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from .database import DATABASE_URL, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.5"))
+JOB_QUEUE_TIMEOUT = int(os.getenv("JOB_QUEUE_TIMEOUT", "300"))
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "30"))
+
+SCRIPTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts"))
+LOAD_JOB = "load_data"
+LOAD_LOCK = "data_load"
+SCALE_KEYS = ("users_clients", "users_sellers", "users_admins",
+              "equipment", "rentals", "payments")
+
+JOB_SQL = "SELECT * FROM batch_jobs WHERE id = :job_id"
+
+UPDATE_PROGRESS_SQL = """
+    UPDATE batch_jobs
+    SET loaded = CASE
+            WHEN %(absolute)s::jsonb IS NOT NULL THEN %(absolute)s::jsonb
+            ELSE loaded || coalesce((
+                SELECT jsonb_object_agg(key, coalesce((loaded->>key)::bigint, 0) + value::bigint)
+                FROM jsonb_each_text(%(increment)s::jsonb)), '{}')
+        END,
+        step = coalesce(%(step)s, step),
+        planned = coalesce(%(planned)s::jsonb, planned),
+        updated_at = current_timestamp
+    WHERE id = %(job_id)s
+    RETURNING cancel_requested
+"""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobConflictError(ValueError):
+    pass
+
+
+class JobProgress:
+    def __init__(self, db_config, job_id, interval=JOB_PROGRESS_INTERVAL):
+        self.db_config = db_config
+        self.job_id = job_id
+        self.interval = interval
+        self._conn = None
+        self._pending = {}
+        self._flushed_at = 0.0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_conn=None, _pending={}, _flushed_at=0.0)
+        return state
+
+    def __call__(self, event, **fields):
+        if event == "rows":
+            table = fields["table"]
+            self._pending[table] = self._pending.get(table, 0) + fields["rows"]
+            if time.monotonic() - self._flushed_at >= self.interval:
+                self.flush()
+        elif event == "plan":
+            self.flush(planned=fields["planned"])
+        elif event == "step":
+            # Итог по таблицам от основного процесса точнее сумм из
+            # процессов партиций, часть которых могла не успеть отправиться
+            self.flush(step=fields["step"], loaded=fields["loaded"])
+
+    def _execute(self, sql, params):
+        if self._conn is None:
+            self._conn = psycopg2.connect(**self.db_config)
+            self._conn.autocommit = True
+        with self._conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchone() if cur.description else None
+
+    def flush(self, step=None, planned=None, loaded=None):
+        row = self._execute(UPDATE_PROGRESS_SQL, {
+            "job_id": self.job_id, "step": step,
+            "increment": Json(self._pending),
+            "absolute": Json(loaded) if loaded is not None else None,
+            "planned": Json(planned) if planned is not None else None})
+        self._pending = {}
+        self._flushed_at = time.monotonic()
+        if row and row[0]:
+            raise JobCancelled("Загрузка отменена")
+
+    def claim(self):
+        row = self._execute("""
+            UPDATE batch_jobs
+            SET status = 'running', started_at = current_timestamp, updated_at = current_timestamp
+            WHERE id = %s AND status = 'queued' AND NOT cancel_requested
+            RETURNING params
+        """, (self.job_id,))
+        return row[0] if row else None
+
+    def finish(self, status, error=None):
+        self._execute("""
+            UPDATE batch_jobs
+            SET status = %s, error = %s, finished_at = current_timestamp, updated_at = current_timestamp
+            WHERE id = %s
+        """, (status, error, self.job_id))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def run_load_job(job_id):
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, SCRIPTS_DIR)
+    import data_load
+
+    db_config = data_load.db_config_from_url(DATABASE_URL)
+    progress = JobProgress(db_config, job_id)
+    try:
+        params = progress.claim()
+        if params is None:
+            return "cancelled"
+
+        options = {key: value for key, value in params.items() if key not in SCALE_KEYS}
+        scale = {key: value for key, value in params.items() if key in SCALE_KEYS}
+        filler = data_load.DatabaseFiller(db_config, scale=scale, progress=progress, **options)
+        status, error = "succeeded", None
+        try:
+            filler.connect()
+            filler.fill_all()
+        except JobCancelled:
+            status = "cancelled"
+        except Exception as e:
+            logger.exception(f"Ошибка задачи загрузки {job_id}")
+            status, error = "failed", str(e)
+        finally:
+            filler.close()
+        progress.finish(status, error)
+        return status
+    finally:
+        progress.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Процессы создаются через spawn: fork унаследовал бы потоки и
+            # соединения пула API
+            _executor = ProcessPoolExecutor(
+                max_workers=JOB_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _job_done(job_id, future):
+    if future.cancelled():
+        error = "Задача снята с очереди при остановке API"
+    elif future.exception() is not None:
+        error = f"Процесс загрузки завершился с ошибкой: {future.exception()}"
+    else:
+        return
+    with SessionLocal() as db:
+        db.execute(text("""
+            UPDATE batch_jobs
+            SET status = 'failed', error = :error,
+                finished_at = current_timestamp, updated_at = current_timestamp
+            WHERE id = :job_id AND status IN ('queued', 'running')
+        """), {"job_id": job_id, "error": error})
+        db.commit()
+
+
+def recover_stale_jobs(db):
+    # Незавершённая задача без блокировки загрузки осталась от
+    # остановленного API или упавшего процесса
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"),
+                      {"name": LOAD_LOCK}).scalar():
+        return 0
+    result = db.execute(text("""
+        UPDATE batch_jobs
+        SET status = 'failed', error = 'Задача прервана',
+            finished_at = current_timestamp, updated_at = current_timestamp
+        WHERE status IN ('queued', 'running')
+        AND (
+            (status = 'queued' AND created_at < current_timestamp - make_interval(secs => :queue_timeout))
+            OR (status = 'running' AND updated_at < current_timestamp - make_interval(secs => :stale_after))
+        )
+    """), {"queue_timeout": JOB_QUEUE_TIMEOUT, "stale_after": JOB_STALE_AFTER})
+    db.commit()
+    return result.rowcount
+
+
+def _find_job(db, idempotency_key):
+    return db.execute(text("SELECT * FROM batch_jobs WHERE idempotency_key = :key"),
+                      {"key": idempotency_key}).mappings().first()
+
+
+def _idempotent_job(job, params):
+    if job["params"] != params:
+        raise JobConflictError(
+            "Ключ идемпотентности уже использован для загрузки с другими параметрами")
+    return job, False
+
+
+def submit_load_job(db, params, idempotency_key=None):
+    if idempotency_key:
+        job = _find_job(db, idempotency_key)
+        if job is not None:
+            return _idempotent_job(job, params)
+
+    for attempt in range(2):
+        try:
+            job = db.execute(text("""
+                INSERT INTO batch_jobs (kind, params, idempotency_key)
+                VALUES (:kind, :params, :key)
+                RETURNING *
+            """), {"kind": LOAD_JOB, "params": Json(params), "key": idempotency_key}).mappings().one()
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+            if idempotency_key:
+                job = _find_job(db, idempotency_key)
+                if job is not None:
+                    return _idempotent_job(job, params)
+            if attempt or not recover_stale_jobs(db):
+                active = db.execute(text("""
+                    SELECT id FROM batch_jobs
+                    WHERE kind = :kind AND status IN ('queued', 'running')
+                """), {"kind": LOAD_JOB}).scalar()
+                raise JobConflictError(f"Загрузка данных уже выполняется: задача {active}")
+
+    future = executor().submit(run_load_job, job["id"])
+    future.add_done_callback(partial(_job_done, job["id"]))
+    return job, True
+
+
+def get_job(db, job_id):
+    return db.execute(text(JOB_SQL), {"job_id": job_id}).mappings().first()
+
+
+def list_jobs(db, limit=20):
+    return db.execute(text("SELECT * FROM batch_jobs ORDER BY id DESC LIMIT :limit"),
+                      {"limit": limit}).mappings().fetchall()
+
+
+def cancel_job(db, job_id):
+    job = db.execute(text("""
+        UPDATE batch_jobs
+        SET cancel_requested = true,
+            status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+            finished_at = CASE WHEN status = 'queued' THEN current_timestamp ELSE finished_at END,
+            updated_at = current_timestamp
+        WHERE id = :job_id AND status IN ('queued', 'running')
+        RETURNING *
+    """), {"job_id": job_id}).mappings().first()
+    db.commit()
+    if job is None:
+        if get_job(db, job_id) is None:
+            return None
+        raise JobConflictError("Задача уже завершена")
+    return job
+
+
+def job_status(job):
+    job = dict(job)
+    planned = job["planned"] or {}
+    done = sum(min(job["loaded"].get(table, 0), total) for table, total in planned.items())
+    total = sum(planned.values())
+    rate = eta = None
+    if job["started_at"] is not None:
+        finished_at = job["finished_at"] or datetime.now(timezone.utc)
+        elapsed = (finished_at - job["started_at"]).total_seconds()
+        if elapsed > 0 and done:
+            rate = done / elapsed
+        if job["status"] == "running" and rate and total > done:
+            eta = (total - done) / rate
+    job.update(progress=done / total if total else None,
+               rows_per_second=rate, eta_seconds=eta)
+    return job
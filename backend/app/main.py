@@ -1,14 +1,67 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .routers import rentals, reports, batch
+from fastapi.responses import JSONResponse
+from .routers import batch, categories, equipment, metrics
+from .background import NotificationListener, PeriodicTask
+from .database import DB_MODE, async_engine, engine
+from . import audit, fast_json, jobs, overdue, rental_cache, report_views, sql_trace
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+if DB_MODE == "async":
+    from .routers import rentals_async as rentals, reports_async as reports
+else:
+    from .routers import rentals, reports
+
+background_tasks = []
+if audit.AUDIT_DRAIN_ENABLED:
+    background_tasks.append(PeriodicTask(
+        "audit-drain", audit.AUDIT_DRAIN_INTERVAL, audit.drain_audit_queue))
+if report_views.REPORT_REFRESH_ENABLED:
+    background_tasks.append(PeriodicTask(
+        "report-refresh", report_views.REPORT_REFRESH_INTERVAL,
+        report_views.refresh_report_views))
+if overdue.OVERDUE_SWEEP_ENABLED:
+    background_tasks.append(PeriodicTask(
+        "overdue-sweep", overdue.OVERDUE_SWEEP_INTERVAL, overdue.sweep_overdue_rentals))
+if rental_cache.backend is not None and rental_cache.RENTAL_CACHE_LISTEN:
+    background_tasks.append(NotificationListener(
+        "rental-cache-listener", engine, rental_cache.RENTAL_NOTIFY_CHANNEL,
+        rental_cache.apply_notification, on_connect=rental_cache.clear))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for task in background_tasks:
+        task.start()
+    yield
+    for task in background_tasks:
+        task.stop()
+    jobs.shutdown()
+    if DB_MODE == "async":
+        await async_engine.dispose()
+
 
 app = FastAPI(
     title="Система управления арендой инструментов и оборудования",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan,
+    default_response_class=fast_json.FastJSONResponse if fast_json.FAST_JSON else JSONResponse
 )
 
+if sql_trace.SQL_TRACE_ENABLED:
+    app.add_middleware(sql_trace.SQLTraceMiddleware)
+
 app.include_router(rentals.router)
 app.include_router(reports.router)
+app.include_router(equipment.router)
+app.include_router(categories.router)
 app.include_router(batch.router)
+if METRICS_ENABLED:
+    app.include_router(metrics.router)
+if sql_trace.SQL_DEBUG_ENABLED:
+    app.include_router(metrics.debug_router)
 
 
 @app.get("/")
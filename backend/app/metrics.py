@@ -0,0 +1,79 @@
+import threading
+
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_help = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name, help):
+    _help[name] = help
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=HISTOGRAM_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {
+                "buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                histogram["counts"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def register_gauge(name, func, **labels):
+    _gauges[_key(name, labels)] = func
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _header(lines, seen, name, kind):
+    if name in seen:
+        return
+    seen.add(name)
+    if name in _help:
+        lines.append(f"# HELP {name} {_help[name]}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render():
+    lines, seen = [], set()
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(
+            (key, dict(h, counts=list(h["counts"]))) for key, h in _histograms.items())
+    for (name, labels), value in counters:
+        _header(lines, seen, name, "counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), func in sorted(_gauges.items(), key=lambda item: item[0]):
+        _header(lines, seen, name, "gauge")
+        lines.append(f"{name}{_labels(labels)} {func()}")
+    for (name, labels), histogram in histograms:
+        _header(lines, seen, name, "histogram")
+        for bound, count in zip(histogram["buckets"], histogram["counts"]):
+            lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']:.6f}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, Numeric, ForeignKey, DateTime, Text, func
+from sqlalchemy import Column, BigInteger, Integer, String, Date, Numeric, ForeignKey, DateTime, Text, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB
 from .database import Base
@@ -39,8 +39,8 @@ class EquipmentCategories(Base):
     parent_id = Column(Integer, ForeignKey("equipment_categories.id"))
     created_at = Column(DateTime, server_default=func.now())
 
-    parent = relationship("EquipmentCategories", remote_side=[id])
-    children = relationship("EquipmentCategories")
+    parent = relationship("EquipmentCategories", remote_side=[id], back_populates="children")
+    children = relationship("EquipmentCategories", back_populates="parent")
 
 
 class EquipmentModels(Base):
@@ -137,3 +137,21 @@ class AuditLog(Base):
     old_data = Column(JSONB)
     new_data = Column(JSONB)
     changed_at = Column(DateTime, server_default=func.now())
+
+
+class AuditLogQueue(Base):
+    __tablename__ = "audit_log_queue"
+    id = Column(BigInteger, primary_key=True)
+    table_name = Column(String(50), nullable=False)
+    record_id = Column(Integer, nullable=False)
+    operation = Column(String(10), nullable=False)
+    old_data = Column(JSONB)
+    new_data = Column(JSONB)
+    changed_at = Column(DateTime, server_default=func.now())
+
+
+class AuditSettings(Base):
+    __tablename__ = "audit_settings"
+    table_name = Column(String(50), primary_key=True)
+    level = Column(String(10), nullable=False, default="diff")
+    sample_rate = Column(Numeric(4, 3), nullable=False, default=1)
@@ -0,0 +1,37 @@
+import logging
+import os
+import time
+from sqlalchemy import text
+from . import metrics
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+OVERDUE_SWEEP_ENABLED = os.getenv("OVERDUE_SWEEP_ENABLED", "1") == "1"
+OVERDUE_SWEEP_INTERVAL = float(os.getenv("OVERDUE_SWEEP_INTERVAL", "300"))
+OVERDUE_SWEEP_BATCH = int(os.getenv("OVERDUE_SWEEP_BATCH", "1000"))
+
+metrics.describe("overdue_sweep_rentals_total", "Аренды, переведённые в просроченные")
+metrics.describe("overdue_sweep_duration_seconds", "Длительность прохода по просроченным арендам")
+
+
+def sweep_overdue_rentals(batch_size: int = OVERDUE_SWEEP_BATCH):
+    started = time.perf_counter()
+    marked_total = 0
+    with SessionLocal() as db:
+        while True:
+            marked = db.execute(
+                text("SELECT mark_overdue_rentals(:batch_size)"),
+                {"batch_size": batch_size}).scalar()
+            db.commit()
+            marked_total += marked
+            if marked < batch_size:
+                break
+    elapsed = time.perf_counter() - started
+
+    metrics.inc("overdue_sweep_rentals_total", marked_total)
+    metrics.observe("overdue_sweep_duration_seconds", elapsed)
+    if marked_total:
+        logger.info(
+            f"Переведено в просроченные: {marked_total} аренд за {elapsed:.3f} с")
+    return {"marked": marked_total, "duration_ms": round(elapsed * 1000, 1)}
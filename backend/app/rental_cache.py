@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from starlette.concurrency import run_in_threadpool
+from . import fast_json, metrics, schemas
+
+RENTAL_CACHE_ENABLED = os.getenv("RENTAL_CACHE_ENABLED", "1") == "1"
+RENTAL_CACHE_BACKEND = os.getenv("RENTAL_CACHE_BACKEND", "memory")
+RENTAL_CACHE_SIZE = int(os.getenv("RENTAL_CACHE_SIZE", "10000"))
+RENTAL_CACHE_TTL = float(os.getenv("RENTAL_CACHE_TTL", "60"))
+RENTAL_CACHE_LISTEN = os.getenv("RENTAL_CACHE_LISTEN", "1") == "1"
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+RENTAL_NOTIFY_CHANNEL = "rental_changes"
+
+if RENTAL_CACHE_BACKEND not in ("memory", "redis"):
+    raise ValueError("RENTAL_CACHE_BACKEND должен быть memory или redis")
+
+metrics.describe("rental_cache_requests_total", "Обращения к кэшу аренд")
+metrics.describe("rental_cache_invalidations_total", "Сброс записей кэша аренд")
+metrics.describe("rental_cache_evictions_total", "Вытеснение записей кэша аренд по размеру")
+metrics.describe("rental_cache_hit_ratio", "Доля попаданий в кэш аренд")
+metrics.describe("rental_cache_entries", "Записи в кэше аренд")
+
+
+class MemoryBackend:
+    blocking = False
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, rental_id):
+        with self._lock:
+            item = self._items.get(rental_id)
+            if item is None:
+                return None
+            payload, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._items[rental_id]
+                return None
+            self._items.move_to_end(rental_id)
+            return payload
+
+    def set(self, rental_id, payload):
+        evicted = 0
+        with self._lock:
+            self._items[rental_id] = (payload, time.monotonic() + self.ttl)
+            self._items.move_to_end(rental_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                evicted += 1
+        if evicted:
+            metrics.inc("rental_cache_evictions_total", evicted)
+
+    def delete(self, rental_ids):
+        with self._lock:
+            for rental_id in rental_ids:
+                self._items.pop(rental_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class RedisBackend:
+    prefix = "rental:"
+    blocking = True
+
+    def __init__(self, url, ttl):
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("Для RENTAL_CACHE_BACKEND=redis нужен пакет redis")
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, rental_id):
+        return self._client.get(f"{self.prefix}{rental_id}")
+
+    def set(self, rental_id, payload):
+        self._client.set(f"{self.prefix}{rental_id}", payload,
+                         px=int(self.ttl * 1000))
+
+    def delete(self, rental_ids):
+        if rental_ids:
+            self._client.delete(*(f"{self.prefix}{rental_id}" for rental_id in rental_ids))
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=f"{self.prefix}*", count=1000))
+        for start in range(0, len(keys), 1000):
+            self._client.delete(*keys[start:start + 1000])
+
+
+backend = None
+if RENTAL_CACHE_ENABLED:
+    if RENTAL_CACHE_BACKEND == "redis":
+        backend = RedisBackend(REDIS_URL, RENTAL_CACHE_TTL)
+    else:
+        backend = MemoryBackend(RENTAL_CACHE_SIZE, RENTAL_CACHE_TTL)
+        metrics.register_gauge("rental_cache_entries", lambda: len(backend))
+
+_lock = threading.Lock()
+_hits = 0
+_misses = 0
+# Счётчик сбросов: ответ, прочитанный из БД до сброса, в кэш не попадает
+_generation = 0
+
+
+def _hit_ratio():
+    requests = _hits + _misses
+    return f"{_hits / requests:.4f}" if requests else "0"
+
+
+metrics.register_gauge("rental_cache_hit_ratio", _hit_ratio)
+
+
+def get(rental_id):
+    global _hits, _misses
+    if backend is None:
+        return None, _generation
+    payload = backend.get(rental_id)
+    with _lock:
+        if payload is None:
+            _misses += 1
+        else:
+            _hits += 1
+    metrics.inc("rental_cache_requests_total",
+                result="miss" if payload is None else "hit")
+    return payload, _generation
+
+
+def store(rental_id, rental, generation):
+    if fast_json.FAST_JSON:
+        payload = fast_json.rental_json(rental)
+    else:
+        payload = schemas.RentalResponse.model_validate(rental).model_dump_json()
+    if backend is None:
+        return payload
+    with _lock:
+        current = generation == _generation
+    if current:
+        # Запись в Redis идёт без блокировки. Если сброс успел пройти между
+        # проверкой и записью, запись удаляется
+        backend.set(rental_id, payload)
+        with _lock:
+            current = generation == _generation
+        if not current:
+            backend.delete((rental_id,))
+    return payload
+
+
+def invalidate(*rental_ids, source="app"):
+    global _generation
+    if backend is None:
+        return
+    with _lock:
+        _generation += 1
+    backend.delete(rental_ids)
+    metrics.inc("rental_cache_invalidations_total", len(rental_ids), source=source)
+
+
+def clear():
+    global _generation
+    if backend is None:
+        return
+    with _lock:
+        _generation += 1
+    backend.clear()
+    metrics.inc("rental_cache_invalidations_total", source="clear")
+
+
+async def _call_async(func, *args, **kwargs):
+    # Клиент Redis синхронный: асинхронные маршруты обращаются к нему из
+    # пула потоков, чтобы не останавливать цикл событий
+    if backend is not None and backend.blocking:
+        return await run_in_threadpool(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+async def get_async(rental_id):
+    return await _call_async(get, rental_id)
+
+
+async def store_async(rental_id, rental, generation):
+    return await _call_async(store, rental_id, rental, generation)
+
+
+async def invalidate_async(*rental_ids, source="app"):
+    await _call_async(invalidate, *rental_ids, source=source)
+
+
+def apply_notification(payload):
+    if payload == "*":
+        clear()
+    else:
+        invalidate(*(int(rental_id) for rental_id in payload.split(",")), source="notify")
@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+import os
+from decimal import Decimal
+from sqlalchemy import text
+from .database import engine
+from .fast_json import FAST_JSON, dumps
+from .report_queries import build_report_query
+
+STREAM_BATCH_SIZE = int(os.getenv("REPORT_STREAM_BATCH_SIZE", "1000"))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def export_format(format, accept):
+    if format:
+        if format not in EXPORT_FORMATS and format != "json":
+            raise ValueError(
+                f"Неизвестный формат: {format}. Доступны: json, {', '.join(EXPORT_FORMATS)}")
+        return None if format == "json" else format
+    for name, media_type in EXPORT_FORMATS.items():
+        if accept and media_type.split(";")[0] in accept:
+            return name
+    return None
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def _ndjson_chunk(rows, fields):
+    if FAST_JSON:
+        return b"".join(dumps({field: row[field] for field in fields}) + b"\n" for row in rows)
+    return "".join(
+        json.dumps({field: row[field] for field in fields},
+                   ensure_ascii=False, default=_json_default) + "\n"
+        for row in rows)
+
+
+def _csv_chunk(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[field] for field in fields])
+    return buffer.getvalue()
+
+
+def stream_report(report, source, params=None, fields=None, limit=None, cursor=None,
+                  format="ndjson", batch_size=STREAM_BATCH_SIZE):
+    # Запрос с limit читает limit + 1 строк для курсора страницы,
+    # выгрузка отдаёт ровно limit
+    sql, query_params, selected = build_report_query(
+        report, source, fields, limit, cursor)
+    write_chunk = _csv_chunk if format == "csv" else _ndjson_chunk
+
+    def generate():
+        if format == "csv":
+            yield _csv_chunk([dict(zip(selected, selected))], selected)
+        # Отдельное соединение: сессия запроса закрывается раньше,
+        # чем клиент дочитает ответ
+        with engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True, max_row_buffer=batch_size).execute(
+                text(sql), {**(params or {}), **query_params})
+            remaining = limit
+            for rows in result.mappings().partitions(batch_size):
+                if remaining is not None:
+                    rows = rows[:remaining]
+                    remaining -= len(rows)
+                if rows:
+                    yield write_chunk(rows, selected)
+                if remaining == 0:
+                    break
+
+    return generate()
@@ -0,0 +1,192 @@
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import text
+
+MAX_PAGE_SIZE = 1000
+
+KEY_TYPES = {
+    "int": int,
+    "bigint": int,
+    "date": date.fromisoformat,
+    "timestamptz": datetime.fromisoformat,
+}
+
+
+class ReportQuery:
+    def __init__(self, name, columns, order):
+        self.name = name
+        self.columns = columns
+        self.order = order
+
+    def key_columns(self):
+        return [column for column, _, _ in self.order]
+
+
+REPORTS = {
+    "active": ReportQuery(
+        "active",
+        ("rental_id", "start_date", "end_date", "client_name",
+         "client_phone", "employee_name", "equipment_count"),
+        (("end_date", "date", "asc"), ("rental_id", "int", "asc"))),
+    "overdue": ReportQuery(
+        "overdue",
+        ("rental_id", "end_date", "client_name", "client_phone",
+         "client_email", "days_overdue", "equipment_count"),
+        (("days_overdue", "int", "desc"), ("rental_id", "int", "asc"))),
+    "clients": ReportQuery(
+        "clients",
+        ("client_id", "name", "email", "phone",
+         "total_rentals", "first_rental", "last_rental"),
+        (("total_rentals", "bigint", "desc"), ("client_id", "int", "asc"))),
+    "monthly": ReportQuery(
+        "monthly",
+        ("month", "rental_count", "equipment_count",
+         "total_revenue", "damage_fees"),
+        (("month", "timestamptz", "desc"),)),
+    "ending_soon": ReportQuery(
+        "ending_soon",
+        ("rental_id", "client_name", "client_phone",
+         "end_date", "equipment_count", "employee"),
+        (("end_date", "date", "asc"), ("rental_id", "int", "asc"))),
+    "period": ReportQuery(
+        "period",
+        ("rental_id", "client_name", "start_date", "end_date",
+         "status", "total_cost", "equipment_count"),
+        (("start_date", "date", "asc"), ("rental_id", "int", "asc"))),
+    "late_fees": ReportQuery(
+        "late_fees",
+        ("rental_id", "end_date", "status", "days_overdue",
+         "total_cost", "late_fee", "projected_total"),
+        (("days_overdue", "int", "desc"), ("rental_id", "int", "asc"))),
+    "equipment_utilization": ReportQuery(
+        "equipment_utilization",
+        ("equipment_id", "inventory_number", "model_name", "rentals_count",
+         "booked_days", "utilization", "avg_rental_days", "projected_revenue"),
+        (("booked_days", "int", "desc"), ("equipment_id", "int", "asc"))),
+}
+
+
+def encode_cursor(report, row):
+    values = [row[column] for column in report.key_columns()]
+    payload = {"r": report.name, "k": [
+        v.isoformat() if hasattr(v, "isoformat") else str(v) for v in values]}
+    return base64.urlsafe_b64encode(
+        json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(report, cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        values = payload["k"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Некорректный курсор")
+    if payload.get("r") != report.name or len(values) != len(report.order):
+        raise ValueError("Курсор относится к другому отчёту")
+    try:
+        return [KEY_TYPES[sql_type](value)
+                for value, (_, sql_type, _) in zip(values, report.order)]
+    except (ValueError, TypeError):
+        raise ValueError("Некорректный курсор")
+
+
+def parse_fields(report, fields):
+    if not fields:
+        return list(report.columns)
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in report.columns]
+    if unknown:
+        raise ValueError(
+            f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(report.columns)}")
+    return selected
+
+
+def keyset_condition(report, values):
+    params = {f"k{i}": value for i, value in enumerate(values)}
+    keys = report.key_columns()
+    bounds = [f"CAST(:k{i} AS {sql_type})"
+              for i, (_, sql_type, _) in enumerate(report.order)]
+    directions = {direction for _, _, direction in report.order}
+
+    if len(directions) == 1:
+        op = ">" if directions == {"asc"} else "<"
+        return f"({', '.join(keys)}) {op} ({', '.join(bounds)})", params
+
+    alternatives = []
+    for i, (_, _, direction) in enumerate(report.order):
+        equal = [f"{keys[j]} = {bounds[j]}" for j in range(i)]
+        op = ">" if direction == "asc" else "<"
+        alternatives.append(" AND ".join(equal + [f"{keys[i]} {op} {bounds[i]}"]))
+    # Нестрогая граница по первому ключу позволяет использовать индекс,
+    # а не фильтровать все строки перед курсором
+    first_op = ">=" if report.order[0][2] == "asc" else "<="
+    condition = " OR ".join(f"({alt})" for alt in alternatives)
+    return f"{keys[0]} {first_op} {bounds[0]} AND ({condition})", params
+
+
+def build_report_query(report, source, fields=None, limit=None, cursor=None):
+    selected = parse_fields(report, fields)
+    columns = selected + [
+        key for key in report.key_columns() if key not in selected]
+
+    sql = f"SELECT {', '.join(columns)} FROM {source}"
+    params = {}
+    if cursor:
+        condition, params = keyset_condition(
+            report, decode_cursor(report, cursor))
+        sql += f" WHERE {condition}"
+    sql += " ORDER BY " + ", ".join(
+        f"{column} {direction.upper()}" for column, _, direction in report.order)
+    if limit:
+        sql += " LIMIT :limit"
+        params["limit"] = limit + 1
+    return sql, params, selected
+
+
+def _page(report, rows, selected, limit):
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(report, rows[-1])
+    return [{field: row[field] for field in selected} for row in rows], next_cursor
+
+
+def _page_rows(report, rows, limit):
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(report, rows[-1]._mapping)
+    return rows, next_cursor
+
+
+def fetch_report(db, report, source, params=None, fields=None, limit=None, cursor=None):
+    sql, query_params, selected = build_report_query(
+        report, source, fields, limit, cursor)
+    rows = db.execute(
+        text(sql), {**(params or {}), **query_params}).mappings().fetchall()
+    return _page(report, rows, selected, limit)
+
+
+async def fetch_report_async(db, report, source, params=None, fields=None, limit=None, cursor=None):
+    sql, query_params, selected = build_report_query(
+        report, source, fields, limit, cursor)
+    result = await db.execute(text(sql), {**(params or {}), **query_params})
+    return _page(report, result.mappings().fetchall(), selected, limit)
+
+
+def fetch_report_rows(db, report, source, params=None, fields=None, limit=None, cursor=None):
+    # Строки без преобразования в словари: для fast_json.encode_rows.
+    # Ключевые столбцы курсора, не вошедшие в fields, идут последними
+    # и отбрасываются при кодировании
+    sql, query_params, selected = build_report_query(
+        report, source, fields, limit, cursor)
+    rows = db.execute(text(sql), {**(params or {}), **query_params}).fetchall()
+    return (selected, *_page_rows(report, rows, limit))
+
+
+async def fetch_report_rows_async(db, report, source, params=None, fields=None, limit=None, cursor=None):
+    sql, query_params, selected = build_report_query(
+        report, source, fields, limit, cursor)
+    result = await db.execute(text(sql), {**(params or {}), **query_params})
+    return (selected, *_page_rows(report, result.fetchall(), limit))
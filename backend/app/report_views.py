@@ -0,0 +1,59 @@
+import os
+from datetime import datetime, timezone
+from sqlalchemy import text
+from .database import SessionLocal
+
+REPORT_REFRESH_ENABLED = os.getenv("REPORT_REFRESH_ENABLED", "1") == "1"
+REPORT_REFRESH_INTERVAL = float(os.getenv("REPORT_REFRESH_INTERVAL", "60"))
+
+MATERIALIZED_VIEWS = {
+    "v_active_rentals": "mv_active_rentals",
+    "v_overdue_rentals": "mv_overdue_rentals",
+    "v_client_stats": "mv_client_stats",
+    "v_monthly_revenue": "mv_monthly_revenue",
+}
+
+
+def refresh_report_views():
+    with SessionLocal() as db:
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        result = db.execute(
+            text("SELECT * FROM refresh_report_views(true)")).fetchall()
+        db.commit()
+    return result
+
+
+REFRESHED_AT_SQL = "SELECT refreshed_at FROM report_refresh_log WHERE view_name = :view_name"
+
+
+def _set_source_headers(response, refreshed_at):
+    response.headers["X-Report-Source"] = "materialized"
+    if refreshed_at is not None:
+        staleness = (datetime.now(timezone.utc) - refreshed_at).total_seconds()
+        response.headers["X-Report-Refreshed-At"] = refreshed_at.isoformat()
+        response.headers["X-Report-Staleness-Seconds"] = f"{max(staleness, 0):.0f}"
+    response.headers["X-Report-Refresh-Interval-Seconds"] = f"{REPORT_REFRESH_INTERVAL:.0f}"
+
+
+def report_source(db, view, fresh, response):
+    if fresh:
+        response.headers["X-Report-Source"] = "live"
+        return view
+
+    materialized = MATERIALIZED_VIEWS[view]
+    refreshed_at = db.execute(
+        text(REFRESHED_AT_SQL), {"view_name": materialized}).scalar()
+    _set_source_headers(response, refreshed_at)
+    return materialized
+
+
+async def report_source_async(db, view, fresh, response):
+    if fresh:
+        response.headers["X-Report-Source"] = "live"
+        return view
+
+    materialized = MATERIALIZED_VIEWS[view]
+    refreshed_at = (await db.execute(
+        text(REFRESHED_AT_SQL), {"view_name": materialized})).scalar()
+    _set_source_headers(response, refreshed_at)
+    return materialized
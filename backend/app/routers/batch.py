@@ -1,24 +1,54 @@
-from fastapi import APIRouter, HTTPException
-import subprocess
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from .. import jobs, overdue, schemas
+from ..database import get_db
 
 router = APIRouter(prefix="/batch", tags=["batch load"])
 
 
-@router.post("/load_data")
-def batch_load():
+@router.post("/load_data", response_model=schemas.BatchJobResponse,
+             status_code=status.HTTP_202_ACCEPTED)
+def batch_load(response: Response,
+               request: Optional[schemas.LoadJobRequest] = Body(None),
+               idempotency_key: Optional[str] = Header(None, max_length=100),
+               db: Session = Depends(get_db)):
+    params = (request or schemas.LoadJobRequest()).model_dump(exclude_none=True)
     try:
-        result = subprocess.run(
-            ["python", "scripts/data_load.py"],
-            cwd=".",
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
-        if result.returncode == 0:
-            return {"status": "success", "message": "Данные загружены"}
-        else:
-            return {"status": "error", "message": "Ошибка при загрузке"}
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="Таймаут загрузки данных")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        job, created = jobs.submit_load_job(db, params, idempotency_key)
+    except jobs.JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not created:
+        response.status_code = status.HTTP_200_OK
+    response.headers["Location"] = f"/batch/jobs/{job['id']}"
+    return jobs.job_status(job)
+
+
+@router.get("/jobs", response_model=List[schemas.BatchJobResponse])
+def list_jobs(limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    return [jobs.job_status(job) for job in jobs.list_jobs(db, limit)]
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.BatchJobResponse)
+def read_job(job_id: int, db: Session = Depends(get_db)):
+    job = jobs.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return jobs.job_status(job)
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=schemas.BatchJobResponse,
+             status_code=status.HTTP_202_ACCEPTED)
+def cancel_job(job_id: int, db: Session = Depends(get_db)):
+    try:
+        job = jobs.cancel_job(db, job_id)
+    except jobs.JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return jobs.job_status(job)
+
+
+@router.post("/overdue_sweep")
+def overdue_sweep():
+    return overdue.sweep_overdue_rentals()
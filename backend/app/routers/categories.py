@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from datetime import date
+from typing import List, Optional
+from .. import schemas
+from ..category_tree import category_tree
+from ..database import get_db
+from .equipment import check_period
+
+router = APIRouter(prefix="/categories", tags=["CRUD SQL"])
+
+
+def check_category(tree, category_id):
+    if category_id not in tree:
+        raise HTTPException(status_code=404, detail="Категория не найдена")
+
+
+@router.get("/", response_model=List[schemas.CategoryNode])
+def categories(db: Session = Depends(get_db)):
+    return category_tree.get(db).nodes()
+
+
+@router.get("/{category_id}", response_model=schemas.CategoryNode)
+def category(category_id: int, db: Session = Depends(get_db)):
+    tree = category_tree.get(db)
+    check_category(tree, category_id)
+    return tree.node(category_id)
+
+
+@router.get("/{category_id}/subtree", response_model=List[schemas.CategorySubtreeItem])
+def category_subtree(category_id: int, db: Session = Depends(get_db)):
+    tree = category_tree.get(db)
+    check_category(tree, category_id)
+    return tree.subtree(category_id)
+
+
+@router.get("/{category_id}/stats", response_model=List[schemas.CategoryStats])
+def category_stats(category_id: int,
+                   start_date: Optional[date] = None,
+                   end_date: Optional[date] = None,
+                   db: Session = Depends(get_db)):
+    if start_date is not None and end_date is not None:
+        check_period(start_date, end_date)
+    check_category(category_tree.get(db), category_id)
+    result = db.execute(
+        text("SELECT * FROM get_category_subtree_stats(:category_id, :start_date, :end_date)"),
+        {"category_id": category_id, "start_date": start_date, "end_date": end_date})
+    return result.mappings().fetchall()
@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from datetime import date
+from typing import List, Optional
+from .. import schemas
+from ..database import get_db
+from ..equipment_search import SEARCH_MAX_LENGTH, SEARCH_MIN_LENGTH, search_equipment
+
+router = APIRouter(prefix="/equipment", tags=["CRUD SQL"])
+
+
+def check_period(start_date, end_date):
+    if end_date < start_date:
+        raise HTTPException(
+            status_code=400, detail="Дата окончания не может быть раньше даты начала")
+
+
+@router.get("/availability", response_model=List[schemas.AvailableEquipment])
+def available_equipment(start_date: date, end_date: date,
+                        category_id: Optional[int] = None,
+                        limit: int = Query(100, ge=1, le=1000),
+                        db: Session = Depends(get_db)):
+    check_period(start_date, end_date)
+    result = db.execute(
+        text("SELECT * FROM get_available_equipment(:start_date, :end_date, :category_id) LIMIT :limit"),
+        {"start_date": start_date, "end_date": end_date,
+         "category_id": category_id, "limit": limit})
+    return result.mappings().fetchall()
+
+
+@router.get("/search", response_model=List[schemas.EquipmentSearchResult])
+def equipment_search(response: Response,
+                     q: str = Query(..., min_length=SEARCH_MIN_LENGTH, max_length=SEARCH_MAX_LENGTH,
+                                    description="Модель, бренд, описание, категория или инвентарный номер"),
+                     status: Optional[str] = None,
+                     category_id: Optional[int] = None,
+                     limit: int = Query(20, ge=1, le=100),
+                     offset: int = Query(0, ge=0),
+                     db: Session = Depends(get_db)):
+    try:
+        rows, next_offset = search_equipment(db, q, status, category_id, limit, offset)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    if next_offset is not None:
+        response.headers["X-Next-Offset"] = str(next_offset)
+    return rows
+
+
+@router.get("/{equipment_id}/availability", response_model=schemas.EquipmentAvailability)
+def equipment_availability(equipment_id: int, start_date: date, end_date: date,
+                           db: Session = Depends(get_db)):
+    check_period(start_date, end_date)
+    params = {"equipment_id": equipment_id,
+              "start_date": start_date, "end_date": end_date}
+    if not db.execute(text("SELECT 1 FROM equipment WHERE id = :equipment_id"), params).scalar():
+        raise HTTPException(status_code=404, detail="Оборудование не найдено")
+
+    available = db.execute(
+        text("SELECT is_equipment_available(:equipment_id, :start_date, :end_date)"), params).scalar()
+    bookings = db.execute(
+        text("SELECT * FROM get_equipment_bookings(:equipment_id, :start_date, :end_date)"),
+        params).mappings().fetchall()
+    return {**params, "available": available, "bookings": bookings}
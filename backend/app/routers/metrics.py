@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from .. import metrics, sql_trace
+
+router = APIRouter(tags=["metrics"])
+debug_router = APIRouter(prefix="/debug", tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@debug_router.get("/sql", include_in_schema=False)
+def read_sql_stats():
+    return sql_trace.route_stats()
+
+
+@debug_router.delete("/sql", status_code=204, include_in_schema=False)
+def reset_sql_stats():
+    sql_trace.reset()
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 from datetime import date
 from typing import List, Optional
-from .. import crud, schemas, database
+from .. import crud, fast_json, rental_cache, schemas, database
 
 router = APIRouter(prefix="/rentals", tags=["CRUD ORM"])
 
@@ -10,30 +10,56 @@ router = APIRouter(prefix="/rentals", tags=["CRUD ORM"])
 @router.post("/", response_model=schemas.RentalResponse)
 def create_rental(rental: schemas.RentalCreate, db: Session = Depends(database.get_db)):
     try:
-        return crud.create_rental(db=db, rental=rental)
+        db_rental = crud.create_rental(db=db, rental=rental)
+    except crud.EquipmentUnavailableError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return fast_json.rental_response(db_rental) if fast_json.FAST_JSON else db_rental
+
+
+@router.post("/bulk", response_model=schemas.BulkRentalResponse)
+def create_rentals_bulk(rentals: List[schemas.RentalCreate], response: Response,
+                        mode: str = Query("all_or_nothing", description="all_or_nothing или best_effort"),
+                        db: Session = Depends(database.get_db)):
+    try:
+        results = crud.create_rentals_bulk(db=db, rentals=rentals, mode=mode)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    return bulk_response(results, mode, response)
+
+
+def bulk_response(results, mode, response):
+    created = sum(1 for result in results if result["rental"] is not None)
+    if results and not created:
+        response.status_code = 400
+    return {"mode": mode, "created": created,
+            "failed": len(results) - created, "results": results}
 
 
 @router.get("/{rental_id}", response_model=schemas.RentalResponse)
 def read_rental(rental_id: int, db: Session = Depends(database.get_db)):
-    try:
-        rental = crud.get_rental(db=db, rental_id=rental_id)
+    payload, generation = rental_cache.get(rental_id)
+    if payload is None:
+        try:
+            rental = crud.get_rental(db=db, rental_id=rental_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
         if not rental:
             raise HTTPException(status_code=404, detail="Аренда не найдена")
-        return rental
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        payload = rental_cache.store(rental_id, rental, generation)
+    return Response(content=payload, media_type="application/json")
 
 
 @router.put("/{rental_id}/return", response_model=schemas.RentalResponse)
 def return_rental(rental_id: int, return_date: date, db: Session = Depends(database.get_db)):
     try:
-        return crud.return_rental(db=db, rental_id=rental_id, return_date=return_date)
+        rental = crud.return_rental(db=db, rental_id=rental_id, return_date=return_date)
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return fast_json.rental_response(rental) if fast_json.FAST_JSON else rental
 
 
 @router.delete("/{rental_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date
+from typing import List
+from .. import crud, crud_async, fast_json, rental_cache, schemas, database
+from .rentals import bulk_response
+
+router = APIRouter(prefix="/rentals", tags=["CRUD ORM"])
+
+
+@router.post("/", response_model=schemas.RentalResponse)
+async def create_rental(rental: schemas.RentalCreate, db: AsyncSession = Depends(database.get_async_db)):
+    try:
+        db_rental = await crud_async.create_rental(db=db, rental=rental)
+    except crud.EquipmentUnavailableError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return fast_json.rental_response(db_rental) if fast_json.FAST_JSON else db_rental
+
+
+@router.post("/bulk", response_model=schemas.BulkRentalResponse)
+async def create_rentals_bulk(rentals: List[schemas.RentalCreate], response: Response,
+                              mode: str = Query("all_or_nothing", description="all_or_nothing или best_effort"),
+                              db: AsyncSession = Depends(database.get_async_db)):
+    try:
+        results = await db.run_sync(
+            lambda session: crud.create_rentals_bulk(session, rentals, mode))
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    return bulk_response(results, mode, response)
+
+
+@router.get("/{rental_id}", response_model=schemas.RentalResponse)
+async def read_rental(rental_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    payload, generation = await rental_cache.get_async(rental_id)
+    if payload is None:
+        try:
+            rental = await crud_async.get_rental(db=db, rental_id=rental_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if not rental:
+            raise HTTPException(status_code=404, detail="Аренда не найдена")
+        payload = await rental_cache.store_async(rental_id, rental, generation)
+    return Response(content=payload, media_type="application/json")
+
+
+@router.put("/{rental_id}/return", response_model=schemas.RentalResponse)
+async def return_rental(rental_id: int, return_date: date, db: AsyncSession = Depends(database.get_async_db)):
+    try:
+        rental = await crud_async.return_rental(db=db, rental_id=rental_id, return_date=return_date)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return fast_json.rental_response(rental) if fast_json.FAST_JSON else rental
+
+
+@router.delete("/{rental_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_rental(rental_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    try:
+        await crud_async.cancel_rental(db=db, rental_id=rental_id)
+        return None
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,48 +1,153 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from datetime import date
+from typing import List, Optional
 from ..database import get_db
+from ..report_views import report_source
+from ..fast_json import FAST_JSON, encode_rows
+from ..report_queries import REPORTS, MAX_PAGE_SIZE, fetch_report, fetch_report_rows
+from ..report_export import EXPORT_FORMATS, export_format, stream_report
+from .equipment import check_period
 
 router = APIRouter(prefix="/reports", tags=["CRUD SQL"])
 
 
-@router.get("/active")
-def active_rentals(db: Session = Depends(get_db)):
-    result = db.execute(
-        text("SELECT * FROM v_active_rentals")).mappings().fetchall()
-    return [dict(row) for row in result]
+LATE_FEES_SOURCE = "calculate_late_fees(CAST(:rental_ids AS int[]), :daily_fee, :fixed_fee)"
+UTILIZATION_SOURCE = "get_equipment_utilization(:start_date, :end_date, CAST(:equipment_ids AS int[]))"
 
 
-@router.get("/overdue")
-def overdue_rentals(db: Session = Depends(get_db)):
-    result = db.execute(
-        text("SELECT * FROM v_overdue_rentals")).mappings().fetchall()
-    return [dict(row) for row in result]
+class ReportPage:
+    def __init__(self,
+                 limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                 cursor: Optional[str] = None,
+                 fields: Optional[str] = Query(
+                     None, description="Список полей через запятую"),
+                 format: Optional[str] = Query(
+                     None, description="json, ndjson или csv"),
+                 accept: Optional[str] = Header(None)):
+        self.limit = limit
+        self.cursor = cursor
+        self.fields = fields
+        self.format = format
+        self.accept = accept
 
 
-@router.get("/clients")
-def client_stats(db: Session = Depends(get_db)):
-    result = db.execute(text("SELECT * FROM v_client_stats")
-                        ).mappings().fetchall()
-    return [dict(row) for row in result]
+class ReportQuery:
+    # Отчёт и его источник: представление, которое по умолчанию читается из
+    # материализованной копии (view), или функция с параметрами (source)
+    def __init__(self, report, source=None, params=None, view=None, fresh=False):
+        self.report = REPORTS[report]
+        self.source = source
+        self.params = params
+        self.view = view
+        self.fresh = fresh
 
 
-@router.get("/monthly")
-def monthly_revenue(db: Session = Depends(get_db)):
-    result = db.execute(
-        text("SELECT * FROM v_monthly_revenue")).mappings().fetchall()
-    return [dict(row) for row in result]
+# Параметры отчётов объявлены один раз для синхронного и асинхронного роутеров
 
+def active_query(fresh: bool = False):
+    return ReportQuery("active", view="v_active_rentals", fresh=fresh)
 
-@router.get("/ending_soon")
-def ending_soon(days: int = 2, db: Session = Depends(get_db)):
-    result = db.execute(
-        text("SELECT * FROM get_rentals_ending_soon(:days)").bindparams(days=days)).mappings().fetchall()
-    return [dict(row) for row in result]
 
+def overdue_query(fresh: bool = False):
+    return ReportQuery("overdue", view="v_overdue_rentals", fresh=fresh)
 
-@router.get("/period")
-def period_report(start_date: str, end_date: str, db: Session = Depends(get_db)):
-    result = db.execute(text(
-        "SELECT * FROM get_rentals_period_report(:start_date, :end_date)").bindparams(start_date=start_date, end_date=end_date)).mappings().fetchall()
-    return [dict(row) for row in result]
+
+def clients_query(fresh: bool = False):
+    return ReportQuery("clients", view="v_client_stats", fresh=fresh)
+
+
+def monthly_query(start_date: Optional[date] = None, end_date: Optional[date] = None,
+                  fresh: bool = False):
+    if start_date is None and end_date is None:
+        return ReportQuery("monthly", view="v_monthly_revenue", fresh=fresh)
+    return ReportQuery("monthly", "get_monthly_revenue(:start_date, :end_date)",
+                       {"start_date": start_date or date.min, "end_date": end_date or date.max})
+
+
+def ending_soon_query(days: int = 2):
+    return ReportQuery("ending_soon", "get_rentals_ending_soon(:days)", {"days": days})
+
+
+def period_query(start_date: date, end_date: date):
+    return ReportQuery("period", "get_rentals_period_report(:start_date, :end_date)",
+                       {"start_date": start_date, "end_date": end_date})
+
+
+def late_fees_query(rental_ids: Optional[List[int]] = Query(None),
+                    daily_fee: float = Query(500.0, ge=0), fixed_fee: float = Query(1000.0, ge=0)):
+    return ReportQuery("late_fees", LATE_FEES_SOURCE,
+                       {"rental_ids": rental_ids, "daily_fee": daily_fee, "fixed_fee": fixed_fee})
+
+
+def equipment_utilization_query(start_date: Optional[date] = None, end_date: Optional[date] = None,
+                                equipment_ids: Optional[List[int]] = Query(None)):
+    if start_date is not None and end_date is not None:
+        check_period(start_date, end_date)
+    return ReportQuery("equipment_utilization", UTILIZATION_SOURCE,
+                       {"start_date": start_date, "end_date": end_date, "equipment_ids": equipment_ids})
+
+
+REPORT_ENDPOINTS = {
+    "/active": active_query,
+    "/overdue": overdue_query,
+    "/clients": clients_query,
+    "/monthly": monthly_query,
+    "/ending_soon": ending_soon_query,
+    "/period": period_query,
+    "/late_fees": late_fees_query,
+    "/equipment_utilization": equipment_utilization_query,
+}
+
+
+def export_response(query, source, page, response):
+    format = export_format(page.format, page.accept)
+    if not format:
+        return None
+    return StreamingResponse(
+        stream_report(query.report, source, query.params, page.fields,
+                      page.limit, page.cursor, format),
+        media_type=EXPORT_FORMATS[format], headers=dict(response.headers))
+
+
+def page_response(result, next_cursor, response):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if FAST_JSON:
+        fields, rows = result
+        return Response(content=encode_rows(fields, rows), media_type="application/json",
+                        headers=dict(response.headers))
+    return result
+
+
+def report_page(db, query, page, response):
+    source = report_source(db, query.view, query.fresh, response) if query.view else query.source
+    try:
+        export = export_response(query, source, page, response)
+        if export is not None:
+            return export
+        if FAST_JSON:
+            fields, rows, next_cursor = fetch_report_rows(
+                db, query.report, source, query.params,
+                fields=page.fields, limit=page.limit, cursor=page.cursor)
+            result = (fields, rows)
+        else:
+            result, next_cursor = fetch_report(
+                db, query.report, source, query.params,
+                fields=page.fields, limit=page.limit, cursor=page.cursor)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    return page_response(result, next_cursor, response)
+
+
+def add_report_endpoint(path, query_dependency):
+    def endpoint(response: Response, query: ReportQuery = Depends(query_dependency),
+                 page: ReportPage = Depends(), db: Session = Depends(get_db)):
+        return report_page(db, query, page, response)
+
+    router.add_api_route(path, endpoint, methods=["GET"], name=query_dependency.__name__)
+
+
+for path, query_dependency in REPORT_ENDPOINTS.items():
+    add_report_endpoint(path, query_dependency)
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..report_views import report_source_async
+from ..fast_json import FAST_JSON
+from ..report_queries import fetch_report_async, fetch_report_rows_async
+from .reports import REPORT_ENDPOINTS, ReportPage, ReportQuery, export_response, page_response
+
+router = APIRouter(prefix="/reports", tags=["CRUD SQL"])
+
+
+async def report_page(db, query, page, response):
+    if query.view:
+        source = await report_source_async(db, query.view, query.fresh, response)
+    else:
+        source = query.source
+    try:
+        # Выгрузка идёт через синхронный серверный курсор в пуле потоков
+        export = export_response(query, source, page, response)
+        if export is not None:
+            return export
+        if FAST_JSON:
+            fields, rows, next_cursor = await fetch_report_rows_async(
+                db, query.report, source, query.params,
+                fields=page.fields, limit=page.limit, cursor=page.cursor)
+            result = (fields, rows)
+        else:
+            result, next_cursor = await fetch_report_async(
+                db, query.report, source, query.params,
+                fields=page.fields, limit=page.limit, cursor=page.cursor)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    return page_response(result, next_cursor, response)
+
+
+def add_report_endpoint(path, query_dependency):
+    async def endpoint(response: Response, query: ReportQuery = Depends(query_dependency),
+                       page: ReportPage = Depends(), db: AsyncSession = Depends(get_async_db)):
+        return await report_page(db, query, page, response)
+
+    router.add_api_route(path, endpoint, methods=["GET"], name=query_dependency.__name__)
+
+
+for path, query_dependency in REPORT_ENDPOINTS.items():
+    add_report_endpoint(path, query_dependency)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
-from datetime import date
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from datetime import date, datetime
+from typing import Dict, List, Literal, Optional
 
 
 class RentalItemCreate(BaseModel):
@@ -39,3 +39,112 @@ class RentalResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class BulkRentalResult(BaseModel):
+    index: int
+    rental: Optional[RentalResponse] = None
+    error: Optional[str] = None
+
+
+class BulkRentalResponse(BaseModel):
+    mode: str
+    created: int
+    failed: int
+    results: List[BulkRentalResult]
+
+
+class AvailableEquipment(BaseModel):
+    equipment_id: int
+    inventory_number: str
+    category_id: int
+    model_name: str
+    rental_price_per_day: float
+
+
+class EquipmentSearchResult(BaseModel):
+    equipment_id: int
+    inventory_number: str
+    status: str
+    category_id: int
+    category_name: str
+    model_id: int
+    model_name: str
+    brand: Optional[str] = None
+    rental_price_per_day: float
+    rank: float
+
+
+class EquipmentBooking(BaseModel):
+    rental_id: int
+    start_date: date
+    # Пусто, пока просроченная аренда не возвращена
+    end_date: Optional[date] = None
+
+
+class EquipmentAvailability(BaseModel):
+    equipment_id: int
+    start_date: date
+    end_date: date
+    available: bool
+    bookings: List[EquipmentBooking]
+
+
+class CategoryNode(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    parent_id: Optional[int] = None
+    children: List["CategoryNode"] = []
+
+
+class CategorySubtreeItem(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    parent_id: Optional[int] = None
+    depth: int
+
+
+class CategoryStats(BaseModel):
+    category_id: int
+    name: str
+    parent_id: Optional[int] = None
+    depth: int
+    equipment_count: int
+    rented_items: int
+    revenue: float
+
+
+class LoadJobRequest(BaseModel):
+    mode: Literal["copy", "executemany"] = "copy"
+    chunk_size: int = Field(5000, ge=1)
+    workers: int = Field(1, ge=1, le=32)
+    seed: Optional[int] = None
+    fast: bool = False
+    incremental: bool = False
+    append: bool = False
+    users_clients: Optional[int] = Field(None, ge=1)
+    users_sellers: Optional[int] = Field(None, ge=1)
+    users_admins: Optional[int] = Field(None, ge=0)
+    equipment: Optional[int] = Field(None, ge=1)
+    rentals: Optional[int] = Field(None, ge=0)
+    payments: Optional[int] = Field(None, ge=0)
+
+
+class BatchJobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    params: dict
+    step: Optional[str] = None
+    planned: Dict[str, int]
+    loaded: Dict[str, int]
+    progress: Optional[float] = None
+    rows_per_second: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    cancel_requested: bool
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
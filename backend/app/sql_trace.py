@@ -0,0 +1,183 @@
+import logging
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from . import metrics
+
+SQL_TRACE_ENABLED = os.getenv("SQL_TRACE_ENABLED", "0") == "1"
+# /debug/sql показывает текст запросов и сбрасывает статистику, поэтому
+# подключается только явно
+SQL_DEBUG_ENABLED = SQL_TRACE_ENABLED and os.getenv("SQL_DEBUG_ENABLED", "0") == "1"
+SQL_SLOW_REQUEST_MS = float(os.getenv("SQL_SLOW_REQUEST_MS", "500"))
+SQL_SLOW_STATEMENTS = int(os.getenv("SQL_SLOW_STATEMENTS", "5"))
+SQL_SERVER_TIMING = os.getenv("SQL_SERVER_TIMING", "1") == "1"
+
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("http_request_duration_seconds", "Длительность HTTP-запроса")
+metrics.describe("http_request_db_seconds", "Время SQL-запросов за HTTP-запрос")
+metrics.describe("http_request_db_statements", "Число SQL-запросов за HTTP-запрос")
+metrics.describe("http_slow_requests_total", "HTTP-запросы дольше SQL_SLOW_REQUEST_MS")
+
+_NORMALIZE = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+"), "?"),
+    (re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:::\w+)?(?:\s*,\s*\?(?:::\w+)?)*\s*\)"), "(...)"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+def normalize_sql(statement):
+    for pattern, replacement in _NORMALIZE:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+class RequestTrace:
+    __slots__ = ("statements", "db_time", "slowest")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        # Самые долгие выражения запроса: (длительность, текст)
+        self.slowest = []
+
+    def record(self, statement, elapsed):
+        self.statements += 1
+        self.db_time += elapsed
+        if len(self.slowest) < SQL_SLOW_STATEMENTS:
+            self.slowest.append((elapsed, statement))
+        elif elapsed > self.slowest[-1][0]:
+            self.slowest[-1] = (elapsed, statement)
+        else:
+            return
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+
+
+_current = ContextVar("sql_trace", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("sql_trace_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current.get()
+    if trace is not None:
+        started = conn.info["sql_trace_started"].pop()
+        trace.record(statement, time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    if _current.get() is not None and exception_context.connection is not None:
+        started = exception_context.connection.info.get("sql_trace_started")
+        if started:
+            started.pop()
+
+
+def instrument(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+_lock = threading.Lock()
+_routes = {}
+
+
+def _route_stats(key):
+    stats = _routes.get(key)
+    if stats is None:
+        stats = _routes[key] = {
+            "requests": 0, "slow_requests": 0, "statements": 0, "db_seconds": 0.0,
+            "duration_seconds": 0.0, "max_db_seconds": 0.0, "max_statements": 0,
+            "slowest_statement": None, "slowest_statement_seconds": 0.0}
+    return stats
+
+
+def record_request(method, route, duration, trace):
+    slow = duration * 1000 >= SQL_SLOW_REQUEST_MS
+    metrics.observe("http_request_duration_seconds", duration, method=method, route=route)
+    metrics.observe("http_request_db_seconds", trace.db_time, method=method, route=route)
+    metrics.observe("http_request_db_statements", trace.statements,
+                    buckets=STATEMENT_BUCKETS, method=method, route=route)
+    with _lock:
+        stats = _route_stats(f"{method} {route}")
+        stats["requests"] += 1
+        stats["slow_requests"] += slow
+        stats["statements"] += trace.statements
+        stats["db_seconds"] += trace.db_time
+        stats["duration_seconds"] += duration
+        stats["max_db_seconds"] = max(stats["max_db_seconds"], trace.db_time)
+        stats["max_statements"] = max(stats["max_statements"], trace.statements)
+        if trace.slowest and trace.slowest[0][0] > stats["slowest_statement_seconds"]:
+            stats["slowest_statement_seconds"] = trace.slowest[0][0]
+            stats["slowest_statement"] = normalize_sql(trace.slowest[0][1])
+
+    if slow:
+        metrics.inc("http_slow_requests_total", method=method, route=route)
+        lines = "".join(f"\n  {elapsed * 1000:8.1f} мс  {normalize_sql(statement)}"
+                        for elapsed, statement in trace.slowest)
+        logger.warning(
+            f"Медленный запрос {method} {route}: {duration * 1000:.0f} мс, "
+            f"SQL: {trace.statements} выражений за {trace.db_time * 1000:.1f} мс{lines}")
+
+
+def route_stats():
+    with _lock:
+        routes = {key: dict(stats) for key, stats in _routes.items()}
+    for stats in routes.values():
+        requests = stats["requests"]
+        stats["avg_statements"] = stats["statements"] / requests
+        stats["avg_db_ms"] = stats["db_seconds"] / requests * 1000
+        stats["avg_duration_ms"] = stats["duration_seconds"] / requests * 1000
+    return dict(sorted(routes.items(), key=lambda item: item[1]["db_seconds"], reverse=True))
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+
+
+def server_timing(trace, duration):
+    slowest = trace.slowest[0][0] if trace.slowest else 0.0
+    return (f'db;dur={trace.db_time * 1000:.1f};desc="SQL: {trace.statements}", '
+            f"db-max;dur={slowest * 1000:.1f}, total;dur={duration * 1000:.1f}").encode()
+
+
+class SQLTraceMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current.set(trace)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and SQL_SERVER_TIMING:
+                duration = time.perf_counter() - started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(trace, duration)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            # Несопоставленные пути не группируются, чтобы не плодить метки
+            record_request(scope["method"], route.path if route is not None else "<unmatched>",
+                           time.perf_counter() - started, trace)
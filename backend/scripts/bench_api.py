@@ -0,0 +1,477 @@
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime, timedelta
+
+import httpx
+import psycopg2
+from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+
+from bench_db_mode import start_server
+from data_load import DEFAULT_SCALE, DatabaseFiller
+from db_utils import db_config_from_url
+
+
+INIT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "database", "init")
+BENCH_DB = "cp_bench"
+PG_PORT = 5499
+API_PORT = 8200
+CONCURRENCY = (10, 50)
+DURATION = 20.0
+WARMUP = 3.0
+SEED = 1
+THRESHOLD = 0.10
+MIN_COUNT = 20
+
+# Доли операций в нагрузке; отчёты делят свою долю поровну
+WEIGHTS = {
+    "rentals.read": 50,
+    "rentals.create": 10,
+    "rentals.return": 5,
+    "rentals.cancel": 5,
+    "reports": 30,
+}
+# Параметры отчётов, без которых они не отвечают или отвечают пустой страницей
+REPORT_QUERIES = {
+    "/reports/period": {"start_date": "{year_ago}", "end_date": "{today}"},
+    "/reports/equipment_utilization": {"start_date": "{year_ago}", "end_date": "{today}"},
+    "/reports/ending_soon": {"days": 7},
+}
+REPORT_LIMIT = 50
+BOOKING_DAYS = 7
+BOOKING_STEP = 10
+
+
+@contextmanager
+def local_postgres(pg_bin, port):
+    # Отдельный кластер во временном каталоге, удаляется после прогона
+    with tempfile.TemporaryDirectory(prefix="bench-pg-") as data_dir:
+        subprocess.run(
+            [os.path.join(pg_bin, "initdb"), "-D", data_dir, "-U", "postgres",
+             "--auth=trust", "--encoding=UTF8", "--locale=C"],
+            check=True, stdout=subprocess.DEVNULL)
+        pg_ctl = os.path.join(pg_bin, "pg_ctl")
+        subprocess.run(
+            [pg_ctl, "-D", data_dir, "-l", os.path.join(data_dir, "server.log"), "-w",
+             "-o", f"-p {port} -k {data_dir} -c listen_addresses=127.0.0.1", "start"],
+            check=True, stdout=subprocess.DEVNULL)
+        try:
+            yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+        finally:
+            subprocess.run([pg_ctl, "-D", data_dir, "-m", "fast", "-w", "stop"],
+                           stdout=subprocess.DEVNULL)
+
+
+def database_url(server_url, name):
+    return make_url(server_url).set(database=name).render_as_string(hide_password=False)
+
+
+def create_database(server_url, name):
+    conn = psycopg2.connect(**db_config_from_url(server_url))
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+        cur.execute(f'CREATE DATABASE "{name}"')
+    conn.close()
+
+    url = database_url(server_url, name)
+    conn = psycopg2.connect(**db_config_from_url(url))
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        for path in sorted(glob.glob(os.path.join(INIT_DIR, "*.sql"))):
+            with open(path, encoding="utf-8") as f:
+                cur.execute(f.read())
+    conn.close()
+    return url
+
+
+def seed_database(url, scale, seed, workers):
+    filler = DatabaseFiller(db_config_from_url(url), scale=scale, seed=seed,
+                            workers=workers, fast=True)
+    filler.connect()
+    try:
+        filler.fill_all()
+    finally:
+        filler.close()
+
+    conn = psycopg2.connect(**db_config_from_url(url))
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM refresh_report_views(false)")
+        cur.execute("ANALYZE")
+    conn.close()
+
+
+def load_fixtures(url):
+    conn = psycopg2.connect(**db_config_from_url(url))
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM users WHERE role = 'Клиент' ORDER BY id")
+        clients = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT id FROM users WHERE role = 'Продавец' ORDER BY id")
+        sellers = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT id FROM equipment WHERE status <> 'Списано' ORDER BY id")
+        equipment = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT coalesce(max(id), 0), max(end_date) FROM rentals")
+        max_rental_id, max_end_date = cur.fetchone()
+        cur.execute("SELECT version()")
+        version = cur.fetchone()[0]
+    conn.close()
+    if not (clients and sellers and equipment and max_rental_id):
+        raise RuntimeError("В базе нет клиентов, продавцов, оборудования или аренд")
+    return {"clients": clients, "sellers": sellers, "equipment": equipment,
+            "max_rental_id": max_rental_id, "postgres": version,
+            # Новые аренды бронируются после всех существующих, поэтому
+            # повторный прогон на той же базе не упирается в занятость
+            "booking_start": max(max_end_date, date.today()) + timedelta(days=1)}
+
+
+def report_paths(port):
+    spec = httpx.get(f"http://127.0.0.1:{port}/openapi.json", timeout=10.0).json()
+    today = date.today()
+    values = {"today": today.isoformat(),
+              "year_ago": (today - timedelta(days=365)).isoformat()}
+    paths = {}
+    for path, methods in sorted(spec["paths"].items()):
+        if not path.startswith("/reports/") or "get" not in methods or "{" in path:
+            continue
+        query = {"limit": REPORT_LIMIT}
+        for key, value in REPORT_QUERIES.get(path, {}).items():
+            query[key] = value.format(**values) if isinstance(value, str) else value
+        paths[f"reports.{path.rsplit('/', 1)[-1]}"] = (path, query)
+    return paths
+
+
+class Workload:
+    def __init__(self, fixtures, reports, weights):
+        self.fixtures = fixtures
+        self.reports = reports
+        self.operations = list(weights)
+        self.weights = list(weights.values())
+        self.created = deque()
+        self.next_slot = 0
+
+    def booking(self):
+        # Каждая новая аренда получает своё окно на своей единице
+        # оборудования: конфликты бронирования не попадают в ошибки
+        equipment = self.fixtures["equipment"]
+        slot = self.next_slot
+        self.next_slot += 1
+        start_date = self.fixtures["booking_start"] + timedelta(
+            days=slot // len(equipment) * BOOKING_STEP)
+        return equipment[slot % len(equipment)], start_date
+
+    async def create(self, http):
+        equipment_id, start_date = self.booking()
+        response = await http.post("/rentals/", json={
+            "user_id": random.choice(self.fixtures["clients"]),
+            "employee_id": random.choice(self.fixtures["sellers"]),
+            "start_date": start_date.isoformat(),
+            "end_date": (start_date + timedelta(days=BOOKING_DAYS)).isoformat(),
+            "items": [{"equipment_id": equipment_id}],
+        })
+        if response.status_code == 200:
+            self.created.append((response.json()["id"], start_date))
+        return response
+
+    async def read(self, http):
+        if self.created and random.random() < 0.2:
+            rental_id = random.choice(self.created)[0]
+        else:
+            rental_id = random.randint(1, self.fixtures["max_rental_id"])
+        return await http.get(f"/rentals/{rental_id}")
+
+    async def return_rental(self, http):
+        rental_id, start_date = self.created.popleft()
+        return await http.put(f"/rentals/{rental_id}/return", params={
+            "return_date": (start_date + timedelta(days=BOOKING_DAYS // 2)).isoformat()})
+
+    async def cancel(self, http):
+        rental_id, _ = self.created.popleft()
+        return await http.delete(f"/rentals/{rental_id}")
+
+    async def report(self, http, name):
+        path, query = self.reports[name]
+        return await http.get(path, params=query)
+
+    def choose(self):
+        operation = random.choices(self.operations, self.weights)[0]
+        if operation == "reports":
+            return random.choice(list(self.reports))
+        if operation in ("rentals.return", "rentals.cancel") and not self.created:
+            return "rentals.create"
+        return operation
+
+    async def execute(self, http, operation):
+        if operation.startswith("reports."):
+            return await self.report(http, operation)
+        return await {
+            "rentals.read": self.read,
+            "rentals.create": self.create,
+            "rentals.return": self.return_rental,
+            "rentals.cancel": self.cancel,
+        }[operation](http)
+
+
+async def client(workload, http, deadline, samples):
+    while time.perf_counter() < deadline:
+        operation = workload.choose()
+        started = time.perf_counter()
+        try:
+            response = await workload.execute(http, operation)
+            error = str(response.status_code) if response.status_code >= 400 else None
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        if samples is not None:
+            samples.append((operation, time.perf_counter() - started, error))
+
+
+async def run_level(port, workload, concurrency, duration, warmup):
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}",
+                                 limits=limits, timeout=60.0) as http:
+        if warmup:
+            deadline = time.perf_counter() + warmup
+            await asyncio.gather(*(client(workload, http, deadline, None)
+                                   for _ in range(concurrency)))
+        samples = []
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(client(workload, http, deadline, samples)
+                               for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def percentile(values, p):
+    return values[max(0, math.ceil(len(values) * p / 100) - 1)]
+
+
+def summarize(samples, elapsed):
+    stats = {"count": len(samples), "throughput": len(samples) / elapsed}
+    latencies = sorted(latency for _, latency, error in samples if error is None)
+    errors = {}
+    for _, _, error in samples:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    stats["errors"] = errors
+    stats["error_rate"] = sum(errors.values()) / len(samples) if samples else 0.0
+    if latencies:
+        stats.update(
+            mean_ms=sum(latencies) / len(latencies) * 1000,
+            p50_ms=percentile(latencies, 50) * 1000,
+            p95_ms=percentile(latencies, 95) * 1000,
+            p99_ms=percentile(latencies, 99) * 1000,
+            max_ms=latencies[-1] * 1000)
+    return stats
+
+
+def level_result(concurrency, samples, elapsed):
+    by_operation = {}
+    for sample in samples:
+        by_operation.setdefault(sample[0], []).append(sample)
+    return {"concurrency": concurrency, "elapsed": elapsed,
+            "total": summarize(samples, elapsed),
+            "operations": {operation: summarize(items, elapsed)
+                           for operation, items in sorted(by_operation.items())}}
+
+
+def print_level(result):
+    print(f"{result['concurrency']} клиентов, {result['elapsed']:.1f} с:")
+    rows = [("всего", result["total"]), *result["operations"].items()]
+    for name, stats in rows:
+        if "p50_ms" not in stats:
+            print(f"  {name:<34} нет успешных ответов, ошибок {sum(stats['errors'].values())}")
+            continue
+        print(f"  {name:<34} {stats['throughput']:8.1f} запр/с  "
+              f"p50 {stats['p50_ms']:7.1f}  p95 {stats['p95_ms']:7.1f}  p99 {stats['p99_ms']:7.1f} мс  "
+              f"ошибок {sum(stats['errors'].values())}")
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def run(args):
+    random.seed(args.seed)
+    scale = {key: getattr(args, key) for key in DEFAULT_SCALE
+             if getattr(args, key) is not None}
+    settings = dict(setting.split("=", 1) for setting in args.setting)
+
+    with (local_postgres(args.pg_bin, args.pg_port) if args.pg_bin
+          else nullcontext(args.database_url)) as server_url:
+        if args.reuse:
+            url = database_url(server_url, args.db_name)
+        else:
+            started = time.perf_counter()
+            url = create_database(server_url, args.db_name)
+            seed_database(url, scale, args.seed, args.workers)
+            print(f"База {args.db_name} создана и заполнена за {time.perf_counter() - started:.1f} с")
+        fixtures = load_fixtures(url)
+
+        server = start_server(args.db_mode, args.port, DATABASE_URL=url,
+                              OVERDUE_SWEEP_ENABLED="0", **settings)
+        try:
+            reports = report_paths(args.port)
+            weights = {operation: weight for operation, weight in WEIGHTS.items()
+                       if operation != "reports"}
+            weights.update((name, WEIGHTS["reports"] / len(reports)) for name in reports)
+            workload = Workload(fixtures, reports, weights)
+
+            results = []
+            for concurrency in args.concurrency:
+                samples, elapsed = asyncio.run(run_level(
+                    args.port, workload, concurrency, args.duration, args.warmup))
+                results.append(level_result(concurrency, samples, elapsed))
+                print_level(results[-1])
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "meta": {
+            "started_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "db_mode": args.db_mode,
+            "scale": {**DEFAULT_SCALE, **scale} if not args.reuse else None,
+            "seed": args.seed,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "settings": settings,
+            "postgres": fixtures["postgres"],
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    output = args.output or f"bench-api-{args.db_mode}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {output}")
+
+
+def change(base, new):
+    return (new - base) / base if base else 0.0
+
+
+def compare(args):
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    for key in ("db_mode", "scale", "seed", "duration", "settings", "cpu_count"):
+        if base["meta"].get(key) != new["meta"].get(key):
+            print(f"Внимание: {key} различается: {base['meta'].get(key)} -> {new['meta'].get(key)}")
+    print(f"{base['meta'].get('git')} -> {new['meta'].get('git')}, порог {args.threshold:.0%}")
+
+    base_levels = {level["concurrency"]: level for level in base["results"]}
+    regressions = []
+    for level in new["results"]:
+        base_level = base_levels.get(level["concurrency"])
+        if base_level is None:
+            continue
+        print(f"{level['concurrency']} клиентов:")
+        rows = [("всего", base_level["total"], level["total"])]
+        rows += [(name, base_level["operations"][name], stats)
+                 for name, stats in level["operations"].items()
+                 if name in base_level["operations"]]
+        for name, old, current in rows:
+            if min(old["count"], current["count"]) < args.min_count or "p95_ms" not in old:
+                continue
+            flags = []
+            p95 = change(old["p95_ms"], current.get("p95_ms", math.inf))
+            throughput = change(old["throughput"], current["throughput"])
+            errors = current["error_rate"] - old["error_rate"]
+            if p95 > args.threshold:
+                flags.append("p95")
+            if throughput < -args.threshold:
+                flags.append("запр/с")
+            if errors > args.max_error_increase:
+                flags.append("ошибки")
+            if flags:
+                regressions.append((level["concurrency"], name, flags))
+            print(f"  {name:<34} p95 {old['p95_ms']:7.1f} -> {current.get('p95_ms', math.inf):7.1f} мс ({p95:+.0%})  "
+                  f"{old['throughput']:8.1f} -> {current['throughput']:8.1f} запр/с ({throughput:+.0%})  "
+                  f"ошибки {old['error_rate']:.1%} -> {current['error_rate']:.1%}"
+                  f"{'  РЕГРЕССИЯ: ' + ', '.join(flags) if flags else ''}")
+
+    if regressions:
+        print(f"Регрессий: {len(regressions)}")
+        return 1
+    print("Регрессий нет")
+    return 0
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный прогон API по HTTP и сравнение результатов")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Поднять базу, заполнить её и нагрузить API")
+    run_parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                            help="Сервер PostgreSQL, на котором создаётся база прогона")
+    run_parser.add_argument("--pg-bin",
+                            help="Каталог с initdb и pg_ctl: поднять временный кластер вместо --database-url")
+    run_parser.add_argument("--pg-port", type=int, default=PG_PORT)
+    run_parser.add_argument("--db-name", default=BENCH_DB,
+                            help="База прогона; пересоздаётся из database/init/")
+    run_parser.add_argument("--reuse", action="store_true",
+                            help="Не пересоздавать и не заполнять базу прогона")
+    run_parser.add_argument("--db-mode", choices=("sync", "async"), default="sync")
+    run_parser.add_argument("--port", type=int, default=API_PORT)
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY)
+    run_parser.add_argument("--duration", type=float, default=DURATION)
+    run_parser.add_argument("--warmup", type=float, default=WARMUP)
+    run_parser.add_argument("--seed", type=int, default=SEED)
+    run_parser.add_argument("--workers", type=int, default=1,
+                            help="Процессы загрузчика данных")
+    run_parser.add_argument("--setting", action="append", default=[], metavar="KEY=VALUE",
+                            help="Переменная окружения сервера API, например RENTAL_CACHE_ENABLED=0")
+    run_parser.add_argument("--output", help="Файл JSON с результатами")
+    for flag, key in (("--clients", "users_clients"), ("--sellers", "users_sellers"),
+                      ("--equipment", "equipment"), ("--rentals", "rentals"),
+                      ("--payments", "payments")):
+        run_parser.add_argument(flag, dest=key, type=int)
+    run_parser.set_defaults(users_admins=None)
+
+    compare_parser = commands.add_parser("compare", help="Сравнить два прогона")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                                help="Допустимый рост p95 и падение запр/с (доля)")
+    compare_parser.add_argument("--max-error-increase", type=float, default=0.01,
+                                help="Допустимый рост доли ошибок")
+    compare_parser.add_argument("--min-count", type=int, default=MIN_COUNT,
+                                help="Операции с меньшим числом запросов не сравниваются")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        sys.exit(compare(args))
+    if not (args.database_url or args.pg_bin):
+        raise ValueError("DATABASE_URL не задан!")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
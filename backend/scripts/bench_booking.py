@@ -0,0 +1,153 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ.setdefault("DB_POOL_SIZE", "20")
+os.environ.setdefault("DB_MAX_OVERFLOW", "20")
+
+from sqlalchemy import text
+from app import crud, schemas
+from app.database import SessionLocal
+
+
+CLIENTS = 32
+BOOKINGS = 1000
+CONTESTED_EQUIPMENT = 10
+WINDOW_DAYS = 60
+
+
+def pick_equipment(count, start_date, end_date):
+    with SessionLocal() as db:
+        rows = db.execute(text("""
+            SELECT equipment_id FROM get_available_equipment(:start_date, :end_date)
+            LIMIT :count
+        """), {"start_date": start_date, "end_date": end_date, "count": count}).scalars().all()
+    if len(rows) < count:
+        raise RuntimeError(f"Свободного оборудования меньше {count}")
+    return rows
+
+
+def book(request, created, lock):
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        try:
+            rental = crud.create_rental(db, request)
+            outcome = "created"
+            with lock:
+                created.append(rental.id)
+        except crud.EquipmentUnavailableError:
+            outcome = "conflict"
+        except Exception:
+            outcome = "error"
+    return outcome, time.perf_counter() - started
+
+
+def make_requests(equipment_ids, count, window_start, user_ids, seller_ids):
+    requests = []
+    for _ in range(count):
+        start_date = window_start + timedelta(days=random.randint(0, WINDOW_DAYS))
+        requests.append(schemas.RentalCreate(
+            user_id=random.choice(user_ids),
+            employee_id=random.choice(seller_ids),
+            start_date=start_date,
+            end_date=start_date + timedelta(days=random.randint(1, 7)),
+            items=[schemas.RentalItemCreate(equipment_id=random.choice(equipment_ids))]))
+    return requests
+
+
+def count_overlaps(equipment_ids):
+    with SessionLocal() as db:
+        return db.execute(text("""
+            SELECT count(*) FROM rental_items a
+            JOIN rental_items b ON b.equipment_id = a.equipment_id
+                AND b.id > a.id AND b.period && a.period
+            WHERE a.equipment_id = ANY(:ids)
+        """), {"ids": list(equipment_ids)}).scalar()
+
+
+def cleanup(rental_ids, statuses):
+    with SessionLocal() as db:
+        db.execute(text("DELETE FROM rentals WHERE id = ANY(:ids)"), {"ids": rental_ids})
+        for equipment_id, status in statuses.items():
+            db.execute(text("UPDATE equipment SET status = :status WHERE id = :id"),
+                       {"status": status, "id": equipment_id})
+        db.commit()
+
+
+def run(name, requests, clients, equipment_ids):
+    created, lock = [], threading.Lock()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda request: book(request, created, lock), requests))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    outcomes = [outcome for outcome, _ in results]
+    overlaps = count_overlaps(equipment_ids)
+    print(f"{name}: {len(requests) / elapsed:.1f} брон./с, "
+          f"p50 {statistics.median(latencies) * 1000:.1f} мс, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} мс")
+    print(f"  создано {outcomes.count('created')}, конфликтов {outcomes.count('conflict')}, "
+          f"ошибок {outcomes.count('error')}, пересечений в БД {overlaps}")
+    return created, overlaps, outcomes.count("error")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Конкурентное бронирование оборудования с пересекающимися датами")
+    parser.add_argument("--clients", type=int, default=CLIENTS)
+    parser.add_argument("--bookings", type=int, default=BOOKINGS)
+    parser.add_argument("--equipment", type=int, default=CONTESTED_EQUIPMENT,
+                        help="Сколько единиц оборудования делят конкурирующие брони")
+    parser.add_argument("--seed", default="booking")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    window_start = date.today() + timedelta(days=365)
+    window_end = window_start + timedelta(days=WINDOW_DAYS + 7)
+
+    with SessionLocal() as db:
+        user_ids = db.execute(text("SELECT id FROM users WHERE role = 'Клиент'")).scalars().all()
+        seller_ids = db.execute(text("SELECT id FROM users WHERE role = 'Продавец'")).scalars().all()
+
+    equipment_ids = pick_equipment(args.bookings + args.equipment, window_start, window_end)
+    contested, spare = equipment_ids[:args.equipment], equipment_ids[args.equipment:]
+    with SessionLocal() as db:
+        statuses = dict(db.execute(
+            text("SELECT id, status FROM equipment WHERE id = ANY(:ids)"),
+            {"ids": list(equipment_ids)}).fetchall())
+
+    created, failed = [], False
+    try:
+        uncontested = [make_requests([equipment_id], 1, window_start, user_ids, seller_ids)[0]
+                       for equipment_id in spare[:args.bookings]]
+        ids, overlaps, errors = run("Без конфликтов", uncontested, args.clients, spare)
+        created += ids
+        failed |= bool(overlaps or errors)
+
+        conflicting = make_requests(contested, args.bookings, window_start, user_ids, seller_ids)
+        ids, overlaps, errors = run(f"Конкуренция за {args.equipment} ед.", conflicting,
+                                    args.clients, contested)
+        created += ids
+        failed |= bool(overlaps or errors)
+    finally:
+        cleanup(created, statuses)
+
+    if failed:
+        print("ОШИБКА: найдены пересекающиеся брони или непредвиденные ошибки")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+
+CONCURRENCY = (50, 200, 400)
+DURATION = 10.0
+BASE_PORT = 8100
+
+
+def start_server(mode, port, **settings):
+    env = dict(os.environ, DB_MODE=mode, AUDIT_DRAIN_ENABLED="0",
+               REPORT_REFRESH_ENABLED="0", **settings)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.join(os.path.dirname(__file__), ".."), env=env)
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1.0)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Сервер в режиме {mode} не запустился")
+
+
+async def client(http, paths, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await http.get(random.choice(paths))
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+            else:
+                latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+
+
+async def run_load(port, paths, concurrency, duration):
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}",
+                                 limits=limits, timeout=60.0) as http:
+        latencies, errors = [], []
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(client(http, paths, deadline, latencies, errors)
+                               for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def sample_paths(rental_count):
+    rental_ids = random.sample(range(1, rental_count + 1), min(200, rental_count))
+    return ([f"/rentals/{rental_id}" for rental_id in rental_ids] +
+            ["/reports/active?limit=50", "/reports/overdue?limit=50&fresh=true"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Пропускная способность API в режимах DB_MODE=sync и async")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY)
+    parser.add_argument("--duration", type=float, default=DURATION)
+    parser.add_argument("--rentals", type=int, default=6000,
+                        help="Верхняя граница id аренд для запросов")
+    args = parser.parse_args()
+
+    load_dotenv()
+    random.seed(1)
+    paths = sample_paths(args.rentals)
+
+    for port, mode in enumerate(("sync", "async"), start=BASE_PORT):
+        server = start_server(mode, port)
+        try:
+            print(f"DB_MODE={mode}:")
+            for concurrency in args.concurrency:
+                latencies, errors, elapsed = asyncio.run(
+                    run_load(port, paths, concurrency, args.duration))
+                if not latencies:
+                    print(f"  {concurrency:>4} клиентов: нет успешных ответов, ошибок {len(errors)}")
+                    continue
+                latencies.sort()
+                p99 = latencies[int(len(latencies) * 0.99) - 1]
+                print(f"  {concurrency:>4} клиентов: {len(latencies) / elapsed:8.1f} запр/с, "
+                      f"p50 {statistics.median(latencies) * 1000:7.1f} мс, "
+                      f"p99 {p99 * 1000:7.1f} мс, ошибок {len(errors)}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import random
+import sys
+import time
+
+from data_load import DatabaseFiller
+
+
+RENTAL_SIZES = (10_000, 50_000, 100_000)
+# Генератор не допускает пересечения аренд одной единицы оборудования,
+# поэтому парк растёт вместе с арендами (как 1200 на 6000 по умолчанию):
+# на переполненном парке время уходит на поиск свободных единиц.
+EQUIPMENT_PER_RENTAL = 0.2
+EQUIPMENT_SIZES = (20_000, 60_000, 120_000)
+MAX_NONLINEARITY = 1.5
+
+
+def make_filler(num_equipment):
+    filler = DatabaseFiller(db_config={})
+    filler.client_ids = list(range(1, 801))
+    filler.seller_ids = list(range(801, 951))
+    filler.equipment_prices = {
+        eq_id: random.choice((150.0, 350.0, 800.0, 1500.0))
+        for eq_id in range(1, num_equipment + 1)}
+    filler.equipment_ids = list(filler.equipment_prices)
+    return filler
+
+
+def measure(filler, num_rentals):
+    started = time.perf_counter()
+    rentals = filler.generate_rentals(num_rentals)
+    items = filler.generate_rental_items(range(1, len(rentals) + 1), rentals)
+    return time.perf_counter() - started, len(items)
+
+
+def main():
+    random.seed(42)
+    failed = False
+
+    print(f"Масштабирование по числу аренд ({EQUIPMENT_PER_RENTAL:g} единицы оборудования на аренду):")
+    per_rental = []
+    for size in RENTAL_SIZES:
+        elapsed, items = measure(make_filler(int(size * EQUIPMENT_PER_RENTAL)), size)
+        per_rental.append(elapsed / size)
+        print(f"  {size:>7} аренд, {items:>7} позиций: {elapsed:.3f} с "
+              f"({elapsed / size * 1e6:.2f} мкс/аренда)")
+    if max(per_rental) > min(per_rental) * MAX_NONLINEARITY:
+        print("  ОШИБКА: время на аренду растёт с объёмом")
+        failed = True
+
+    print("Масштабирование по числу единиц оборудования (100000 аренд):")
+    timings = []
+    for size in EQUIPMENT_SIZES:
+        elapsed, _ = measure(make_filler(size), RENTAL_SIZES[-1])
+        timings.append(elapsed)
+        print(f"  {size:>7} единиц оборудования: {elapsed:.3f} с")
+    if max(timings) > min(timings) * MAX_NONLINEARITY:
+        print("  ОШИБКА: время генерации зависит от объёма оборудования")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
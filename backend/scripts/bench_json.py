@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dotenv import load_dotenv
+
+from bench_report_export import SYNTHETIC_SOURCE
+
+
+ROWS = 10_000
+REPEAT = 5
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def report_rows(rows):
+    from sqlalchemy import text
+    from app.database import engine
+    from app.report_queries import REPORTS, build_report_query
+
+    report = REPORTS["period"]
+    sql, query_params, selected = build_report_query(report, SYNTHETIC_SOURCE)
+    with engine.connect() as conn:
+        result = conn.execute(text(sql), {"rows": rows, **query_params})
+        tuples = result.fetchall()
+    return selected, tuples
+
+
+def rental_objects(rows):
+    from app import models
+
+    start = date(2024, 1, 1)
+    return [
+        models.Rentals(
+            id=i, user_id=i % 800 + 1, employee_id=i % 150 + 1,
+            start_date=start + timedelta(days=i % 700),
+            end_date=start + timedelta(days=i % 700 + 7),
+            return_date=None if i % 3 else start + timedelta(days=i % 700 + 6),
+            status="Активен" if i % 3 else "Завершён",
+            total_cost=Decimal(f"{i % 50000}.50"),
+            items=[models.RentalItems(id=i * 3 + j, equipment_id=(i + j) % 1200 + 1,
+                                      damage_fee=Decimal("0.00") if j else Decimal("150.00"))
+                   for j in range(i % 3 + 1)])
+        for i in range(1, rows + 1)]
+
+
+def bench_reports(rows):
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from app.fast_json import FastJSONResponse, encode_rows
+
+    fields, tuples = report_rows(rows)
+    mappings = [row._mapping for row in tuples]
+
+    def default():
+        # fetch_report + jsonable_encoder + JSONResponse, как без FAST_JSON
+        content = [{field: row[field] for field in fields} for row in mappings]
+        return JSONResponse(jsonable_encoder(content)).body
+
+    def orjson_response():
+        # Только default_response_class=FastJSONResponse
+        content = [{field: row[field] for field in fields} for row in mappings]
+        return FastJSONResponse(jsonable_encoder(content)).body
+
+    def fast():
+        return encode_rows(fields, tuples)
+
+    return [("jsonable_encoder + json", default),
+            ("jsonable_encoder + orjson", orjson_response),
+            ("encode_rows (FAST_JSON)", fast)]
+
+
+def bench_rentals(rows):
+    from fastapi.responses import JSONResponse
+    from app.fast_json import rental_json
+    from app.schemas import RentalResponse
+
+    rentals = rental_objects(rows)
+
+    def response_model():
+        # Как response_model: проверка объекта ORM, dump в python и json
+        return [JSONResponse(RentalResponse.model_validate(rental).model_dump(mode="json")).body
+                for rental in rentals]
+
+    def model_dump_json():
+        # Как кэш аренд без FAST_JSON
+        return [RentalResponse.model_validate(rental).model_dump_json().encode()
+                for rental in rentals]
+
+    def fast():
+        return [rental_json(rental) for rental in rentals]
+
+    return [("response_model + json", response_model),
+            ("model_validate + model_dump_json", model_dump_json),
+            ("rental_json (FAST_JSON)", fast)]
+
+
+def run(title, cases, rows, repeat):
+    print(f"{title}, {rows} строк:")
+    results = []
+    for name, func in cases:
+        elapsed, payload = best_of(repeat, func)
+        results.append((name, elapsed, payload))
+    base = results[0][1]
+    for name, elapsed, _ in results:
+        print(f"  {name:<34} {elapsed * 1000:8.1f} мс  {elapsed / rows * 10_000 * 1000:8.1f} мс/10k"
+              f"  x{base / elapsed:.1f}")
+    return results
+
+
+def same_json(results):
+    expected = results[0][2]
+    for name, _, payload in results[1:]:
+        if isinstance(expected, list):
+            equal = [json.loads(item) for item in payload] == [json.loads(item) for item in expected]
+        else:
+            equal = json.loads(payload) == json.loads(expected)
+        if not equal:
+            print(f"  ОШИБКА: {name} отдаёт другой JSON")
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Стоимость сериализации отчётов и аренд в JSON: стандартный путь и FAST_JSON")
+    parser.add_argument("--rows", type=int, default=ROWS)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    args = parser.parse_args()
+
+    load_dotenv()
+    ok = same_json(run("Отчёт period", bench_reports(args.rows), args.rows, args.repeat))
+    ok = same_json(run("RentalResponse", bench_rentals(args.rows), args.rows, args.repeat)) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import text
+from app.database import SessionLocal
+
+
+REPEATS = 5
+
+OVERDUE_IDS_SQL = "SELECT id FROM rentals WHERE status = 'Просрочен срок аренды' ORDER BY id"
+EQUIPMENT_IDS_SQL = "SELECT id FROM equipment ORDER BY id"
+
+
+def per_row_late_fees(db, rental_ids):
+    return {rental_id: db.execute(text("SELECT calculate_late_fee(:rental_id)"),
+                                  {"rental_id": rental_id}).scalar()
+            for rental_id in rental_ids}
+
+
+def scalar_late_fees(db, rental_ids):
+    return dict(db.execute(text(
+        "SELECT id, calculate_late_fee(id) FROM rentals WHERE status = 'Просрочен срок аренды'")).fetchall())
+
+
+def batch_late_fees(db, rental_ids):
+    return dict(db.execute(text(
+        "SELECT rental_id, late_fee FROM calculate_late_fees()")).fetchall())
+
+
+def per_row_avg_days(db, equipment_ids):
+    return {equipment_id: db.execute(text("SELECT get_avg_rental_days(:equipment_id)"),
+                                     {"equipment_id": equipment_id}).scalar()
+            for equipment_id in equipment_ids}
+
+
+def scalar_avg_days(db, equipment_ids):
+    return dict(db.execute(text(
+        "SELECT id, get_avg_rental_days(id) FROM equipment")).fetchall())
+
+
+def batch_avg_days(db, equipment_ids):
+    return dict(db.execute(text(
+        "SELECT equipment_id, avg_rental_days FROM get_equipment_utilization()")).fetchall())
+
+
+CASES = (
+    ("late_fee", "запрос на аренду", per_row_late_fees),
+    ("late_fee", "скаляр в SELECT", scalar_late_fees),
+    ("late_fee", "calculate_late_fees()", batch_late_fees),
+    ("avg_days", "запрос на единицу", per_row_avg_days),
+    ("avg_days", "скаляр в SELECT", scalar_avg_days),
+    ("avg_days", "get_equipment_utilization()", batch_avg_days),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Скалярные и пакетные функции штрафов и средней длительности аренды")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        ids = {"late_fee": db.execute(text(OVERDUE_IDS_SQL)).scalars().all(),
+               "avg_days": db.execute(text(EQUIPMENT_IDS_SQL)).scalars().all()}
+        print(f"Просроченных аренд: {len(ids['late_fee'])}, единиц оборудования: {len(ids['avg_days'])}")
+
+        expected = {}
+        for target, name, func in CASES:
+            timings = []
+            for _ in range(args.repeats):
+                started = time.perf_counter()
+                result = func(db, ids[target])
+                timings.append(time.perf_counter() - started)
+            db.rollback()
+
+            if target not in expected:
+                expected[target] = result
+            elif result != expected[target]:
+                raise RuntimeError(f"{name}: результат отличается от скалярной функции")
+            print(f"  {target:<8} {name:<30} {statistics.median(timings) * 1000:9.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import random
+import statistics
+
+import httpx
+from dotenv import load_dotenv
+
+from bench_db_mode import run_load, start_server
+
+
+CACHE_SETTINGS = {
+    "off": {"RENTAL_CACHE_ENABLED": "0"},
+    "memory": {"RENTAL_CACHE_ENABLED": "1", "RENTAL_CACHE_BACKEND": "memory"},
+}
+BASE_PORT = 8110
+
+
+def cache_stats(port):
+    stats = {}
+    for line in httpx.get(f"http://127.0.0.1:{port}/metrics").text.splitlines():
+        if line.startswith("rental_cache_requests_total"):
+            stats[line.split('"')[1]] = int(float(line.split()[-1]))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="GET /rentals/{id} с кэшем аренд и без него")
+    parser.add_argument("--caches", nargs="+", choices=CACHE_SETTINGS,
+                        default=list(CACHE_SETTINGS))
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rentals", type=int, default=6000,
+                        help="Верхняя граница id аренд для запросов")
+    parser.add_argument("--hot", type=int, default=200,
+                        help="Число аренд, которые опрашиваются повторно")
+    args = parser.parse_args()
+
+    load_dotenv()
+    random.seed(1)
+    rental_ids = random.sample(range(1, args.rentals + 1), min(args.hot, args.rentals))
+    paths = [f"/rentals/{rental_id}" for rental_id in rental_ids]
+
+    for port, cache in enumerate(args.caches, start=BASE_PORT):
+        server = start_server(args.mode, port, **CACHE_SETTINGS[cache])
+        try:
+            latencies, errors, elapsed = asyncio.run(
+                run_load(port, paths, args.concurrency, args.duration))
+            stats = cache_stats(port) if cache != "off" else {}
+        finally:
+            server.terminate()
+            server.wait()
+        if not latencies:
+            print(f"{cache:>6}: нет успешных ответов, ошибок {len(errors)}")
+            continue
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        hits = stats.get("hit", 0)
+        requests = hits + stats.get("miss", 0)
+        ratio = f", попаданий {hits / requests:.1%}" if requests else ""
+        print(f"{cache:>6}: {len(latencies) / elapsed:8.1f} запр/с, "
+              f"p50 {statistics.median(latencies) * 1000:7.1f} мс, "
+              f"p99 {p99 * 1000:7.1f} мс, ошибок {len(errors)}{ratio}")
+
+
+if __name__ == "__main__":
+    main()
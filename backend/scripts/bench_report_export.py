@@ -0,0 +1,93 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dotenv import load_dotenv
+
+
+ROW_COUNTS = (10_000, 100_000, 300_000)
+MAX_STREAM_GROWTH = 1.5
+
+# Синтетический источник той же формы, что get_rentals_period_report:
+# объём не зависит от данных в базе
+SYNTHETIC_SOURCE = """(
+    SELECT
+        g AS rental_id,
+        'Клиент ' || g AS client_name,
+        date '2020-01-01' + g % 1500 AS start_date,
+        date '2020-01-01' + g % 1500 + 7 AS end_date,
+        'Завершён'::varchar AS status,
+        (g % 50000)::decimal(10,2) AS total_cost,
+        (g % 5 + 1)::int AS equipment_count
+    FROM generate_series(1, :rows) AS g
+) AS synthetic"""
+
+
+def run_child(mode, rows):
+    from app.database import SessionLocal
+    from app.report_queries import REPORTS, fetch_report
+    from app.report_export import stream_report
+
+    report = REPORTS["period"]
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = 0
+    if mode == "list":
+        db = SessionLocal()
+        try:
+            result, _ = fetch_report(db, report, SYNTHETIC_SOURCE, {"rows": rows})
+            size = len(result)
+        finally:
+            db.close()
+    else:
+        for chunk in stream_report(report, SYNTHETIC_SOURCE, {"rows": rows}, format=mode):
+            size += len(chunk)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{elapsed:.3f} {peak} {rss}")
+
+
+def measure(mode, rows):
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", mode, str(rows)],
+        capture_output=True, text=True, check=True).stdout.split()
+    return float(output[0]), int(output[1]), int(output[2])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Пиковая память выгрузки отчёта: список против потока")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROW_COUNTS)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    load_dotenv()
+    if args.child:
+        run_child(args.child[0], int(args.child[1]))
+        return
+
+    failed = False
+    for mode in ("list", "ndjson", "csv"):
+        print(f"Режим {mode}:")
+        peaks = []
+        for rows in args.rows:
+            elapsed, peak, rss = measure(mode, rows)
+            peaks.append(peak)
+            print(f"  {rows:>8} строк: {elapsed:.2f} с, пик Python {peak / 2**20:.1f} МБ, "
+                  f"max RSS {rss / 1024:.1f} МБ")
+        if mode != "list" and max(peaks) > min(peaks) * MAX_STREAM_GROWTH:
+            print("  ОШИБКА: пиковая память потока растёт с объёмом результата")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dotenv import load_dotenv
+
+
+REPEAT = 30
+
+CASES = (
+    ("инвентарный номер", "INV-000123", {}),
+    ("префикс номера", "inv-0012", {}),
+    ("слово", "перфоратор", {}),
+    ("префикс слова", "перфор", {}),
+    ("бренд и слово", "makita шлиф", {}),
+    ("частое слово", "пила", {}),
+    ("частое слово, статус", "пила", {"status": "Доступно"}),
+    ("частое слово, категория", "пила", {"category_id": 1}),
+    ("частое слово, offset 200", "пила", {"offset": 200}),
+    ("опечатка", "перфоратр", {}),
+)
+
+# Поиск без индексов: ILIKE по всем полям каталога
+NAIVE_SQL = """
+    SELECT e.id
+    FROM equipment e
+    JOIN equipment_models em ON em.id = e.model_id
+    JOIN equipment_categories ec ON ec.id = e.category_id
+    WHERE e.inventory_number ILIKE :pattern
+       OR em.name ILIKE :pattern
+       OR em.brand ILIKE :pattern
+       OR em.description ILIKE :pattern
+       OR ec.name ILIKE :pattern
+    ORDER BY e.id
+    LIMIT 20
+"""
+
+
+def percentile(values, p):
+    return values[max(0, math.ceil(len(values) * p / 100) - 1)]
+
+
+def measure(repeat, func):
+    func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return percentile(timings, 50) * 1000, percentile(timings, 95) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Задержка /equipment/search по индексам и наивного ILIKE")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--naive", action="store_true",
+                        help="Сравнить с ILIKE '%%...%%' без индексов поиска")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from sqlalchemy import text
+    from app.database import SessionLocal
+    from app.equipment_search import search_equipment, trigram_available
+
+    db = SessionLocal()
+    try:
+        count = db.execute(text("SELECT count(*) FROM equipment")).scalar()
+        trigram = trigram_available(db)
+        print(f"Оборудования: {count}, pg_trgm: {'есть' if trigram else 'нет, опечатки не ищутся'}")
+        for name, q, filters in CASES:
+            p50, p95, (rows, next_offset) = measure(
+                args.repeat, lambda: search_equipment(db, q, **filters))
+            line = f"  {name:<26} {q!r:<14} p50 {p50:7.1f}  p95 {p95:7.1f} мс  найдено {len(rows):>2}"
+            if args.naive and not filters:
+                naive_p50, _, _ = measure(
+                    max(3, args.repeat // 10),
+                    lambda: db.execute(text(NAIVE_SQL), {"pattern": f"%{q}%"}).fetchall())
+                line += f"  ILIKE p50 {naive_p50:7.1f} мс"
+            print(line)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
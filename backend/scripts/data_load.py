@@ -1,15 +1,21 @@
 import psycopg2
+from psycopg2.extras import Json
 from faker import Faker
 import random
+import bisect
 from datetime import timedelta, date
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import io
 import time
 import logging
 import os
 import sys
-from urllib.parse import urlparse
 from dotenv import load_dotenv
 from pathlib import Path
 
+from db_utils import db_config_from_url
+
 
 NUM_USERS_CLIENTS = 800
 NUM_USERS_SELLERS = 150
@@ -18,6 +24,23 @@ NUM_EQUIPMENT = 1200
 NUM_RENTALS = 6000
 NUM_PAYMENTS = 5000
 
+DEFAULT_SCALE = {
+    "users_clients": NUM_USERS_CLIENTS,
+    "users_sellers": NUM_USERS_SELLERS,
+    "users_admins": NUM_USERS_ADMINS,
+    "equipment": NUM_EQUIPMENT,
+    "rentals": NUM_RENTALS,
+    "payments": NUM_PAYMENTS,
+}
+APPEND_SCALE = dict.fromkeys(DEFAULT_SCALE, 0)
+
+LOAD_MODES = ("copy", "executemany")
+LOAD_MODE = "copy"
+CHUNK_SIZE = 5000
+VERIFY_SAMPLE = 200
+BOOKING_ATTEMPTS = 10
+AUDITED_TABLES = ("users", "equipment", "rentals", "payments", "repairs")
+LOAD_LOCK = "data_load"
 
 LOG_DIR = Path("./app/logs")
 LOG_DIR.mkdir(exist_ok=True)
@@ -33,10 +56,127 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class LoadLockedError(Exception):
+    pass
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    text = str(value)
+    return (text.replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r"))
+
+
+class CopyStream(io.TextIOBase):
+    def __init__(self, rows, chunk_size=CHUNK_SIZE, on_chunk=None):
+        self._rows = iter(rows)
+        self._chunk_size = chunk_size
+        self._chunk = io.StringIO()
+        self._on_chunk = on_chunk
+        self.rows_written = 0
+        self.error = None
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        lines = []
+        for row in self._rows:
+            lines.append("\t".join(_copy_value(v) for v in row))
+            if len(lines) >= self._chunk_size:
+                break
+        if not lines:
+            return False
+        self.rows_written += len(lines)
+        self._chunk = io.StringIO("\n".join(lines) + "\n")
+        if self._on_chunk:
+            try:
+                self._on_chunk(len(lines))
+            except Exception as e:
+                # psycopg2 заменяет исключение из read() на QueryCanceled,
+                # исходное пробрасывается после COPY
+                self.error = e
+                raise
+        return True
+
+    def read(self, size=-1):
+        parts = []
+        while True:
+            data = self._chunk.read(size)
+            parts.append(data)
+            if size >= 0:
+                size -= len(data)
+                if size == 0:
+                    break
+            if not self._fill():
+                break
+        return "".join(parts)
+
+    def readline(self, size=-1):
+        line = self._chunk.readline(size)
+        if not line and self._fill():
+            line = self._chunk.readline(size)
+        return line
+
+
+def split_range(ids, parts):
+    size, extra = divmod(len(ids), parts)
+    partitions = []
+    start = 0
+    for i in range(parts):
+        stop = start + size + (1 if i < extra else 0)
+        partitions.append(ids[start:stop])
+        start = stop
+    return [part for part in partitions if len(part)]
+
+
+def _fill_partition_worker(filler, group, partition, ids):
+    filler.connect()
+    try:
+        filler.fill_partition(group, partition, ids)
+    except Exception:
+        filler.conn.rollback()
+        raise
+    finally:
+        filler.close()
+    return filler.loaded_rows
+
+
 class DatabaseFiller:
-    def __init__(self, db_config):
+    def __init__(self, db_config, mode=LOAD_MODE, chunk_size=CHUNK_SIZE,
+                 scale=None, workers=1, seed=None, fast=False,
+                 audit_summary=False, verify_sample=VERIFY_SAMPLE, progress=None,
+                 incremental=False, append=False):
+        if mode not in LOAD_MODES:
+            raise ValueError(f"Неизвестный режим загрузки: {mode}")
         self.fake = Faker('ru_RU')
         self.db_config = db_config
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.scale = {**(APPEND_SCALE if append else DEFAULT_SCALE), **(scale or {})}
+        self.workers = max(1, workers)
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.fast = fast
+        self.audit_summary = audit_summary
+        self.verify_sample = verify_sample
+        # progress(event, **fields) получает события загрузки: plan, step
+        # и rows; объект передаётся и в процессы партиций
+        self.progress = progress
+        # Инкрементальная загрузка пишет контрольные точки в
+        # data_load_runs/data_load_checkpoints и продолжает прерванный запуск;
+        # append добавляет только явно заданные объёмы к существующим данным
+        self.append = append
+        self.incremental = incremental or append
+        self.run_id = None
+        self.step = None
+        self.resume_id = None
+        self.today = date.today()
+        self.ranges = {}
+        self.offsets = {"sellers": 0, "admins": 0}
+        self.loaded_rows = {}
         self.conn = None
         self.cur = None
         self.category_ids = []
@@ -45,12 +185,29 @@ class DatabaseFiller:
         self.seller_ids = []
         self.admin_ids = []
         self.equipment_ids = []
+        self.equipment_prices = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(fake=None, conn=None, cur=None, loaded_rows={})
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.fake = Faker('ru_RU')
 
     def connect(self):
         try:
             self.conn = psycopg2.connect(**self.db_config)
             self.conn.autocommit = False
             self.cur = self.conn.cursor()
+            if self.fast:
+                # Триггеры аудита, total_cost и статуса оборудования
+                # пропускают строки сессии; итог пересчитывается в
+                # finish_fast_load.
+                self.cur.execute(
+                    "SELECT set_config('app.bulk_load', 'on', false)")
+                self.conn.commit()
             logger.info("Успешное подключение к БД")
         except Exception as e:
             logger.error(f"Ошибка подключения: {e}", exc_info=True)
@@ -63,7 +220,189 @@ class DatabaseFiller:
             self.conn.close()
         logger.info("Соединение с БД закрыто")
 
+    def emit(self, event, **fields):
+        if self.progress is not None:
+            self.progress(event, **fields)
+
+    def acquire_load_lock(self):
+        # Сессионная блокировка держится до закрытия соединения и не даёт
+        # запустить вторую загрузку в ту же базу, в том числе из API
+        self.cur.execute(
+            "SELECT pg_try_advisory_lock(hashtext(%s))", (LOAD_LOCK,))
+        locked = self.cur.fetchone()[0]
+        self.conn.commit()
+        if not locked:
+            raise LoadLockedError("В этой базе уже выполняется загрузка данных")
+
+    def planned_rows(self):
+        return {
+            "users": self.scale["users_clients"] + self.scale["users_sellers"] + self.scale["users_admins"],
+            "equipment": self.scale["equipment"],
+            "rentals": self.scale["rentals"],
+            "payments": self.scale["payments"],
+        }
+
+    def run_params(self):
+        return {
+            "seed": self.seed,
+            "scale": self.scale,
+            "workers": self.workers,
+            "chunk_size": self.chunk_size,
+            "fast": self.fast,
+            "append": self.append,
+            "today": self.today.isoformat(),
+            "offsets": self.offsets,
+            "ranges": {table: [ids.start, ids.stop] for table, ids in self.ranges.items()},
+        }
+
+    def start_run(self):
+        self.cur.execute(
+            "SELECT id, status, params FROM data_load_runs ORDER BY id DESC LIMIT 1")
+        row = self.cur.fetchone()
+        if row and row[1] != 'completed':
+            # Параметры прерванного запуска восстанавливаются целиком: от
+            # зерна, числа процессов и размера порции зависят данные и
+            # границы контрольных точек
+            self.run_id, _, params = row
+            self.seed = params["seed"]
+            self.scale = params["scale"]
+            self.workers = params["workers"]
+            self.chunk_size = params["chunk_size"]
+            self.fast = params["fast"]
+            self.append = params["append"]
+            self.today = date.fromisoformat(params["today"])
+            self.offsets = params["offsets"]
+            self.ranges = {table: range(*ids) for table, ids in params["ranges"].items()}
+            self.cur.execute(
+                "SELECT set_config('app.bulk_load', %s, false)", ('on' if self.fast else 'off',))
+            self.cur.execute("""
+                UPDATE data_load_runs
+                SET status = 'running', finished_at = NULL, updated_at = current_timestamp
+                WHERE id = %s
+            """, (self.run_id,))
+            logger.info(f"Продолжение загрузки #{self.run_id} с последней контрольной точки")
+        else:
+            self.cur.execute("""
+                SELECT count(*) FILTER (WHERE role = 'Продавец'),
+                       count(*) FILTER (WHERE role = 'Админ')
+                FROM users
+            """)
+            sellers, admins = self.cur.fetchone()
+            self.offsets = {"sellers": sellers, "admins": admins}
+            self.cur.execute(
+                "INSERT INTO data_load_runs (params) VALUES (%s) RETURNING id",
+                (Json(self.run_params()),))
+            self.run_id = self.cur.fetchone()[0]
+            logger.info(f"Инкрементальная загрузка #{self.run_id}: {self.scale}")
+        self.conn.commit()
+        self.load_state()
+
+    def save_run(self):
+        self.cur.execute("""
+            UPDATE data_load_runs SET params = %s, updated_at = current_timestamp
+            WHERE id = %s
+        """, (Json(self.run_params()), self.run_id))
+
+    def finish_run(self, status):
+        self.cur.execute("""
+            UPDATE data_load_runs
+            SET status = %s, finished_at = current_timestamp, updated_at = current_timestamp
+            WHERE id = %s
+        """, (status, self.run_id))
+        self.conn.commit()
+
+    def checkpoint(self, step, partition=0):
+        self.cur.execute("""
+            SELECT next_id, completed FROM data_load_checkpoints
+            WHERE run_id = %s AND step = %s AND partition = %s
+        """, (self.run_id, step, partition))
+        return self.cur.fetchone() or (None, False)
+
+    def save_checkpoint(self, step, partition=0, next_id=None, completed=False):
+        self.cur.execute("""
+            INSERT INTO data_load_checkpoints (run_id, step, partition, next_id, completed)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (run_id, step, partition) DO UPDATE
+            SET next_id = excluded.next_id, completed = excluded.completed,
+                updated_at = current_timestamp
+        """, (self.run_id, step, partition, next_id, completed))
+
+    def commit_step(self):
+        # Отметка шага фиксируется вместе с его данными, поэтому
+        # продолжение не повторяет уже выполненный шаг
+        if self.run_id is not None:
+            self.save_checkpoint(self.step, completed=True)
+        self.conn.commit()
+
+    def owned_range(self, table):
+        # Платежи, повреждения и ремонты инкрементального запуска
+        # добавляются только к строкам этого запуска
+        if self.incremental:
+            ids = self.ranges[table]
+            return ids.start, ids.stop
+        return 0, 2 ** 31 - 1
+
+    def load_state(self):
+        self.cur.execute("SELECT id FROM equipment_categories ORDER BY id")
+        self.category_ids = [row[0] for row in self.cur.fetchall()]
+        self.cur.execute("SELECT id FROM equipment_models ORDER BY id")
+        self.model_ids = [row[0] for row in self.cur.fetchall()]
+        self.load_user_ids()
+        self.load_equipment_prices()
+
+    def load_user_ids(self):
+        # Строки, которые приложение добавило после резервирования
+        # диапазона загрузки, не участвуют в генерации: иначе продолжение
+        # сгенерировало бы другие данные
+        limit = self.ranges["users"].stop if "users" in self.ranges else None
+        self.cur.execute("""
+            SELECT id, role FROM users
+            WHERE role IN ('Клиент', 'Продавец') AND (%s::bigint IS NULL OR id < %s)
+            ORDER BY id
+        """, (limit, limit))
+        rows = self.cur.fetchall()
+        self.client_ids = [user_id for user_id, role in rows if role == 'Клиент']
+        self.seller_ids = [user_id for user_id, role in rows if role == 'Продавец']
+
+    def bulk_insert(self, table, columns, rows):
+        rows = list(rows)
+        if not rows:
+            return 0
+
+        def on_chunk(count):
+            self.emit("rows", table=table, rows=count)
+
+        started = time.perf_counter()
+        if self.mode == "copy":
+            stream = CopyStream(rows, self.chunk_size, on_chunk)
+            try:
+                self.cur.copy_expert(
+                    f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream)
+            except psycopg2.Error:
+                if stream.error is not None:
+                    raise stream.error
+                raise
+        else:
+            placeholders = ", ".join(["%s"] * len(columns))
+            query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+            for i in range(0, len(rows), self.chunk_size):
+                chunk = rows[i:i + self.chunk_size]
+                self.cur.executemany(query, chunk)
+                on_chunk(len(chunk))
+        elapsed = time.perf_counter() - started
+
+        self.loaded_rows[table] = self.loaded_rows.get(table, 0) + len(rows)
+        rate = len(rows) / elapsed if elapsed > 0 else float("inf")
+        logger.info(
+            f"{table}: {len(rows)} строк за {elapsed:.2f} с ({rate:.0f} строк/с, режим {self.mode})")
+        return len(rows)
+
     def fill_equipment_categories(self):
+        if self.category_ids:
+            logger.info(f"Категории оборудования уже загружены: {len(self.category_ids)}")
+            self.commit_step()
+            return
+
         categories = [
             ('Электроинструменты', 'Аккумуляторные и сетевые электроинструменты', None),
             ('Строительное оборудование', 'Оборудование для строительных работ', None),
@@ -83,18 +422,21 @@ class DatabaseFiller:
             ('Садовые измельчители', 'Измельчители веток и садового мусора', 3),
         ]
 
-        self.cur.executemany("""
-            INSERT INTO equipment_categories (name, description, parent_id)
-            VALUES (%s, %s, %s)
-        """, categories)
+        self.bulk_insert("equipment_categories", ("name", "description", "parent_id"),
+                          categories)
 
         self.cur.execute("SELECT id FROM equipment_categories ORDER BY id")
         self.category_ids = [row[0] for row in self.cur.fetchall()]
 
-        self.conn.commit()
+        self.commit_step()
         logger.info(f"Добавлено категорий оборудования: {len(categories)}")
 
     def fill_equipment_models(self):
+        if self.model_ids:
+            logger.info(f"Модели оборудования уже загружены: {len(self.model_ids)}")
+            self.commit_step()
+            return
+
         models = [
             ('DCD 796 D2', 'DeWalt', 350.00, 5000.00,
              'Аккумуляторная дрель-шуруповерт 18В, 2 скорости, быстрозажимной патрон'),
@@ -128,59 +470,141 @@ class DatabaseFiller:
              'Плиткорез напольный, длина реза 600мм, алмазное колесо'),
         ]
 
-        self.cur.executemany("""
-            INSERT INTO equipment_models (name, brand, rental_price_per_day, deposit_amount, description)
-            VALUES (%s, %s, %s, %s, %s)
-        """, models)
+        self.bulk_insert("equipment_models", ("name", "brand", "rental_price_per_day", "deposit_amount", "description"),
+                          models)
 
         self.cur.execute("SELECT id FROM equipment_models ORDER BY id")
         self.model_ids = [row[0] for row in self.cur.fetchall()]
 
-        self.conn.commit()
+        self.commit_step()
         logger.info(f"Добавлено моделей оборудования: {len(models)}")
 
+    def reserve_ids(self, table, count):
+        # Диапазон id резервируется сдвигом последовательности, поэтому
+        # загрузку нельзя запускать параллельно с приложением, пишущим
+        # в ту же таблицу.
+        if table in self.ranges:
+            # Продолжение использует диапазон прерванного запуска
+            return self.ranges[table]
+        self.cur.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id'))", (table,))
+        first_id = self.cur.fetchone()[0]
+        if count > 1:
+            self.cur.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)",
+                (table, first_id + count - 1))
+        self.ranges[table] = range(first_id, first_id + count)
+        if self.run_id is not None:
+            self.save_run()
+        return self.ranges[table]
+
+    def seed_partition(self, group, partition):
+        partition_seed = f"{self.seed}:{group}:{partition}"
+        random.seed(partition_seed)
+        self.fake.seed_instance(partition_seed)
+
+    def fill_partition(self, group, partition, ids):
+        self.resume_id = ids.start
+        if self.run_id is not None:
+            self.resume_id = self.checkpoint(group, partition)[0] or ids.start
+            if self.resume_id >= ids.stop:
+                logger.info(f"Партиция {group}#{partition} уже загружена")
+                return
+        self.seed_partition(group, partition)
+        self.group = group
+        self.partition = partition
+        getattr(self, f"fill_{group}_partition")(ids)
+        self.conn.commit()
+        logger.info(
+            f"Партиция {group}#{partition}: {len(ids)} записей (id {ids.start}-{ids.stop - 1})")
+
+    def insert_partition(self, ids, tables):
+        if self.run_id is None:
+            for table, columns, rows in tables:
+                if rows:
+                    self.bulk_insert(table, columns, rows)
+            return
+
+        # Партиция генерируется целиком (от этого зависят случайные
+        # значения), а пишется порциями по chunk_size id владельца из
+        # первого столбца; порция фиксируется вместе с контрольной точкой
+        chunks = {}
+        for table, _, rows in tables:
+            for row in rows:
+                if row[0] >= self.resume_id:
+                    index = (row[0] - ids.start) // self.chunk_size
+                    chunks.setdefault((index, table), []).append(row)
+
+        first_index = (self.resume_id - ids.start) // self.chunk_size
+        for index in range(first_index, -(-len(ids) // self.chunk_size)):
+            for table, columns, _ in tables:
+                rows = chunks.get((index, table))
+                if rows:
+                    self.bulk_insert(table, columns, rows)
+            next_id = min(ids.start + (index + 1) * self.chunk_size, ids.stop)
+            self.save_checkpoint(self.group, self.partition, next_id=next_id)
+            self.conn.commit()
+
+    def run_partitions(self, group, ids):
+        partitions = split_range(ids, self.workers)
+        if self.workers == 1:
+            for i, part in enumerate(partitions):
+                self.fill_partition(group, i, part)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                pool.submit(_fill_partition_worker, self, group, i, part)
+                for i, part in enumerate(partitions)]
+            for future in futures:
+                for table, count in future.result().items():
+                    self.loaded_rows[table] = self.loaded_rows.get(
+                        table, 0) + count
+
     def fill_users(self):
-        users_data = []
+        clients = self.scale["users_clients"]
+        sellers = self.scale["users_sellers"]
+        admins = self.scale["users_admins"]
 
-        for _ in range(NUM_USERS_CLIENTS):
-            name = self.fake.name()
-            email = self.fake.unique.email()
-            phone = self.fake.phone_number()
-            if len(phone) > 25:
-                phone = phone[:25]
-            users_data.append((name, email, phone, 'Клиент'))
+        user_ids = self.reserve_ids("users", clients + sellers + admins)
+        self.conn.commit()
+        self.client_ids = user_ids[:clients]
+        self.seller_ids = user_ids[clients:clients + sellers]
+        self.admin_ids = user_ids[clients + sellers:]
 
-        for i in range(1, NUM_USERS_SELLERS + 1):
-            name = f"Продавец {i}"
-            email = f"seller{i}@company.com"
-            phone = self.fake.phone_number()
-            if len(phone) > 25:
-                phone = phone[:25]
-            users_data.append((name, email, phone, 'Продавец'))
+        self.run_partitions("users", user_ids)
+        if self.incremental:
+            self.load_user_ids()
+        self.commit_step()
 
-        for i in range(1, NUM_USERS_ADMINS + 1):
-            name = f"Админ {i}"
-            email = f"admin{i}@company.com"
+        logger.info(
+            f"Добавлено пользователей: {len(user_ids)} (Клиенты: {clients}, Продавцы: {sellers}, Админы: {admins})")
+
+    def fill_users_partition(self, user_ids):
+        users_data = []
+        personal_data = []
+
+        for user_id in user_ids:
+            if user_id in self.client_ids:
+                name = self.fake.name()
+                local, domain = self.fake.email().split("@")
+                email = f"{local}.{user_id}@{domain}"
+                role = 'Клиент'
+            elif user_id in self.seller_ids:
+                i = user_id - self.seller_ids.start + 1 + self.offsets["sellers"]
+                name = f"Продавец {i}"
+                email = f"seller{i}@company.com"
+                role = 'Продавец'
+            else:
+                i = user_id - self.admin_ids.start + 1 + self.offsets["admins"]
+                name = f"Админ {i}"
+                email = f"admin{i}@company.com"
+                role = 'Админ'
             phone = self.fake.phone_number()
             if len(phone) > 25:
                 phone = phone[:25]
-            users_data.append((name, email, phone, 'Админ'))
-
-        self.cur.executemany("""
-            INSERT INTO users (name, email, phone, role)
-            VALUES (%s, %s, %s, %s)
-        """, users_data)
-
-        self.cur.execute("SELECT id, role FROM users ORDER BY id")
-        rows = self.cur.fetchall()
-
-        self.client_ids = [row[0] for row in rows if row[1] == 'Клиент']
-        self.seller_ids = [row[0] for row in rows if row[1] == 'Продавец']
-        self.admin_ids = [row[0] for row in rows if row[1] == 'Админ']
+            users_data.append((user_id, name, email, phone, role))
 
-        personal_data = []
-        all_user_ids = [row[0] for row in rows]
-        for user_id in all_user_ids:
             if random.random() < 0.7:
                 personal_data.append((
                     user_id,
@@ -191,46 +615,57 @@ class DatabaseFiller:
                     self.fake.date_of_birth(minimum_age=18, maximum_age=80)
                 ))
 
-        if personal_data:
-            self.cur.executemany("""
-                INSERT INTO users_personal_data (user_id, country, city, address, postal_code, birth_date)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, personal_data)
+        self.insert_partition(user_ids, [
+            ("users", ("id", "name", "email", "phone", "role"), users_data),
+            ("users_personal_data", ("user_id", "country", "city", "address", "postal_code", "birth_date"),
+             personal_data),
+        ])
 
+    def fill_equipment(self):
+        equipment_ids = self.reserve_ids("equipment", self.scale["equipment"])
         self.conn.commit()
-        total_users = NUM_USERS_CLIENTS + NUM_USERS_SELLERS + NUM_USERS_ADMINS
-        logger.info(
-            f"Добавлено пользователей: {total_users} (Клиенты: {NUM_USERS_CLIENTS}, Продавцы: {NUM_USERS_SELLERS}, Админы: {NUM_USERS_ADMINS})")
 
-    def fill_equipment(self):
+        self.run_partitions("equipment", equipment_ids)
+
+        self.load_equipment_prices()
+        self.commit_step()
+        logger.info(f"Добавлено единиц оборудования: {len(equipment_ids)}")
+
+    def fill_equipment_partition(self, equipment_ids):
         statuses = ['Доступно'] * 70 + ['В аренде'] * 15 + \
             ['На обслуживании/В ремонте'] * 10 + ['Списано'] * 5
         equipment_data = []
 
-        for i in range(1, NUM_EQUIPMENT + 1):
+        for eq_id in equipment_ids:
             category_id = random.choice(self.category_ids)
             model_id = random.choice(self.model_ids)
-            inventory_number = f"INV-{i:06d}"
+            inventory_number = f"INV-{eq_id:06d}"
             status = random.choice(statuses)
             equipment_data.append(
-                (category_id, model_id, inventory_number, status))
-
-        self.cur.executemany("""
-            INSERT INTO equipment (category_id, model_id, inventory_number, status)
-            VALUES (%s, %s, %s, %s)
-        """, equipment_data)
+                (eq_id, category_id, model_id, inventory_number, status))
 
-        self.cur.execute("SELECT id FROM equipment ORDER BY id")
-        self.equipment_ids = [row[0] for row in self.cur.fetchall()]
-
-        self.conn.commit()
-        logger.info(f"Добавлено единиц оборудования: {NUM_EQUIPMENT}")
+        self.insert_partition(equipment_ids, [
+            ("equipment", ("id", "category_id", "model_id", "inventory_number", "status"),
+             equipment_data),
+        ])
 
-    def fill_rentals_and_items(self):
-        today = date.today()
+    def load_equipment_prices(self):
+        limit = self.ranges["equipment"].stop if "equipment" in self.ranges else None
+        self.cur.execute("""
+            SELECT e.id, em.rental_price_per_day FROM equipment e
+            JOIN equipment_models em ON em.id = e.model_id
+            WHERE %s::bigint IS NULL OR e.id < %s
+            ORDER BY e.id
+        """, (limit, limit))
+        self.equipment_prices = {
+            eq_id: float(price) for eq_id, price in self.cur.fetchall()}
+        self.equipment_ids = list(self.equipment_prices)
+
+    def generate_rentals(self, count):
+        today = self.today
         rentals_data = []
 
-        for _ in range(NUM_RENTALS):
+        for _ in range(count):
             client_id = random.choice(self.client_ids)
             employee_id = random.choice(self.seller_ids)
 
@@ -260,86 +695,241 @@ class DatabaseFiller:
             rentals_data.append(
                 (client_id, employee_id, start_date, end_date, return_date, status, None))
 
-        self.cur.executemany("""
-            INSERT INTO rentals (user_id, employee_id, start_date, end_date, return_date, status, total_cost)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, rentals_data)
+        return rentals_data
+
+    def book_equipment(self, bookings, equipment_ids, start_date, end_date, count):
+        # Занятость каждой единицы хранится как отсортированные
+        # непересекающиеся интервалы, как того требует исключающее
+        # ограничение rental_items_equipment_period_excl.
+        chosen = []
+        for _ in range(count * BOOKING_ATTEMPTS):
+            eq_id = random.choice(equipment_ids)
+            if eq_id in chosen:
+                continue
+            starts, ends = bookings.setdefault(eq_id, ([], []))
+            i = bisect.bisect_right(starts, end_date)
+            if i and ends[i - 1] >= start_date:
+                continue
+            starts.insert(i, start_date)
+            ends.insert(i, end_date)
+            chosen.append(eq_id)
+            if len(chosen) == count:
+                break
+        return chosen
+
+    def hold_end(self, end_date, return_date, status):
+        # Как rental_period: возвращённое оборудование занято до return_date,
+        # невозвращённое после срока (триггер переведёт аренду в
+        # просроченные) — без верхней границы
+        if return_date is not None:
+            return return_date
+        if status == 'Просрочен срок аренды' or (status == 'Активен' and end_date < self.today):
+            return date.max
+        return end_date
+
+    def load_bookings(self, equipment_ids):
+        # Периоды аренд, уже лежащих в базе, занимают оборудование так же,
+        # как сгенерированные; строки своего диапазона не учитываются, чтобы
+        # продолжение повторило исходное бронирование
+        rental_ids = self.ranges["rentals"]
+        self.cur.execute("""
+            SELECT equipment_id, lower(period), COALESCE(upper(period) - 1, DATE '9999-12-31')
+            FROM rental_items
+            WHERE period IS NOT NULL AND equipment_id = ANY(%s)
+              AND (rental_id < %s OR rental_id >= %s)
+            ORDER BY equipment_id, lower(period)
+        """, (list(equipment_ids), rental_ids.start, rental_ids.stop))
+        bookings = {}
+        for eq_id, start_date, end_date in self.cur.fetchall():
+            starts, ends = bookings.setdefault(eq_id, ([], []))
+            starts.append(start_date)
+            ends.append(end_date)
+        return bookings
+
+    def generate_rental_items(self, rental_ids, rentals, equipment_ids=None, bookings=None):
+        equipment_ids = equipment_ids or self.equipment_ids
+        bookings = {} if bookings is None else bookings
+        rental_items_data = []
+        for index, (rental_id, rental) in enumerate(zip(rental_ids, rentals)):
+            start_date, end_date, return_date, status = rental[2:6]
+            num_items = min(random.randint(1, 4), len(equipment_ids))
+            chosen = []
+            if status != 'Отменён':
+                chosen = self.book_equipment(
+                    bookings, equipment_ids, start_date,
+                    self.hold_end(end_date, return_date, status), num_items)
+                if not chosen:
+                    # Свободного оборудования на эти даты нет: отменённая
+                    # аренда не занимает оборудование.
+                    rentals[index] = (*rental[:5], 'Отменён', *rental[6:])
+            if not chosen:
+                chosen = random.sample(equipment_ids, num_items)
+
+            for eq_id in chosen:
+                price_per_day = self.equipment_prices[eq_id]
+                damage_fee = round(
+                    price_per_day * random.uniform(0, 5), 2) if random.random() < 0.1 else 0.0
+                rental_items_data.append((rental_id, eq_id, damage_fee))
 
-        self.cur.execute(
-            "SELECT id FROM rentals ORDER BY id DESC LIMIT %s", (NUM_RENTALS,))
+        return rental_items_data
 
-        rental_ids = [row[0] for row in self.cur.fetchall()][::-1]
+    def fill_rentals_and_items(self):
+        if self.scale["rentals"] and not (self.client_ids and self.seller_ids and self.equipment_ids):
+            raise ValueError("Для аренд нужны клиенты, продавцы и оборудование")
+        rental_ids = self.reserve_ids("rentals", self.scale["rentals"])
+        self.conn.commit()
 
-        rental_items_data = []
-        for rental_id in rental_ids:
-            num_items = random.randint(1, 4)
-            used_in_rental = set()
-            for _ in range(num_items):
-                available = [
-                    eid for eid in self.equipment_ids if eid not in used_in_rental]
-                if not available:
-                    break
-                eq_id = random.choice(available)
-                used_in_rental.add(eq_id)
+        self.run_partitions("rentals", rental_ids)
+        if self.fast:
+            self.finish_fast_load(rental_ids)
+        self.commit_step()
 
-                self.cur.execute("""
-                    SELECT rental_price_per_day FROM equipment_models em
-                    JOIN equipment e ON em.id = e.model_id
-                    WHERE e.id = %s
-                """, (eq_id,))
-                price_per_day = self.cur.fetchone()[0]
+        logger.info(f"Добавлено аренд: {len(rental_ids)}")
 
-                damage_fee = round(
-                    float(price_per_day) * random.uniform(0, 5), 2) if random.random() < 0.1 else 0.0
-                rental_items_data.append((rental_id, eq_id, damage_fee))
+    def finish_fast_load(self, rental_ids):
+        ids = list(rental_ids)
+        if self.verify_sample:
+            self.cur.execute("""
+                CREATE TEMP TABLE fast_load_equipment_status ON COMMIT DROP AS
+                SELECT id, status FROM equipment
+            """)
 
-        if rental_items_data:
-            self.cur.executemany("""
-                INSERT INTO rental_items (rental_id, equipment_id, damage_fee)
-                VALUES (%s, %s, %s)
-            """, rental_items_data)
+        started = time.perf_counter()
+        self.cur.execute(
+            "SELECT recalculate_rental_total_cost(%s)", (ids,))
+        totals = self.cur.fetchone()[0]
+        self.cur.execute("SELECT mark_rented_equipment(%s)", (ids,))
+        statuses = self.cur.fetchone()[0]
+        logger.info(
+            f"Пересчитано total_cost: {totals}, статусов оборудования: {statuses} "
+            f"за {time.perf_counter() - started:.2f} с")
 
-        self.conn.commit()
-        logger.info(f"Добавлено аренд: {NUM_RENTALS}")
+        if self.verify_sample:
+            self.verify_fast_load(ids)
+
+    def verify_fast_load(self, rental_ids):
+        sample = random.sample(rental_ids, min(
+            self.verify_sample, len(rental_ids)))
+
+        self.cur.execute(
+            "SELECT id, total_cost FROM rentals WHERE id = ANY(%s)", (sample,))
+        fast_totals = dict(self.cur.fetchall())
+
+        # Повторно запускаем построчный триггер total_cost для выборки
+        # и откатываем его результат.
+        self.cur.execute("SAVEPOINT verify_fast_load")
+        self.cur.execute("SELECT set_config('app.bulk_load', 'off', true)")
+        self.cur.execute(
+            "UPDATE rental_items SET damage_fee = damage_fee WHERE rental_id = ANY(%s)", (sample,))
+        self.cur.execute("""
+            SELECT r.id, CASE WHEN EXISTS (
+                SELECT 1 FROM rental_items ri WHERE ri.rental_id = r.id
+            ) THEN r.total_cost ELSE 0 END
+            FROM rentals r WHERE r.id = ANY(%s)
+        """, (sample,))
+        trigger_totals = dict(self.cur.fetchall())
+        self.cur.execute("ROLLBACK TO SAVEPOINT verify_fast_load")
+
+        mismatched = [rental_id for rental_id in sample
+                      if fast_totals[rental_id] != trigger_totals[rental_id]]
+
+        # Построчный триггер переводит в 'В аренде' оборудование активных
+        # аренд и больше ничего не меняет.
+        self.cur.execute("""
+            SELECT count(*)
+            FROM equipment e
+            JOIN fast_load_equipment_status before ON before.id = e.id
+            WHERE e.status IS DISTINCT FROM CASE
+                WHEN EXISTS (
+                    SELECT 1 FROM rental_items ri
+                    JOIN rentals r ON ri.rental_id = r.id
+                    WHERE ri.equipment_id = e.id
+                      AND r.id = ANY(%s)
+                      AND r.status = 'Активен'
+                ) THEN 'В аренде'
+                ELSE before.status
+            END
+        """, (rental_ids,))
+        wrong_statuses = self.cur.fetchone()[0]
+
+        if mismatched or wrong_statuses:
+            raise RuntimeError(
+                f"Быстрая загрузка расходится с триггерами: total_cost у аренд {mismatched[:10]}, "
+                f"статусов оборудования: {wrong_statuses}")
+        logger.info(
+            f"Проверка быстрой загрузки пройдена: {len(sample)} аренд, все единицы оборудования")
+
+    def write_audit_summary(self):
+        for table in AUDITED_TABLES:
+            rows = self.loaded_rows.get(table)
+            if not rows:
+                continue
+            self.cur.execute("""
+                INSERT INTO audit_log (table_name, record_id, operation, old_data, new_data)
+                VALUES (%s, 0, 'INSERT', NULL, jsonb_build_object(
+                    'bulk_load', true, 'rows', %s, 'mode', %s, 'seed', %s))
+            """, (table, rows, self.mode, self.seed))
+        self.commit_step()
+        logger.info("Записана сводная запись аудита о загрузке")
+
+    def fill_rentals_partition(self, rental_ids):
+        rentals = self.generate_rentals(len(rental_ids))
+        equipment_ids = self.equipment_ids
+        if self.workers > 1:
+            # Каждый процесс бронирует только свою долю оборудования, чтобы
+            # периоды аренды разных партиций не пересекались.
+            equipment_ids = equipment_ids[self.partition::self.workers]
+        bookings = self.load_bookings(equipment_ids) if self.incremental else None
+        rental_items_data = self.generate_rental_items(
+            rental_ids, rentals, equipment_ids, bookings)
+
+        rentals_data = [
+            (rental_id, *rental) for rental_id, rental in zip(rental_ids, rentals)]
+        if self.workers > 1:
+            # Триггер на rental_items обновляет строки equipment; единый
+            # порядок захвата блокировок исключает взаимоблокировки между
+            # процессами, вставляющими позиции одновременно.
+            rental_items_data.sort(key=lambda item: item[1])
+        self.insert_partition(rental_ids, [
+            ("rentals", ("id", "user_id", "employee_id", "start_date", "end_date", "return_date", "status", "total_cost"),
+             rentals_data),
+            ("rental_items", ("rental_id", "equipment_id", "damage_fee"), rental_items_data),
+        ])
 
     def fill_payments(self):
-        self.cur.execute(f"""
-            SELECT id FROM rentals
-            WHERE status = 'Завершён'
-            ORDER BY RANDOM()
-            LIMIT {NUM_PAYMENTS}
-        """)
-        rental_ids = [row[0] for row in self.cur.fetchall()]
+        self.seed_partition("payments", 0)
+        self.cur.execute("""
+            SELECT id, start_date FROM rentals
+            WHERE status = 'Завершён' AND id >= %s AND id < %s
+            ORDER BY md5(id || %s)
+            LIMIT %s
+        """, (*self.owned_range("rentals"), f":{self.seed}", self.scale["payments"]))
+        rentals = self.cur.fetchall()
 
         methods = ['Наличные', 'Банковской картой', 'Перевод СБП']
         payments_data = []
 
-        for rental_id in rental_ids:
-            self.cur.execute(
-                "SELECT start_date FROM rentals WHERE id = %s", (rental_id,))
-            start_date = self.cur.fetchone()[0]
+        for rental_id, start_date in rentals:
             method = random.choice(methods)
             payment_date = start_date + timedelta(days=random.randint(0, 5))
             payments_data.append((rental_id, method, payment_date))
 
         if payments_data:
-            self.cur.executemany("""
-                INSERT INTO payments (rental_id, payment_method, payment_date)
-                VALUES (%s, %s, %s)
-            """, payments_data)
+            self.bulk_insert("payments", ("rental_id", "payment_method", "payment_date"),
+                              payments_data)
 
-        self.conn.commit()
+        self.commit_step()
         logger.info(
-            f"Добавлено платежей: {len(payments_data)} (планировалось {NUM_PAYMENTS})")
+            f"Добавлено платежей: {len(payments_data)} (планировалось {self.scale['payments']})")
 
     def fill_damages_and_repairs(self):
-
+        self.seed_partition("repairs", 0)
         self.cur.execute("""
             SELECT equipment_id, rental_id FROM rental_items
-            WHERE damage_fee > 0
-            ORDER BY RANDOM()
+            WHERE damage_fee > 0 AND rental_id >= %s AND rental_id < %s
+            ORDER BY md5(rental_id || ':' || equipment_id || %s)
             LIMIT 1000
-        """)
+        """, (*self.owned_range("rentals"), f":{self.seed}"))
         damage_rows = self.cur.fetchall()
 
         damages_data = []
@@ -350,16 +940,15 @@ class DatabaseFiller:
             damages_data.append((eq_id, rental_id, desc))
 
         if damages_data:
-            self.cur.executemany("""
-                INSERT INTO damages (equipment_id, rental_id, description)
-                VALUES (%s, %s, %s)
-            """, damages_data)
+            self.bulk_insert("damages", ("equipment_id", "rental_id", "description"),
+                              damages_data)
 
         self.cur.execute("""
             SELECT id FROM equipment
-            ORDER BY RANDOM()
+            WHERE id >= %s AND id < %s
+            ORDER BY md5(id || %s)
             LIMIT 300
-        """)
+        """, (*self.owned_range("equipment"), f":{self.seed}"))
         repair_eq_ids = [row[0] for row in self.cur.fetchall()]
 
         repairs_data = []
@@ -369,7 +958,7 @@ class DatabaseFiller:
             3 + ['Запланирован'] * 2 + ['Отменён'] * 1
 
         for eq_id in repair_eq_ids:
-            start_date = date.today() - timedelta(days=random.randint(0, 365))
+            start_date = self.today - timedelta(days=random.randint(0, 365))
             end_date = start_date + \
                 timedelta(days=random.randint(1, 14)
                           ) if random.random() < 0.7 else None
@@ -380,12 +969,10 @@ class DatabaseFiller:
                 (eq_id, start_date, end_date, desc, cost, status))
 
         if repairs_data:
-            self.cur.executemany("""
-                INSERT INTO repairs (equipment_id, start_date, end_date, description, cost, status)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, repairs_data)
+            self.bulk_insert("repairs", ("equipment_id", "start_date", "end_date", "description", "cost", "status"),
+                              repairs_data)
 
-        self.conn.commit()
+        self.commit_step()
         logger.info("Добавлена информация о повреждениях и ремонтах")
 
     def update_equipment_status(self):
@@ -416,39 +1003,111 @@ class DatabaseFiller:
             WHERE e.status NOT IN ('В аренде', 'На обслуживании/В ремонте', 'Списано')
         """)
 
-        self.conn.commit()
+        self.commit_step()
         logger.info("Статусы оборудования обновлены")
 
     def fill_all(self):
+        self.acquire_load_lock()
+        if self.incremental:
+            self.start_run()
         logger.info("Начало заполнения базы данных")
-        self.fill_equipment_categories()
-        self.fill_equipment_models()
-        self.fill_users()
-        self.fill_equipment()
-        self.fill_rentals_and_items()
-        self.fill_payments()
-        self.fill_damages_and_repairs()
-        self.update_equipment_status()
+        self.emit("plan", planned=self.planned_rows())
+        steps = [
+            self.fill_equipment_categories,
+            self.fill_equipment_models,
+            self.fill_users,
+            self.fill_equipment,
+            self.fill_rentals_and_items,
+            self.fill_payments,
+            self.fill_damages_and_repairs,
+            self.update_equipment_status,
+        ]
+        if self.fast and self.audit_summary:
+            steps.append(self.write_audit_summary)
+        try:
+            for step in steps:
+                self.step = step.__name__
+                if self.run_id is not None and self.checkpoint(self.step)[1]:
+                    logger.info(f"Шаг {self.step} уже выполнен")
+                    continue
+                self.emit("step", step=self.step, loaded=dict(self.loaded_rows))
+                step()
+        except Exception:
+            if self.run_id is not None:
+                self.conn.rollback()
+                self.finish_run("failed")
+            raise
+        if self.run_id is not None:
+            self.finish_run("completed")
+        self.emit("step", step="done", loaded=dict(self.loaded_rows))
         logger.info("Заполнение базы данных завершено успешно!")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Заполнение базы данных тестовыми данными")
+    parser.add_argument("--mode", choices=LOAD_MODES,
+                        default=os.getenv("LOAD_MODE", LOAD_MODE),
+                        help="Способ вставки: COPY FROM STDIN или executemany")
+    parser.add_argument("--chunk-size", type=int,
+                        default=int(os.getenv("LOAD_CHUNK_SIZE", CHUNK_SIZE)),
+                        help="Размер порции строк, передаваемой в БД за раз")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("LOAD_WORKERS", 1)),
+                        help="Число процессов, генерирующих партиции данных")
+    parser.add_argument("--seed", type=int,
+                        default=int(os.environ["LOAD_SEED"]) if os.getenv(
+                            "LOAD_SEED") else None,
+                        help="Базовое зерно генератора (партиции получают производные зёрна)")
+    parser.add_argument("--fast", action="store_true",
+                        default=os.getenv("LOAD_FAST") == "1",
+                        help="Отключить триггеры аудита, total_cost и статуса оборудования "
+                             "на время загрузки и пересчитать результат одним запросом")
+    parser.add_argument("--audit-summary", action="store_true",
+                        default=os.getenv("LOAD_AUDIT_SUMMARY") == "1",
+                        help="В режиме --fast записать в audit_log по одной сводной записи на таблицу")
+    parser.add_argument("--verify-sample", type=int,
+                        default=int(os.getenv("LOAD_VERIFY_SAMPLE", VERIFY_SAMPLE)),
+                        help="Сколько аренд сверить с построчными триггерами после --fast (0 — без проверки)")
+    parser.add_argument("--incremental", action="store_true",
+                        default=os.getenv("LOAD_INCREMENTAL") == "1",
+                        help="Писать контрольные точки и продолжить прерванную инкрементальную загрузку")
+    parser.add_argument("--append", action="store_true",
+                        help="Добавить к существующим данным только заданные объёмы "
+                             "(остальные считаются нулевыми); включает --incremental")
+    scale_args = (
+        ("--clients", "users_clients", "NUM_USERS_CLIENTS"),
+        ("--sellers", "users_sellers", "NUM_USERS_SELLERS"),
+        ("--admins", "users_admins", "NUM_USERS_ADMINS"),
+        ("--equipment", "equipment", "NUM_EQUIPMENT"),
+        ("--rentals", "rentals", "NUM_RENTALS"),
+        ("--payments", "payments", "NUM_PAYMENTS"),
+    )
+    for flag, key, env in scale_args:
+        parser.add_argument(flag, dest=key, type=int,
+                            default=int(os.environ[env]) if os.getenv(env) else None,
+                            help=f"Количество записей (переменная {env}, по умолчанию {DEFAULT_SCALE[key]})")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
     load_dotenv()
+    args = parse_args()
     DATABASE_URL = os.getenv("DATABASE_URL")
 
     if not DATABASE_URL:
         raise ValueError("DATABASE_URL не задан!")
 
-    parsed = urlparse(DATABASE_URL)
-    db_config = {
-        'host': parsed.hostname,
-        'port': parsed.port or 5432,
-        'database': parsed.path[1:],
-        'user': parsed.username,
-        'password': parsed.password
-    }
+    db_config = db_config_from_url(DATABASE_URL)
 
-    filler = DatabaseFiller(db_config)
+    scale = {key: getattr(args, key) for key in DEFAULT_SCALE
+             if getattr(args, key) is not None}
+    filler = DatabaseFiller(db_config, mode=args.mode,
+                            chunk_size=args.chunk_size, scale=scale,
+                            workers=args.workers, seed=args.seed,
+                            fast=args.fast, audit_summary=args.audit_summary,
+                            verify_sample=args.verify_sample,
+                            incremental=args.incremental, append=args.append)
     for i in range(20):
         try:
             filler.connect()
@@ -463,6 +1122,8 @@ if __name__ == "__main__":
     try:
         filler.fill_all()
         logger.info("Скрипт завершён успешно")
+    except LoadLockedError as e:
+        logger.error(str(e))
     except Exception as e:
         logger.error(f"Ошибка при заполнении: {e}", exc_info=True)
         if filler.conn:
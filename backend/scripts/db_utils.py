@@ -0,0 +1,12 @@
+from urllib.parse import urlparse
+
+
+def db_config_from_url(url):
+    parsed = urlparse(url)
+    return {
+        'host': parsed.hostname,
+        'port': parsed.port or 5432,
+        'database': parsed.path[1:],
+        'user': parsed.username,
+        'password': parsed.password
+    }
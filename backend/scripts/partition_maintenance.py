@@ -0,0 +1,143 @@
+import psycopg2
+import argparse
+import gzip
+import logging
+import os
+import sys
+from dotenv import load_dotenv
+from pathlib import Path
+
+from db_utils import db_config_from_url
+
+
+PARTITIONED_TABLES = ("audit_log", "rentals")
+FUTURE_MONTHS = 3
+AUDIT_RETENTION_MONTHS = 12
+ARCHIVE_DIR = "./archive/audit_log"
+
+
+LOG_DIR = Path("./app/logs")
+LOG_DIR.mkdir(exist_ok=True)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[
+        logging.FileHandler(
+            LOG_DIR / "partition_maintenance.log", encoding="utf-8"),
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+
+def is_partitioned(cur, table):
+    cur.execute(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def ensure_future_partitions(conn, months):
+    with conn.cursor() as cur:
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(cur, table):
+                logger.info(f"{table}: таблица не партиционирована, пропуск")
+                continue
+            cur.execute("""
+                SELECT create_monthly_partitions(
+                    %s,
+                    date_trunc('month', current_date)::date,
+                    (date_trunc('month', current_date) + make_interval(months => %s))::date
+                )
+            """, (table, months + 1))
+            created = cur.fetchone()[0]
+            conn.commit()
+            logger.info(f"{table}: создано партиций на будущее: {created}")
+
+
+def archive_old_audit_partitions(conn, keep_months, archive_dir, dry_run=False):
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+
+    with conn.cursor() as cur:
+        if not is_partitioned(cur, "audit_log"):
+            logger.info("audit_log: таблица не партиционирована, пропуск")
+            return []
+
+        cur.execute("""
+            SELECT partition_name, month_start
+            FROM list_monthly_partitions('audit_log')
+            WHERE month_start < (date_trunc('month', current_date)
+                                 - make_interval(months => %s))::date
+            ORDER BY month_start
+        """, (keep_months,))
+        partitions = cur.fetchall()
+
+    archived = []
+    for name, month_start in partitions:
+        path = archive_dir / f"{name}.csv.gz"
+        if dry_run:
+            logger.info(f"{name} ({month_start:%Y-%m}) будет выгружена в {path}")
+            continue
+
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f'ALTER TABLE audit_log DETACH PARTITION "{name}"')
+                with gzip.open(tmp_path, "wt", encoding="utf-8") as archive:
+                    cur.copy_expert(
+                        f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER)', archive)
+                cur.execute(f'DROP TABLE "{name}"')
+            tmp_path.replace(path)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        archived.append(path)
+        logger.info(
+            f"{name} ({month_start:%Y-%m}) отсоединена и выгружена в {path} ({path.stat().st_size} байт)")
+
+    return archived
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Обслуживание партиций audit_log и rentals")
+    parser.add_argument("--future-months", type=int,
+                        default=int(os.getenv(
+                            "PARTITION_FUTURE_MONTHS", FUTURE_MONTHS)),
+                        help="На сколько месяцев вперёд создавать партиции")
+    parser.add_argument("--keep-months", type=int,
+                        default=int(os.getenv(
+                            "AUDIT_RETENTION_MONTHS", AUDIT_RETENTION_MONTHS)),
+                        help="Сколько полных месяцев аудита хранить в БД")
+    parser.add_argument("--archive-dir",
+                        default=os.getenv("AUDIT_ARCHIVE_DIR", ARCHIVE_DIR),
+                        help="Каталог для сжатых выгрузок отсоединённых партиций")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Только показать партиции, подлежащие архивации")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    args = parse_args()
+    DATABASE_URL = os.getenv("DATABASE_URL")
+
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL не задан!")
+
+    conn = psycopg2.connect(**db_config_from_url(DATABASE_URL))
+    try:
+        ensure_future_partitions(conn, args.future_months)
+        archive_old_audit_partitions(
+            conn, args.keep_months, args.archive_dir, args.dry_run)
+        logger.info("Обслуживание партиций завершено")
+    except Exception as e:
+        logger.error(f"Ошибка обслуживания партиций: {e}", exc_info=True)
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,408 @@
+import argparse
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+import psycopg2
+from dotenv import load_dotenv
+
+from bench_api import create_database, database_url, seed_database
+from data_load import DEFAULT_SCALE
+from db_utils import db_config_from_url
+
+
+INDEX_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "database", "init", "05-index.sql")
+BASELINE = os.path.join(os.path.dirname(__file__), "..", "..", "database", "plans", "baseline.json")
+PLAN_DB = "cp_plans"
+SEED = 1
+# Объём, при котором планировщик уже выбирает индексы вместо полного чтения
+PLAN_SCALE = {**DEFAULT_SCALE, "users_clients": 3000, "equipment": 3000,
+              "rentals": 30000, "payments": 20000}
+TOLERANCE = 0.25
+MIN_BLOCKS = 50
+SUGGEST_MIN_ROWS = 1000
+SUGGEST_MIN_REMOVED = 0.9
+
+# Запросы отчётов и функций, планы которых проверяются
+QUERIES = {
+    "v_active_rentals": "select * from v_active_rentals limit 20 offset 10",
+    "v_active_rentals_keyset": """
+        select * from v_active_rentals
+        where (end_date, rental_id) > (current_date, 0)
+        order by end_date, rental_id
+        limit 20
+    """,
+    "v_overdue_rentals": "select * from v_overdue_rentals",
+    "v_client_stats": "select * from v_client_stats limit 50",
+    "v_monthly_revenue": "select * from v_monthly_revenue",
+    "get_rentals_period_report": "select * from get_rentals_period_report(current_date - 30, current_date)",
+    "get_rentals_ending_soon": "select * from get_rentals_ending_soon(3)",
+    "calculate_late_fee": """
+        select calculate_late_fee(id) from rentals
+        where status = 'Просрочен срок аренды'
+        order by id
+        limit 20
+    """,
+    "calculate_late_fees": "select * from calculate_late_fees()",
+    "get_avg_rental_days": "select get_avg_rental_days(id) from equipment order by id limit 20",
+    "category_equipment": """
+        select e.id, e.inventory_number
+        from equipment e
+        where e.category_id in (
+            select descendant_id from equipment_category_closure
+            where ancestor_id = 1
+        )
+    """,
+    "client_rentals": """
+        select * from rentals
+        where user_id = (select min(id) from users where role = 'Клиент')
+    """,
+    "employee_rentals": """
+        select count(*) from rentals
+        where employee_id = (select min(id) from users where role = 'Продавец')
+    """,
+    "equipment_rentals": """
+        select r.id, r.start_date, r.end_date
+        from rental_items ri
+        join rentals r on r.id = ri.rental_id
+        where ri.equipment_id = (select min(id) from equipment)
+    """,
+}
+
+CANDIDATE_RE = re.compile(r"create\s+index\s+if\s+not\s+exists\s+(\w+)\s+on\s+(\w+)", re.IGNORECASE)
+
+UNINDEXED_FOREIGN_KEYS_SQL = """
+    select c.conrelid::regclass::text, a.attname, c.confrelid::regclass::text, cl.reltuples::bigint
+    from pg_constraint c
+    join pg_class cl on cl.oid = c.conrelid
+    join pg_attribute a on a.attrelid = c.conrelid and a.attnum = c.conkey[1]
+    where c.contype = 'f'
+      and array_length(c.conkey, 1) = 1
+      and cl.reltuples >= %s
+      and not exists (
+          select 1 from pg_index i
+          where i.indrelid = c.conrelid and i.indkey[0] = c.conkey[1]
+      )
+    order by cl.reltuples desc, 1, 2
+"""
+
+
+def vacuum(url):
+    # Карта видимости влияет на Index Only Scan и число буферов, поэтому
+    # эталон и проверка не должны зависеть от того, успел ли autovacuum
+    conn = psycopg2.connect(**db_config_from_url(url))
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("VACUUM (ANALYZE)")
+    conn.close()
+
+
+def candidate_indexes():
+    with open(INDEX_FILE, encoding="utf-8") as f:
+        return CANDIDATE_RE.findall(f.read())
+
+
+def prepare_session(cur):
+    # plpgsql после пяти вызовов переходит на общий план без учёта значений
+    # параметров, и число буферов зависело бы от порядка запросов
+    cur.execute("SET plan_cache_mode = force_custom_plan")
+    cur.connection.commit()
+
+
+def enable_auto_explain(cur):
+    # План выражений внутри plpgsql-функций виден только через
+    # auto_explain: его вывод приходит клиенту как сообщения LOG
+    try:
+        cur.execute("LOAD 'auto_explain'")
+    except psycopg2.Error:
+        cur.connection.rollback()
+        return False
+    for setting, value in (("auto_explain.log_min_duration", "0"),
+                           ("auto_explain.log_nested_statements", "on"),
+                           ("auto_explain.log_analyze", "on"),
+                           ("auto_explain.log_buffers", "on"),
+                           ("auto_explain.log_format", "json"),
+                           ("client_min_messages", "log")):
+        cur.execute("SELECT set_config(%s, %s, false)", (setting, value))
+    cur.connection.commit()
+    return True
+
+
+def nested_plans(conn):
+    plans = []
+    for notice in conn.notices:
+        if "plan:" not in notice:
+            continue
+        try:
+            plan = json.loads(notice.split("plan:", 1)[1])
+        except ValueError:
+            continue
+        # План самого EXPLAIN уже есть в его результате
+        if not plan.get("Query Text", "").lstrip().upper().startswith("EXPLAIN"):
+            plans.append(plan["Plan"])
+    del conn.notices[:]
+    return plans
+
+
+def table_scans(cur):
+    # Счётчики текущей транзакции учитывают и выражения внутри функций,
+    # план которых EXPLAIN не показывает
+    cur.execute("SELECT relname, seq_scan, idx_scan FROM pg_stat_xact_user_tables")
+    return {relation: (seq_scan, idx_scan or 0) for relation, seq_scan, idx_scan in cur.fetchall()}
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+def explain(cur, sql, auto_explain):
+    # Первый прогон прогревает кэш и проставляет hint-биты, в зачёт идёт второй
+    for _ in range(2):
+        before = table_scans(cur)
+        del cur.connection.notices[:]
+        cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+        result = cur.fetchone()[0][0]
+    after = table_scans(cur)
+    plans = [result["Plan"]]
+    if auto_explain:
+        plans += nested_plans(cur.connection)
+
+    root = result["Plan"]
+    nodes = [node for plan in plans for node in walk(plan)]
+    scans = {}
+    for relation, (seq_scan, idx_scan) in after.items():
+        seq_before, idx_before = before.get(relation, (0, 0))
+        if seq_scan > seq_before or idx_scan > idx_before:
+            scans[relation] = {"seq_scan": seq_scan - seq_before, "idx_scan": idx_scan - idx_before}
+    return {
+        "shape": [" ".join(filter(None, (node["Node Type"], node.get("Relation Name"),
+                                         node.get("Index Name"))))
+                  for node in nodes],
+        "scans": dict(sorted(scans.items())),
+        "buffers": root.get("Shared Hit Blocks", 0) + root.get("Shared Read Blocks", 0),
+        "execution_ms": result["Execution Time"],
+        "filtered_seq_scans": [
+            {"relation": node["Relation Name"], "filter": node["Filter"],
+             "rows": node["Actual Rows"] * node["Actual Loops"],
+             "removed": node.get("Rows Removed by Filter", 0) * node["Actual Loops"]}
+            for node in nodes
+            if node["Node Type"] == "Seq Scan" and "Filter" in node],
+    }
+
+
+def run_queries(cur, auto_explain):
+    return {name: explain(cur, sql, auto_explain) for name, sql in QUERIES.items()}
+
+
+def seq_scan_regressions(base, current):
+    return [relation for relation, counts in current["scans"].items()
+            if counts["seq_scan"] and relation in base["scans"]
+            and not base["scans"][relation]["seq_scan"]]
+
+
+def buffers_regressed(base, current, tolerance, min_blocks):
+    return (current["buffers"] > base["buffers"] * (1 + tolerance)
+            and current["buffers"] - base["buffers"] >= min_blocks)
+
+
+def check_baseline(baseline, results, tolerance, min_blocks, compare_shapes=True):
+    failures = []
+    for name, current in results.items():
+        base = baseline["queries"].get(name)
+        if base is None:
+            print(f"  {name:<28} нет в эталоне")
+            continue
+        problems = []
+        for relation in seq_scan_regressions(base, current):
+            problems.append(f"Seq Scan по {relation}")
+        if buffers_regressed(base, current, tolerance, min_blocks):
+            problems.append(f"буферы {base['buffers']} -> {current['buffers']}")
+        note = ("" if problems or not compare_shapes or current["shape"] == base["shape"]
+                else "  (план изменился)")
+        status = "РЕГРЕССИЯ: " + ", ".join(problems) if problems else "ok"
+        print(f"  {name:<28} буферы {base['buffers']:>8} -> {current['buffers']:>8}  {status}{note}")
+        if problems:
+            failures.append((name, problems))
+    return failures
+
+
+def candidate_matrix(conn, results, auto_explain, tolerance, min_blocks):
+    matrix = {}
+    with conn.cursor() as cur:
+        for index, table in candidate_indexes():
+            cur.execute("SELECT to_regclass(%s)", (index,))
+            if cur.fetchone()[0] is None:
+                print(f"  {index}: индекса нет в базе")
+                continue
+            # DROP INDEX транзакционный: индекс возвращается откатом
+            cur.execute(f"DROP INDEX {index}")
+            without = run_queries(cur, auto_explain)
+            conn.rollback()
+
+            affected = {}
+            for name, plan in without.items():
+                with_index = results[name]
+                if (with_index["shape"] != plan["shape"]
+                        or seq_scan_regressions(with_index, plan)
+                        or buffers_regressed(with_index, plan, tolerance, min_blocks)):
+                    affected[name] = {"buffers_with": with_index["buffers"],
+                                      "buffers_without": plan["buffers"],
+                                      "seq_scans_without": seq_scan_regressions(with_index, plan)}
+            matrix[index] = {"table": table, "queries": affected}
+            if not affected:
+                print(f"  {index} ({table}): ни один запрос не меняется без индекса")
+                continue
+            print(f"  {index} ({table}):")
+            for name, change in affected.items():
+                seq = f", без индекса Seq Scan по {', '.join(change['seq_scans_without'])}" \
+                    if change["seq_scans_without"] else ""
+                print(f"    {name:<28} буферы {change['buffers_with']:>8} с индексом, "
+                      f"{change['buffers_without']:>8} без{seq}")
+    return matrix
+
+
+def suggest_indexes(cur, results):
+    suggestions = {}
+
+    def suggest(relation, columns, reason):
+        sql = (f"create index if not exists idx_{relation}_{'_'.join(columns)} "
+               f"on {relation} ({', '.join(columns)});")
+        suggestions.setdefault(sql, []).append(reason)
+
+    cur.execute(UNINDEXED_FOREIGN_KEYS_SQL, (SUGGEST_MIN_ROWS,))
+    for table, column, referenced, rows in cur.fetchall():
+        suggest(table, [column], f"внешний ключ на {referenced} без индекса, строк ~{rows}")
+
+    columns = {}
+    for name, plan in results.items():
+        for scan in plan["filtered_seq_scans"]:
+            total = scan["rows"] + scan["removed"]
+            if total < SUGGEST_MIN_ROWS or scan["removed"] / total < SUGGEST_MIN_REMOVED:
+                continue
+            relation = scan["relation"]
+            if relation not in columns:
+                cur.execute("""
+                    SELECT attname FROM pg_attribute
+                    WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+                """, (relation,))
+                columns[relation] = [row[0] for row in cur.fetchall()]
+            used = [column for column in columns[relation]
+                    if re.search(rf"\b{column}\b", scan["filter"])]
+            if used:
+                suggest(relation, used, f"{name}: Seq Scan отбрасывает {scan['removed']} "
+                                        f"из {total} строк, Filter: {scan['filter']}")
+    cur.connection.rollback()
+    return [{"sql": sql, "reasons": reasons} for sql, reasons in suggestions.items()]
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Проверка планов запросов отчётов против эталона и влияния индексов")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--db-name", default=PLAN_DB,
+                        help="База проверки; пересоздаётся из database/init/")
+    parser.add_argument("--reuse", action="store_true",
+                        help="Не пересоздавать и не заполнять базу проверки")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Записать текущие планы как эталон")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Допустимый рост числа буферов (доля)")
+    parser.add_argument("--min-blocks", type=int, default=MIN_BLOCKS,
+                        help="Рост числа буферов меньше этого не считается регрессией")
+    parser.add_argument("--skip-candidates", action="store_true",
+                        help="Не сравнивать планы без каждого индекса из 05-index.sql")
+    parser.add_argument("--output", help="Файл JSON с планами, матрицей индексов и подсказками")
+    for flag, key in (("--clients", "users_clients"), ("--sellers", "users_sellers"),
+                      ("--equipment", "equipment"), ("--rentals", "rentals"),
+                      ("--payments", "payments")):
+        parser.add_argument(flag, dest=key, type=int)
+    args = parser.parse_args()
+    if not args.database_url:
+        raise ValueError("DATABASE_URL не задан!")
+
+    scale = {key: getattr(args, key) if getattr(args, key, None) is not None else value
+             for key, value in PLAN_SCALE.items()}
+    if args.reuse:
+        url = database_url(args.database_url, args.db_name)
+    else:
+        url = create_database(args.database_url, args.db_name)
+        seed_database(url, scale, args.seed, args.workers)
+        vacuum(url)
+
+    conn = psycopg2.connect(**db_config_from_url(url))
+    with conn.cursor() as cur:
+        prepare_session(cur)
+        auto_explain = enable_auto_explain(cur)
+        if not auto_explain:
+            print("auto_explain недоступен: выражения внутри plpgsql-функций проверяются только по буферам и счётчикам сканирований")
+        cur.execute("SHOW server_version")
+        version = cur.fetchone()[0]
+        results = run_queries(cur, auto_explain)
+        conn.rollback()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "postgres": version,
+            "scale": None if args.reuse else scale,
+            "seed": args.seed,
+            "auto_explain": auto_explain,
+        },
+        "queries": results,
+    }
+
+    failures = []
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Эталон записан в {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not args.reuse and baseline["meta"]["scale"] not in (None, scale):
+            print(f"Эталон снят на другом объёме данных: {baseline['meta']['scale']}")
+        # Без auto_explain форма плана функции — один Function Scan: при разной
+        # настройке эталона и прогона формы не сравниваются
+        compare_shapes = baseline["meta"].get("auto_explain", False) == auto_explain
+        if not compare_shapes:
+            print("Эталон и прогон сняты с разной настройкой auto_explain: изменения формы планов не отмечаются")
+        print(f"Сравнение с эталоном {args.baseline}:")
+        failures = check_baseline(baseline, results, args.tolerance, args.min_blocks, compare_shapes)
+    else:
+        print(f"Эталона {args.baseline} нет, запустите с --update-baseline")
+
+    if not args.skip_candidates:
+        print("Запросы без каждого индекса из 05-index.sql:")
+        report["candidates"] = candidate_matrix(
+            conn, results, auto_explain, args.tolerance, args.min_blocks)
+
+    with conn.cursor() as cur:
+        report["suggestions"] = suggest_indexes(cur, results)
+    conn.close()
+    if report["suggestions"]:
+        print("Возможно, не хватает индексов:")
+        for suggestion in report["suggestions"]:
+            print(f"  {suggestion['sql']}")
+            for reason in suggestion["reasons"]:
+                print(f"    -- {reason}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if failures:
+        print(f"Регрессий планов: {len(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+-- Количество операций на одну позицию аренды при пересчёте total_cost:
+-- построчные триггеры (прежняя версия) против триггеров уровня оператора
+-- с таблицами переходов (03-trigger.sql).
+-- Запуск на заполненной БД (нужны права суперпользователя для track_functions):
+--   psql -d cp -f database/benchmarks/01-total-cost-statements.sql
+-- Все изменения выполняются в одной транзакции и откатываются.
+
+begin;
+
+set local track_functions = 'pl';
+
+create temp table bench_snapshot (
+    label text primary key,
+    trigger_calls bigint,
+    recalculations bigint,
+    rentals_updates bigint,
+    audit_rows bigint,
+    items bigint
+) on commit drop;
+
+create function pg_temp.bench_snap(p_label text)
+returns void
+language sql
+as $$
+    insert into bench_snapshot
+    select 
+        p_label,
+        (select coalesce(sum(calls), 0) from pg_stat_xact_user_functions
+         where funcname in ('calculate_rental_total_cost_func', 'calculate_rental_total_cost_legacy_func')),
+        (select coalesce(sum(calls), 0) from pg_stat_xact_user_functions
+         where funcname = 'recalculate_rental_total_cost'),
+        (select coalesce(n_tup_upd, 0) from pg_stat_xact_user_tables where relname = 'rentals'),
+        (select coalesce(n_tup_ins, 0) from pg_stat_xact_user_tables where relname = 'audit_log'),
+        (select coalesce(n_tup_ins, 0) from pg_stat_xact_user_tables where relname = 'rental_items');
+$$;
+
+-- crud.create_rental: одна аренда, затем один INSERT на четыре позиции
+create function pg_temp.bench_create_rental()
+returns void
+language plpgsql
+as $$
+declare
+    new_rental_id int;
+begin
+    insert into rentals (user_id, employee_id, start_date, end_date, return_date, status)
+    select 
+        (select min(id) from users where role = 'Клиент'),
+        (select min(id) from users where role = 'Продавец'),
+        date '2000-01-01', date '2000-01-10', date '2000-01-10', 'Завершён'
+    returning id into new_rental_id;
+
+    insert into rental_items (rental_id, equipment_id, damage_fee)
+    select new_rental_id, e.id, 0
+    from (select id from equipment order by id limit 4) e;
+end;
+$$;
+
+-- загрузчик данных: 1000 аренд одним оператором, затем позиции одним оператором
+create function pg_temp.bench_bulk_load()
+returns void
+language plpgsql
+as $$
+declare
+    first_rental_id int;
+begin
+    select coalesce(max(id), 0) + 1 into first_rental_id from rentals;
+
+    insert into rentals (user_id, employee_id, start_date, end_date, return_date, status)
+    select 
+        (select min(id) from users where role = 'Клиент'),
+        (select min(id) from users where role = 'Продавец'),
+        date '2000-01-01' + g, date '2000-01-10' + g, date '2000-01-10' + g, 'Завершён'
+    from generate_series(1, 1000) g;
+
+    insert into rental_items (rental_id, equipment_id, damage_fee)
+    select r.id, e.id, 0
+    from rentals r
+    cross join (select id from equipment order by id limit 3) e
+    where r.id >= first_rental_id;
+end;
+$$;
+
+
+-- после: триггеры уровня оператора
+select pg_temp.bench_snap('after: start');
+select pg_temp.bench_create_rental();
+select pg_temp.bench_snap('after: create_rental');
+select pg_temp.bench_bulk_load();
+select pg_temp.bench_snap('after: bulk_load');
+
+
+-- до: прежние построчные триггеры
+create function calculate_rental_total_cost_legacy_func()
+returns trigger
+language plpgsql
+as $$
+declare
+    target_rental_id int;
+    actual_days int;
+    new_total decimal(10,2);
+begin
+    if tg_table_name = 'rental_items' then
+        if tg_op = 'DELETE' then
+            target_rental_id := old.rental_id;
+        else
+            target_rental_id := new.rental_id;
+        end if;
+    else
+        target_rental_id := new.id;
+    end if;
+
+    select 
+        case 
+            when r.return_date is not null and r.return_date >= r.start_date then 
+                r.return_date - r.start_date + 1
+            else 
+                r.end_date - r.start_date + 1
+        end
+    into actual_days
+    from rentals r
+    where r.id = target_rental_id;
+
+    if actual_days is null or actual_days < 1 then
+        actual_days := 0;
+    end if;
+
+    select coalesce(sum(em.rental_price_per_day * actual_days + ri.damage_fee), 0)
+    into new_total
+    from rental_items ri
+    join equipment e on ri.equipment_id = e.id
+    join equipment_models em on e.model_id = em.id
+    where ri.rental_id = target_rental_id;
+
+    update rentals
+    set total_cost = new_total
+    where id = target_rental_id;
+
+    return null;
+end;
+$$;
+
+drop trigger calculate_rental_total_cost_items_insert_trigger on rental_items;
+drop trigger calculate_rental_total_cost_insert_trigger on rentals;
+
+create trigger calculate_rental_total_cost_items_legacy_trigger
+after insert on rental_items
+for each row
+execute function calculate_rental_total_cost_legacy_func();
+
+create trigger calculate_rental_total_cost_insert_legacy_trigger
+after insert on rentals
+for each row
+execute function calculate_rental_total_cost_legacy_func();
+
+select pg_temp.bench_snap('before: start');
+select pg_temp.bench_create_rental();
+select pg_temp.bench_snap('before: create_rental');
+select pg_temp.bench_bulk_load();
+select pg_temp.bench_snap('before: bulk_load');
+
+
+select 
+    split_part(s.label, ':', 1) as variant,
+    trim(split_part(s.label, ':', 2)) as scenario,
+    s.items - p.items as items,
+    s.trigger_calls - p.trigger_calls as trigger_calls,
+    s.recalculations - p.recalculations as recalculations,
+    s.rentals_updates - p.rentals_updates as rentals_updates,
+    s.audit_rows - p.audit_rows as audit_rows,
+    round((s.trigger_calls - p.trigger_calls + s.recalculations - p.recalculations
+        + s.rentals_updates - p.rentals_updates + s.audit_rows - p.audit_rows)::numeric
+        / nullif(s.items - p.items, 0), 2) as operations_per_item
+from bench_snapshot s
+join bench_snapshot p on p.label = case s.label
+    when 'after: create_rental' then 'after: start'
+    when 'after: bulk_load' then 'after: create_rental'
+    when 'before: create_rental' then 'before: start'
+    when 'before: bulk_load' then 'before: create_rental'
+end
+order by variant desc, scenario;
+
+rollback;
@@ -1,8 +1,15 @@
-do $$ 
-declare 
+do $$
+declare
     r record;
 begin
-    for r in (select tablename from pg_tables where schemaname = 'public') loop
+    -- Настройки, заполняемые при создании схемы, не очищаются, а версии
+    -- кэшей только растут: иначе процесс API с закэшированной версией не
+    -- заметит, что данные поменялись
+    for r in (
+        select tablename from pg_tables
+        where schemaname = 'public'
+        and tablename not in ('audit_settings', 'cache_versions')
+    ) loop
         execute 'TRUNCATE TABLE ' || quote_ident(r.tablename) || ' RESTART IDENTITY CASCADE';
     end loop;
 end $$;
\ No newline at end of file
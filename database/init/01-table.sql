@@ -22,16 +22,33 @@ create table equipment_categories (
     description text,
     parent_id int default null,
     created_at timestamp default current_timestamp,
+    search_vector tsvector generated always as (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'C')
+    ) stored,
     foreign key (parent_id) references equipment_categories(id) on update cascade on delete set null
 );
 
+create table equipment_category_closure (
+    ancestor_id int not null,
+    descendant_id int not null,
+    depth int not null check (depth >= 0),
+    primary key (ancestor_id, descendant_id),
+    foreign key (ancestor_id) references equipment_categories(id) on update cascade on delete cascade,
+    foreign key (descendant_id) references equipment_categories(id) on update cascade on delete cascade
+);
+
 create table equipment_models (
     id serial primary key,
     name varchar(100) not null,
     description text,
     brand varchar(100),
     rental_price_per_day decimal(10, 2) not null check (rental_price_per_day >= 0),
-    deposit_amount decimal(10, 2) default 0 check (deposit_amount >= 0)
+    deposit_amount decimal(10, 2) default 0 check (deposit_amount >= 0),
+    search_vector tsvector generated always as (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(brand, '')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'D')
+    ) stored
 );
 
 create table equipment (
@@ -45,6 +62,12 @@ create table equipment (
     foreign key (model_id) references equipment_models(id) on update cascade on delete restrict
 );
 
+create table equipment_search (
+    equipment_id int primary key,
+    search_vector tsvector not null,
+    foreign key (equipment_id) references equipment(id) on update cascade on delete cascade
+);
+
 create table rentals (
     id serial primary key,
     user_id int not null,
@@ -68,10 +91,16 @@ create table rental_items (
     rental_id int not null,
     equipment_id int not null,
     damage_fee decimal(10, 2) default 0 check (damage_fee >= 0),
+    period daterange,
     created_at timestamp default current_timestamp,
     foreign key (rental_id) references rentals(id) on update cascade on delete cascade,
     foreign key (equipment_id) references equipment(id) on update cascade on delete restrict,
-    unique (rental_id, equipment_id) 
+    unique (rental_id, equipment_id),
+    -- int4range вместо "equipment_id with =" не требует расширения btree_gist
+    constraint rental_items_equipment_period_excl exclude using gist (
+        int4range(equipment_id, equipment_id, '[]') with &&,
+        period with &&
+    )
 );
 
 create table payments (
@@ -114,3 +143,76 @@ create table audit_log (
     new_data jsonb,
     changed_at timestamp default current_timestamp
 );
+
+create unlogged table audit_log_queue (
+    id bigserial primary key,
+    table_name varchar(50) not null,
+    record_id int not null,
+    operation varchar(10) not null,
+    old_data jsonb,
+    new_data jsonb,
+    changed_at timestamp default current_timestamp
+);
+
+create table audit_settings (
+    table_name varchar(50) primary key,
+    level varchar(10) not null default 'diff' check (level in ('full', 'diff', 'minimal', 'off')),
+    sample_rate decimal(4,3) not null default 1 check (sample_rate between 0 and 1)
+);
+
+insert into audit_settings (table_name, level, sample_rate) values
+    ('users', 'diff', 1),
+    ('equipment', 'diff', 1),
+    ('rentals', 'diff', 1),
+    ('payments', 'diff', 1),
+    ('repairs', 'diff', 1);
+
+create table cache_versions (
+    name varchar(50) primary key,
+    version bigint not null default 0,
+    changed_at timestamptz not null default current_timestamp
+);
+
+insert into cache_versions (name) values
+    ('equipment_categories');
+
+create table batch_jobs (
+    id serial primary key,
+    kind varchar(30) not null,
+    status varchar(20) not null default 'queued'
+        check (status in ('queued', 'running', 'succeeded', 'failed', 'cancelled')),
+    params jsonb not null default '{}',
+    idempotency_key varchar(100) unique,
+    step varchar(50),
+    planned jsonb not null default '{}',
+    loaded jsonb not null default '{}',
+    cancel_requested boolean not null default false,
+    error text,
+    created_at timestamptz not null default current_timestamp,
+    started_at timestamptz,
+    updated_at timestamptz not null default current_timestamp,
+    finished_at timestamptz
+);
+
+create unique index batch_jobs_active_kind on batch_jobs (kind)
+where status in ('queued', 'running');
+
+create table data_load_runs (
+    id serial primary key,
+    status varchar(20) not null default 'running'
+        check (status in ('running', 'completed', 'failed')),
+    params jsonb not null,
+    started_at timestamptz not null default current_timestamp,
+    updated_at timestamptz not null default current_timestamp,
+    finished_at timestamptz
+);
+
+create table data_load_checkpoints (
+    run_id int not null references data_load_runs(id) on delete cascade,
+    step varchar(50) not null,
+    partition int not null default 0,
+    next_id bigint,
+    completed boolean not null default false,
+    updated_at timestamptz not null default current_timestamp,
+    primary key (run_id, step, partition)
+);
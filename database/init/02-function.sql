@@ -37,6 +37,119 @@ end;
 $$;
 
 
+create or replace function calculate_late_fees(p_rental_ids int[] default null, p_daily_fee decimal(10,2) default 500.00, p_fixed_fee decimal(10,2) default 1000.00)
+returns table (
+    rental_id int,
+    end_date date,
+    status varchar(25),
+    days_overdue int,
+    total_cost decimal(10,2),
+    late_fee decimal(10,2),
+    projected_total decimal(12,2)
+)
+language sql
+stable
+as $$
+    with targets as (
+        select r.id, r.end_date, r.status, r.total_cost
+        from rentals r
+        where p_rental_ids is null
+        and r.status = 'Просрочен срок аренды'
+        union all
+        select r.id, r.end_date, r.status, r.total_cost
+        from rentals r
+        where r.id in (select distinct unnest(p_rental_ids))
+    ),
+    fees as (
+        select
+            t.*,
+            case
+                when t.status = 'Просрочен срок аренды' and t.end_date < current_date then
+                    current_date - t.end_date
+                else 0
+            end as late_days
+        from targets t
+    )
+    select
+        f.id,
+        f.end_date,
+        f.status,
+        f.late_days,
+        f.total_cost,
+        case
+            when f.late_days > 0 then p_fixed_fee + f.late_days * p_daily_fee
+            else 0
+        end::decimal(10,2),
+        (coalesce(f.total_cost, 0) + case
+            when f.late_days > 0 then p_fixed_fee + f.late_days * p_daily_fee
+            else 0
+        end)::decimal(12,2)
+    from fees f;
+$$;
+
+
+create or replace function get_equipment_utilization(p_start_date date default null, p_end_date date default null, p_equipment_ids int[] default null)
+returns table (
+    equipment_id int,
+    inventory_number varchar(50),
+    model_name varchar(100),
+    rentals_count int,
+    booked_days int,
+    utilization decimal(6,4),
+    avg_rental_days decimal(5,1),
+    projected_revenue decimal(12,2)
+)
+language sql
+stable
+as $$
+    with usage as (
+        select
+            ri.equipment_id,
+            count(*) as rentals_count,
+            sum(b.days) as booked_days,
+            avg(r.end_date - r.start_date + 1) filter (where r.status = 'Завершён') as avg_rental_days,
+            sum(em.rental_price_per_day * b.days) as projected_revenue
+        from (select daterange(p_start_date, p_end_date, '[]') as period) w
+        join rental_items ri on ri.period && w.period
+        join rentals r on r.id = ri.rental_id
+        join equipment e on e.id = ri.equipment_id
+        join equipment_models em on em.id = e.model_id
+        -- Период обрезается по границам окна, а занятость не возвращённой
+        -- просроченной аренды считается только по сегодняшний день: иначе
+        -- окно в будущем получало бы её дни или отрицательное число дней
+        cross join lateral (
+            select greatest(
+                least(
+                    coalesce(upper(ri.period) - 1, current_date),
+                    p_end_date,
+                    case when r.status = 'Просрочен срок аренды' and r.return_date is null then current_date end
+                ) - greatest(lower(ri.period), p_start_date) + 1,
+                0
+            ) as days
+        ) b
+        where (p_equipment_ids is null or ri.equipment_id = any(p_equipment_ids))
+        and b.days > 0
+        group by ri.equipment_id
+    )
+    select
+        e.id,
+        e.inventory_number,
+        em.name,
+        coalesce(u.rentals_count, 0)::int,
+        coalesce(u.booked_days, 0)::int,
+        case
+            when p_start_date is not null and p_end_date is not null then
+                round(coalesce(u.booked_days, 0)::decimal / (p_end_date - p_start_date + 1), 4)
+        end,
+        coalesce(u.avg_rental_days, 0)::decimal(5,1),
+        coalesce(u.projected_revenue, 0)::decimal(12,2)
+    from equipment e
+    join equipment_models em on em.id = e.model_id
+    left join usage u on u.equipment_id = e.id
+    where p_equipment_ids is null or e.id = any(p_equipment_ids);
+$$;
+
+
 create or replace function get_rentals_period_report(p_start_date date, p_end_date date)
 returns table (
     rental_id int,
@@ -63,12 +176,39 @@ begin
     join users u on r.user_id = u.id
     left join rental_items ri on r.id = ri.rental_id
     where r.start_date between p_start_date and p_end_date
-    group by r.id, u.name
+    group by r.id, r.start_date, r.end_date, r.status, r.total_cost, u.name
     order by r.start_date;
 end;
 $$;
 
 
+create or replace function get_monthly_revenue(p_start_date date, p_end_date date)
+returns table (
+    month timestamptz,
+    rental_count bigint,
+    equipment_count bigint,
+    total_revenue numeric,
+    damage_fees numeric
+)
+language sql
+stable
+as $$
+    select 
+        date_trunc('month', r.start_date) as month,
+        count(distinct r.id) as rental_count,
+        count(distinct ri.equipment_id) as equipment_count,
+        sum(r.total_cost) as total_revenue,
+        sum(ri.damage_fee) as damage_fees
+    from rentals r
+    left join rental_items ri on r.id = ri.rental_id
+    where r.status = 'Завершён'
+      and r.start_date >= date_trunc('month', p_start_date)::date
+      and r.start_date <= p_end_date
+    group by date_trunc('month', r.start_date)
+    order by month desc;
+$$;
+
+
 create or replace function get_rentals_ending_soon(p_days_left int default 2)
 returns table (
     rental_id int,
@@ -94,7 +234,339 @@ begin
     join users e on r.employee_id = e.id
     left join rental_items ri on r.id = ri.rental_id
     where r.status = 'Активен' and r.end_date between current_date and current_date + p_days_left
-    group by r.id, u.name, u.phone, e.name
+    group by r.id, r.end_date, u.name, u.phone, e.name
     order by r.end_date;
 end;
 $$;
+
+
+create or replace function recalculate_rental_total_cost(p_rental_ids int[])
+returns int
+language plpgsql
+as $$
+declare
+    updated_count int;
+begin
+    update rentals r
+    set total_cost = t.new_total
+    from (
+        select 
+            rr.id,
+            coalesce(sum(em.rental_price_per_day * greatest(
+                case 
+                    when rr.return_date is not null and rr.return_date >= rr.start_date then 
+                        rr.return_date - rr.start_date + 1
+                    else 
+                        rr.end_date - rr.start_date + 1
+                end, 0) + ri.damage_fee), 0) as new_total
+        from rentals rr
+        left join rental_items ri on rr.id = ri.rental_id
+        left join equipment e on ri.equipment_id = e.id
+        left join equipment_models em on e.model_id = em.id
+        where rr.id = any(p_rental_ids)
+        group by rr.id
+    ) t
+    where r.id = t.id and r.total_cost is distinct from t.new_total;
+
+    get diagnostics updated_count = row_count;
+    return updated_count;
+end;
+$$;
+
+
+create or replace function mark_rented_equipment(p_rental_ids int[])
+returns int
+language plpgsql
+as $$
+declare
+    updated_count int;
+begin
+    update equipment e
+    set status = 'В аренде'
+    where e.status <> 'В аренде'
+      and e.id in (
+        select ri.equipment_id
+        from rental_items ri
+        join rentals r on ri.rental_id = r.id
+        where r.id = any(p_rental_ids)
+          and r.status = 'Активен'
+    );
+
+    get diagnostics updated_count = row_count;
+    return updated_count;
+end;
+$$;
+
+
+create or replace function drain_audit_log_queue(p_batch_size int default 1000)
+returns int
+language plpgsql
+as $$
+declare
+    moved_count int;
+begin
+    with batch as (
+        delete from audit_log_queue
+        where id in (
+            select id
+            from audit_log_queue
+            order by id
+            limit p_batch_size
+            for update skip locked
+        )
+        returning id, table_name, record_id, operation, old_data, new_data, changed_at
+    )
+    insert into audit_log (table_name, record_id, operation, old_data, new_data, changed_at)
+    select table_name, record_id, operation, old_data, new_data, changed_at
+    from batch
+    order by id;
+
+    get diagnostics moved_count = row_count;
+    return moved_count;
+end;
+$$;
+
+
+create or replace function mark_overdue_rentals(p_batch_size int default 1000)
+returns int
+language plpgsql
+as $$
+declare
+    updated_count int;
+begin
+    update rentals r
+    set status = 'Просрочен срок аренды'
+    from (
+        select id, start_date
+        from rentals
+        where status = 'Активен'
+        and end_date < current_date
+        and return_date is null
+        order by end_date
+        limit p_batch_size
+        for update skip locked
+    ) due
+    where r.id = due.id
+    and r.start_date = due.start_date;
+
+    get diagnostics updated_count = row_count;
+    return updated_count;
+end;
+$$;
+
+
+create or replace procedure sweep_overdue_rentals(p_batch_size int default 1000)
+language plpgsql
+as $$
+declare
+    batch_count int;
+    total_count int := 0;
+    started_at timestamptz := clock_timestamp();
+begin
+    loop
+        batch_count := mark_overdue_rentals(p_batch_size);
+        total_count := total_count + batch_count;
+        commit;
+        exit when batch_count < p_batch_size;
+    end loop;
+
+    raise notice 'Переведено в просроченные: % аренд за % мс', total_count,
+        round(extract(epoch from clock_timestamp() - started_at) * 1000);
+end;
+$$;
+
+
+create or replace function rental_period(p_start_date date, p_end_date date, p_return_date date, p_status varchar)
+returns daterange
+language sql
+immutable
+as $$
+    select case
+        when p_status = 'Отменён' then null
+        when p_return_date is not null then daterange(p_start_date, p_return_date, '[]')
+        -- Не возвращённое после срока оборудование занято до возврата
+        when p_status = 'Просрочен срок аренды' then daterange(p_start_date, null, '[)')
+        else daterange(p_start_date, p_end_date, '[]')
+    end;
+$$;
+
+
+-- Занятость позиции аренды. Продление после end_date (просрочка или поздний
+-- возврат) не заходит на бронирование той же единицы, принятое раньше:
+-- период обрезается по его началу, иначе пометка просрочки или возврат
+-- нарушили бы исключающее ограничение
+create or replace function rental_item_period(p_equipment_id int, p_start_date date, p_end_date date,
+                                              p_return_date date, p_status varchar)
+returns daterange
+language sql
+stable
+as $$
+    select case
+        when upper_inf(p.period) or upper(p.period) > p_end_date + 1 then
+            daterange(lower(p.period), least(upper(p.period), (
+                select min(lower(ri.period))
+                from rental_items ri
+                where int4range(ri.equipment_id, ri.equipment_id, '[]') && int4range(p_equipment_id, p_equipment_id, '[]')
+                and ri.period && daterange(p_end_date, null, '()')
+                and lower(ri.period) > p_end_date
+            )), '[)')
+        else p.period
+    end
+    from (select rental_period(p_start_date, p_end_date, p_return_date, p_status) as period) p;
+$$;
+
+
+create or replace function is_equipment_available(p_equipment_id int, p_start_date date, p_end_date date)
+returns boolean
+language sql
+stable
+as $$
+    select exists (
+        select 1 from equipment
+        where id = p_equipment_id and status <> 'Списано'
+    )
+    and not exists (
+        select 1 from rental_items
+        where int4range(equipment_id, equipment_id, '[]') && int4range(p_equipment_id, p_equipment_id, '[]')
+        and period && daterange(p_start_date, p_end_date, '[]')
+    )
+    and not exists (
+        select 1 from repairs
+        where equipment_id = p_equipment_id
+        and status in ('Запланирован', 'В процессе')
+        and daterange(start_date, end_date, '[]') && daterange(p_start_date, p_end_date, '[]')
+    );
+$$;
+
+
+create or replace function get_available_equipment(p_start_date date, p_end_date date, p_category_id int default null)
+returns table (
+    equipment_id int,
+    inventory_number varchar(50),
+    category_id int,
+    model_name varchar(100),
+    rental_price_per_day decimal(10,2)
+)
+language sql
+stable
+as $$
+    select
+        e.id,
+        e.inventory_number,
+        e.category_id,
+        em.name,
+        em.rental_price_per_day
+    from equipment e
+    join equipment_models em on em.id = e.model_id
+    where e.status <> 'Списано'
+    and (p_category_id is null or e.category_id in (
+        select descendant_id from equipment_category_closure
+        where ancestor_id = p_category_id
+    ))
+    and not exists (
+        select 1 from rental_items ri
+        where int4range(ri.equipment_id, ri.equipment_id, '[]') && int4range(e.id, e.id, '[]')
+        and ri.period && daterange(p_start_date, p_end_date, '[]')
+    )
+    and not exists (
+        select 1 from repairs rp
+        where rp.equipment_id = e.id
+        and rp.status in ('Запланирован', 'В процессе')
+        and daterange(rp.start_date, rp.end_date, '[]') && daterange(p_start_date, p_end_date, '[]')
+    )
+    order by e.id;
+$$;
+
+
+create or replace function get_equipment_bookings(p_equipment_id int, p_start_date date, p_end_date date)
+returns table (
+    rental_id int,
+    start_date date,
+    end_date date
+)
+language sql
+stable
+as $$
+    select ri.rental_id, lower(ri.period), upper(ri.period) - 1
+    from rental_items ri
+    where int4range(ri.equipment_id, ri.equipment_id, '[]') && int4range(p_equipment_id, p_equipment_id, '[]')
+    and ri.period && daterange(p_start_date, p_end_date, '[]')
+    order by lower(ri.period);
+$$;
+
+
+create or replace function get_category_subtree_stats(p_category_id int, p_start_date date default null, p_end_date date default null)
+returns table (
+    category_id int,
+    name varchar(100),
+    parent_id int,
+    depth int,
+    equipment_count int,
+    rented_items int,
+    revenue decimal(12,2)
+)
+language sql
+stable
+as $$
+    with subtree as (
+        select s.descendant_id, s.depth
+        from equipment_category_closure s
+        where s.ancestor_id = p_category_id
+    ),
+    equipment_stats as (
+        select e.category_id, count(*) as equipment_count
+        from equipment e
+        join subtree s on s.descendant_id = e.category_id
+        group by e.category_id
+    ),
+    revenue_stats as (
+        select
+            e.category_id,
+            count(*) as rented_items,
+            sum(em.rental_price_per_day * greatest(
+                case
+                    when r.return_date is not null and r.return_date >= r.start_date then
+                        r.return_date - r.start_date + 1
+                    else
+                        r.end_date - r.start_date + 1
+                end, 0) + ri.damage_fee) as revenue
+        from rental_items ri
+        join rentals r on r.id = ri.rental_id
+        join equipment e on e.id = ri.equipment_id
+        join subtree s on s.descendant_id = e.category_id
+        join equipment_models em on em.id = e.model_id
+        where r.status <> 'Отменён'
+        and (p_start_date is null or r.start_date >= p_start_date)
+        and (p_end_date is null or r.start_date <= p_end_date)
+        group by e.category_id
+    )
+    select
+        c.id,
+        c.name,
+        c.parent_id,
+        s.depth,
+        coalesce(sum(es.equipment_count), 0)::int,
+        coalesce(sum(rs.rented_items), 0)::int,
+        coalesce(sum(rs.revenue), 0)::decimal(12,2)
+    from subtree s
+    join equipment_categories c on c.id = s.descendant_id
+    join equipment_category_closure d on d.ancestor_id = s.descendant_id
+    left join equipment_stats es on es.category_id = d.descendant_id
+    left join revenue_stats rs on rs.category_id = d.descendant_id
+    group by c.id, c.name, c.parent_id, s.depth
+    order by s.depth, c.id;
+$$;
+
+
+create or replace function equipment_search_vector(p_inventory_number varchar, p_model_vector tsvector, p_category_vector tsvector)
+returns tsvector
+language sql
+immutable
+as $$
+    -- Тексты моделей и категорий уже разобраны в их search_vector:
+    -- для каждой единицы оборудования разбирается только номер. Без замены
+    -- разделителей парсер прочитал бы «INV-000123» как «inv» и число -000123
+    select
+        setweight(to_tsvector('simple', translate(coalesce(p_inventory_number, ''), '-_/.', '    ')), 'A') ||
+        p_model_vector || p_category_vector;
+$$;
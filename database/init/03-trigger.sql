@@ -2,47 +2,163 @@ create or replace function log_audit_func()
 returns trigger
 language plpgsql
 as $$
+declare
+    audit_level varchar(10);
+    audit_sample_rate decimal(4,3);
 begin
-    if (tg_op = 'INSERT') then
-        insert into audit_log (table_name, record_id, operation, old_data, new_data)
-        values (tg_table_name, new.id, 'INSERT', null, row_to_json(new));
-        return new;
-    elsif (tg_op = 'UPDATE') then
-        insert into audit_log (table_name, record_id, operation, old_data, new_data)
-        values (tg_table_name, new.id, 'UPDATE', row_to_json(old), row_to_json(new));
-        return new;
-    elsif (tg_op = 'DELETE') then
-        insert into audit_log (table_name, record_id, operation, old_data, new_data)
-        values (tg_table_name, old.id, 'DELETE', row_to_json(old), null);
-        return old;
+    if current_setting('app.bulk_load', true) = 'on' then
+        return null;
     end if;
+
+    -- Настройки читаются один раз на выражение, строки пишутся в очередь
+    -- одним insert из таблиц переходов
+    select level, sample_rate
+    into audit_level, audit_sample_rate
+    from audit_settings
+    where table_name = tg_table_name;
+
+    audit_level := coalesce(audit_level, 'diff');
+    audit_sample_rate := coalesce(audit_sample_rate, 1);
+    if audit_level = 'off' or audit_sample_rate = 0 then
+        return null;
+    end if;
+
+    if tg_op = 'INSERT' then
+        -- На уровне diff вставка пишет только id: значения есть в самой
+        -- строке, а их последующие изменения сохраняют старые значения
+        insert into audit_log_queue (table_name, record_id, operation, old_data, new_data)
+        select tg_table_name, n.id, tg_op, null,
+            case when audit_level = 'full' then to_jsonb(n) end
+        from new_rows n
+        where random() < audit_sample_rate;
+    elsif tg_op = 'DELETE' then
+        -- Удалённую строку больше не из чего восстановить, поэтому на
+        -- уровне diff сохраняется её последнее состояние без null
+        insert into audit_log_queue (table_name, record_id, operation, old_data, new_data)
+        select tg_table_name, o.id, tg_op,
+            case audit_level
+                when 'full' then to_jsonb(o)
+                when 'diff' then jsonb_strip_nulls(to_jsonb(o))
+            end,
+            null
+        from old_rows o
+        where random() < audit_sample_rate;
+    elsif audit_level = 'full' then
+        insert into audit_log_queue (table_name, record_id, operation, old_data, new_data)
+        select tg_table_name, n.id, tg_op, to_jsonb(o), to_jsonb(n)
+        from new_rows n
+        join old_rows o on o.id = n.id
+        where random() < audit_sample_rate;
+    else
+        insert into audit_log_queue (table_name, record_id, operation, old_data, new_data)
+        select tg_table_name, n.id, tg_op,
+            case when audit_level = 'diff' then diff.old_values end,
+            case when audit_level = 'diff' then diff.new_values end
+        from new_rows n
+        join old_rows o on o.id = n.id
+        cross join lateral (
+            select jsonb_object_agg(nv.key, ov.value) as old_values,
+                jsonb_object_agg(nv.key, nv.value) as new_values
+            from jsonb_each(to_jsonb(n)) nv
+            join jsonb_each(to_jsonb(o)) ov on ov.key = nv.key
+            where nv.value is distinct from ov.value
+        ) diff
+        where diff.new_values is not null
+        and random() < audit_sample_rate;
+    end if;
+
     return null;
 end;
 $$;
 
-create or replace trigger log_audit_users_trigger
-after insert or update or delete on users
-for each row
+create or replace trigger log_audit_users_insert_trigger
+after insert on users
+referencing new table as new_rows
+for each statement
 execute function log_audit_func();
 
-create or replace trigger log_audit_equipment_trigger
-after insert or update or delete on equipment
-for each row
+create or replace trigger log_audit_users_update_trigger
+after update on users
+referencing old table as old_rows new table as new_rows
+for each statement
 execute function log_audit_func();
 
-create or replace trigger log_audit_rentals_trigger
-after insert or update or delete on rentals
-for each row
+create or replace trigger log_audit_users_delete_trigger
+after delete on users
+referencing old table as old_rows
+for each statement
 execute function log_audit_func();
 
-create or replace trigger log_audit_payments_trigger
-after insert or update or delete on payments
-for each row
+create or replace trigger log_audit_equipment_insert_trigger
+after insert on equipment
+referencing new table as new_rows
+for each statement
 execute function log_audit_func();
 
-create or replace trigger log_audit_repairs_trigger
-after insert or update or delete on repairs
-for each row
+create or replace trigger log_audit_equipment_update_trigger
+after update on equipment
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function log_audit_func();
+
+create or replace trigger log_audit_equipment_delete_trigger
+after delete on equipment
+referencing old table as old_rows
+for each statement
+execute function log_audit_func();
+
+create or replace trigger log_audit_rentals_insert_trigger
+after insert on rentals
+referencing new table as new_rows
+for each statement
+execute function log_audit_func();
+
+create or replace trigger log_audit_rentals_update_trigger
+after update on rentals
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function log_audit_func();
+
+create or replace trigger log_audit_rentals_delete_trigger
+after delete on rentals
+referencing old table as old_rows
+for each statement
+execute function log_audit_func();
+
+create or replace trigger log_audit_payments_insert_trigger
+after insert on payments
+referencing new table as new_rows
+for each statement
+execute function log_audit_func();
+
+create or replace trigger log_audit_payments_update_trigger
+after update on payments
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function log_audit_func();
+
+create or replace trigger log_audit_payments_delete_trigger
+after delete on payments
+referencing old table as old_rows
+for each statement
+execute function log_audit_func();
+
+create or replace trigger log_audit_repairs_insert_trigger
+after insert on repairs
+referencing new table as new_rows
+for each statement
+execute function log_audit_func();
+
+create or replace trigger log_audit_repairs_update_trigger
+after update on repairs
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function log_audit_func();
+
+create or replace trigger log_audit_repairs_delete_trigger
+after delete on repairs
+referencing old table as old_rows
+for each statement
 execute function log_audit_func();
 
 
@@ -51,63 +167,72 @@ returns trigger
 language plpgsql
 as $$
 declare
-    target_rental_id int;
-    actual_days int;
-    new_total decimal(10,2);
+    target_rental_ids int[];
 begin
-    if tg_table_name = 'rental_items' then
-        if tg_op = 'DELETE' then
-            target_rental_id := old.rental_id;
+    if current_setting('app.bulk_load', true) = 'on' then
+        return null;
+    end if;
+
+    if tg_level = 'ROW' then
+        target_rental_ids := array[new.id];
+    elsif tg_table_name = 'rental_items' then
+        if tg_op = 'INSERT' then
+            select array_agg(distinct rental_id) into target_rental_ids
+            from new_items;
+        elsif tg_op = 'UPDATE' then
+            select array_agg(rental_id) into target_rental_ids
+            from (
+                select rental_id from new_items
+                union
+                select rental_id from old_items
+            ) changed;
         else
-            target_rental_id := new.rental_id;
+            select array_agg(distinct rental_id) into target_rental_ids
+            from old_items;
         end if;
     else
-        target_rental_id := new.id;
+        select array_agg(id) into target_rental_ids
+        from new_rentals;
     end if;
 
-    select 
-        case 
-            when r.return_date is not null and r.return_date >= r.start_date then 
-				r.return_date - r.start_date + 1
-            else 
-                r.end_date - r.start_date + 1
-        end
-    into actual_days
-    from rentals r
-    where r.id = target_rental_id;
-
-    if actual_days is null or actual_days < 1 then
-        actual_days := 0;
+    if target_rental_ids is not null then
+        perform recalculate_rental_total_cost(target_rental_ids);
     end if;
 
-    select coalesce(sum(em.rental_price_per_day * actual_days + ri.damage_fee), 0)
-    into new_total
-    from rental_items ri
-    join equipment e on ri.equipment_id = e.id
-    join equipment_models em on e.model_id = em.id
-    where ri.rental_id = target_rental_id;
-
-    update rentals
-    set total_cost = new_total
-    where id = target_rental_id;
-
     return null;
 end;
 $$;
 
-create or replace trigger calculate_rental_total_cost_items_trigger
-after insert or update or delete on rental_items
-for each row
+create or replace trigger calculate_rental_total_cost_items_insert_trigger
+after insert on rental_items
+referencing new table as new_items
+for each statement
+execute function calculate_rental_total_cost_func();
+
+create or replace trigger calculate_rental_total_cost_items_update_trigger
+after update on rental_items
+referencing old table as old_items new table as new_items
+for each statement
+execute function calculate_rental_total_cost_func();
+
+create or replace trigger calculate_rental_total_cost_items_delete_trigger
+after delete on rental_items
+referencing old table as old_items
+for each statement
 execute function calculate_rental_total_cost_func();
 
 create or replace trigger calculate_rental_total_cost_date_trigger
 after update of start_date, end_date, return_date on rentals
 for each row
+when (old.start_date is distinct from new.start_date
+    or old.end_date is distinct from new.end_date
+    or old.return_date is distinct from new.return_date)
 execute function calculate_rental_total_cost_func();
 
 create or replace trigger calculate_rental_total_cost_insert_trigger
 after insert on rentals
-for each row
+referencing new table as new_rentals
+for each statement
 execute function calculate_rental_total_cost_func();
 
 
@@ -148,7 +273,7 @@ begin
 end;
 $$;
 
-create trigger trg_copy_amount_from_rental_insert
+create or replace trigger trg_copy_amount_from_rental_insert
 before insert on payments
 for each row
 execute function copy_total_cost_to_payment();
@@ -200,6 +325,10 @@ returns trigger
 language plpgsql
 as $$
 begin
+    if current_setting('app.bulk_load', true) = 'on' then
+        return new;
+    end if;
+
     if exists (
         select 1 from rentals 
         where id = new.rental_id 
@@ -237,4 +366,287 @@ $$;
 create or replace trigger update_overdue_rentals_trigger
 before insert or update on rentals
 for each row
-execute function update_overdue_rentals_func();
\ No newline at end of file
+execute function update_overdue_rentals_func();
+
+
+create or replace function set_rental_item_period_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    select rental_item_period(new.equipment_id, r.start_date, r.end_date, r.return_date, r.status)
+    into new.period
+    from rentals r
+    where r.id = new.rental_id;
+
+    return new;
+end;
+$$;
+
+create or replace trigger set_rental_item_period_trigger
+before insert or update of rental_id, equipment_id on rental_items
+for each row
+execute function set_rental_item_period_func();
+
+
+create or replace function update_rental_item_period_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    update rental_items ri
+    set period = p.period
+    from (
+        select id, rental_item_period(equipment_id, new.start_date, new.end_date, new.return_date, new.status) as period
+        from rental_items
+        where rental_id = new.id
+    ) p
+    where ri.id = p.id
+    and ri.period is distinct from p.period;
+
+    return null;
+end;
+$$;
+
+create or replace trigger update_rental_item_period_trigger
+after update of start_date, end_date, return_date, status on rentals
+for each row
+when (old.start_date is distinct from new.start_date
+    or old.end_date is distinct from new.end_date
+    or old.return_date is distinct from new.return_date
+    or old.status is distinct from new.status)
+execute function update_rental_item_period_func();
+
+
+create or replace function insert_category_closure_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into equipment_category_closure (ancestor_id, descendant_id, depth)
+    select c.ancestor_id, new.id, c.depth + 1
+    from equipment_category_closure c
+    where c.descendant_id = new.parent_id
+    union all
+    select new.id, new.id, 0;
+
+    return null;
+end;
+$$;
+
+create or replace trigger insert_category_closure_trigger
+after insert on equipment_categories
+for each row
+execute function insert_category_closure_func();
+
+
+create or replace function move_category_closure_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    lock table equipment_category_closure in share row exclusive mode;
+
+    if exists (
+        select 1 from equipment_category_closure
+        where ancestor_id = new.id and descendant_id = new.parent_id
+    ) then
+        raise exception 'Категория % не может быть вложена в собственную подкатегорию %', new.id, new.parent_id;
+    end if;
+
+    delete from equipment_category_closure c
+    using equipment_category_closure sub
+    where sub.ancestor_id = new.id
+    and c.descendant_id = sub.descendant_id
+    and c.depth > sub.depth;
+
+    insert into equipment_category_closure (ancestor_id, descendant_id, depth)
+    select p.ancestor_id, sub.descendant_id, p.depth + sub.depth + 1
+    from equipment_category_closure p
+    join equipment_category_closure sub on sub.ancestor_id = new.id
+    where p.descendant_id = new.parent_id;
+
+    return null;
+end;
+$$;
+
+create or replace trigger move_category_closure_trigger
+after update of parent_id on equipment_categories
+for each row
+when (old.parent_id is distinct from new.parent_id)
+execute function move_category_closure_func();
+
+
+create or replace function bump_cache_version_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- Строка может отсутствовать после очистки таблицы: тогда она создаётся
+    insert into cache_versions as v (name, version)
+    values (tg_table_name, 1)
+    on conflict (name) do update
+    set version = v.version + 1,
+        changed_at = current_timestamp;
+
+    return null;
+end;
+$$;
+
+create or replace trigger equipment_categories_cache_version_trigger
+after insert or update or delete or truncate on equipment_categories
+for each statement
+execute function bump_cache_version_func();
+
+
+create or replace function notify_rental_change_func()
+returns trigger
+language plpgsql
+as $$
+declare
+    payload text;
+begin
+    if current_setting('app.bulk_load', true) = 'on' then
+        return null;
+    end if;
+
+    if tg_table_name = 'rental_items' then
+        if tg_op = 'INSERT' then
+            select string_agg(distinct rental_id::text, ',') into payload
+            from new_rows;
+        elsif tg_op = 'UPDATE' then
+            select string_agg(rental_id::text, ',') into payload
+            from (
+                select rental_id from new_rows
+                union
+                select rental_id from old_rows
+            ) changed;
+        else
+            select string_agg(distinct rental_id::text, ',') into payload
+            from old_rows;
+        end if;
+    elsif tg_op = 'UPDATE' then
+        select string_agg(id::text, ',') into payload
+        from new_rows;
+    else
+        select string_agg(id::text, ',') into payload
+        from old_rows;
+    end if;
+
+    -- Размер уведомления ограничен 8000 байт: при большом изменении
+    -- слушатели сбрасывают кэш целиком
+    if length(payload) > 7900 then
+        payload := '*';
+    end if;
+
+    if payload is not null then
+        perform pg_notify('rental_changes', payload);
+    end if;
+
+    return null;
+end;
+$$;
+
+create or replace trigger notify_rental_change_update_trigger
+after update on rentals
+referencing new table as new_rows
+for each statement
+execute function notify_rental_change_func();
+
+create or replace trigger notify_rental_change_delete_trigger
+after delete on rentals
+referencing old table as old_rows
+for each statement
+execute function notify_rental_change_func();
+
+create or replace trigger notify_rental_change_items_insert_trigger
+after insert on rental_items
+referencing new table as new_rows
+for each statement
+execute function notify_rental_change_func();
+
+create or replace trigger notify_rental_change_items_update_trigger
+after update on rental_items
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function notify_rental_change_func();
+
+create or replace trigger notify_rental_change_items_delete_trigger
+after delete on rental_items
+referencing old table as old_rows
+for each statement
+execute function notify_rental_change_func();
+
+
+create or replace function refresh_equipment_search_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' then
+        insert into equipment_search (equipment_id, search_vector)
+        select n.id, equipment_search_vector(n.inventory_number, em.search_vector, ec.search_vector)
+        from new_rows n
+        join equipment_models em on em.id = n.model_id
+        join equipment_categories ec on ec.id = n.category_id;
+    else
+        -- Смена статуса вектор не меняет: пересчитываются только строки
+        -- с новой моделью, категорией или номером
+        insert into equipment_search (equipment_id, search_vector)
+        select n.id, equipment_search_vector(n.inventory_number, em.search_vector, ec.search_vector)
+        from new_rows n
+        join old_rows o on o.id = n.id
+        join equipment_models em on em.id = n.model_id
+        join equipment_categories ec on ec.id = n.category_id
+        where (n.model_id, n.category_id, n.inventory_number)
+            is distinct from (o.model_id, o.category_id, o.inventory_number)
+        on conflict (equipment_id) do update
+        set search_vector = excluded.search_vector;
+    end if;
+
+    return null;
+end;
+$$;
+
+create or replace trigger refresh_equipment_search_insert_trigger
+after insert on equipment
+referencing new table as new_rows
+for each statement
+execute function refresh_equipment_search_func();
+
+create or replace trigger refresh_equipment_search_update_trigger
+after update on equipment
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function refresh_equipment_search_func();
+
+
+create or replace function update_equipment_search_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    update equipment_search s
+    set search_vector = equipment_search_vector(e.inventory_number, em.search_vector, ec.search_vector)
+    from equipment e
+    join equipment_models em on em.id = e.model_id
+    join equipment_categories ec on ec.id = e.category_id
+    where s.equipment_id = e.id
+    and ((tg_table_name = 'equipment_models' and e.model_id = new.id)
+        or (tg_table_name = 'equipment_categories' and e.category_id = new.id));
+
+    return null;
+end;
+$$;
+
+create or replace trigger update_equipment_search_model_trigger
+after update on equipment_models
+for each row
+when (old.search_vector is distinct from new.search_vector)
+execute function update_equipment_search_func();
+
+create or replace trigger update_equipment_search_category_trigger
+after update on equipment_categories
+for each row
+when (old.search_vector is distinct from new.search_vector)
+execute function update_equipment_search_func();
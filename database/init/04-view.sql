@@ -12,7 +12,7 @@ join users u on r.user_id = u.id
 join users e on r.employee_id = e.id
 left join rental_items ri on r.id = ri.rental_id
 where r.status = 'Активен'
-group by r.id, u.name, u.phone, e.name
+group by r.id, r.start_date, r.end_date, u.name, u.phone, e.name
 order by r.end_date;
 
 
@@ -29,7 +29,7 @@ from rentals r
 join users u on r.user_id = u.id
 left join rental_items ri on r.id = ri.rental_id
 where r.status = 'Просрочен срок аренды'
-group by r.id, u.name, u.phone, u.email
+group by r.id, r.end_date, u.name, u.phone, u.email
 order by days_overdue desc;
 
 
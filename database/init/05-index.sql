@@ -1,61 +1,58 @@
+-- Индексы отчётов и функций. Планы запросов, которым они нужны, проверяет
+-- backend/scripts/plan_check.py: он сравнивает их с эталоном
+-- database/plans/baseline.json и показывает, что меняется без каждого индекса.
+
+-- get_rentals_ending_soon, v_active_rentals
 create index if not exists idx_rentals_active_end_date on rentals(end_date)
 where status = 'Активен';
-explain analyze
-select 
-    r.id,
-    u.name,
-    u.phone,
-    r.end_date,
-    count(ri.id)::int,
-    e.name as employee
-from rentals r
-join users u on r.user_id = u.id
-join users e on r.employee_id = e.id
-left join rental_items ri on r.id = ri.rental_id
-where r.status = 'Активен' and r.end_date between current_date and current_date + 3
-group by r.id, u.name, u.phone, e.name
-order by r.end_date;
-
 
+-- v_overdue_rentals, calculate_late_fees
 create index if not exists idx_rentals_overdue_end_date on rentals(end_date)
 where status = 'Просрочен срок аренды';
-explain analyze
-select * from v_overdue_rentals;
-
 
+-- get_rentals_period_report
 create index if not exists idx_rentals_start_date on rentals (start_date);
-explain analyze
-select 
-    r.id,
-    u.name,
-    r.start_date,
-    r.end_date,
-    r.status,
-    r.total_cost,
-    count(ri.id)::int as equipment_count
-from rentals r
-join users u on r.user_id = u.id
-left join rental_items ri on r.id = ri.rental_id
-where r.start_date between '2024-01-01' and '2024-12-31'
-group by r.id, u.name
-order by r.start_date;
-
 
+-- calculate_late_fee
 create index if not exists idx_rentals_overdue_status on rentals (status, end_date)
 where status = 'Просрочен срок аренды';
-explain analyze
-select calculate_late_fee(123);
-
 
+-- v_active_rentals, v_overdue_rentals, get_rentals_period_report
 create index if not exists idx_rental_items_rental_id on rental_items (rental_id);
-explain analyze
-select * from v_active_rentals 
-limit 20
-offset 10;
 
+-- v_active_rentals с пагинацией по ключу (end_date, rental_id)
+create index if not exists idx_rentals_active_end_date_id on rentals (end_date, id)
+where status = 'Активен';
 
--- drop index if exists idx_rentals_active_end_date;
--- drop index if exists idx_rentals_overdue_end_date;
--- drop index if exists idx_rentals_start_date;
--- drop index if exists idx_rentals_overdue_status;
--- drop index if exists idx_rental_items_rental_id;
+-- оборудование категории вместе с подкатегориями
+create index if not exists idx_category_closure_descendant on equipment_category_closure (descendant_id, ancestor_id);
+create index if not exists idx_equipment_category_id on equipment (category_id);
+
+-- аренды клиента и продавца, история единицы оборудования (get_avg_rental_days)
+create index if not exists idx_rentals_user_id on rentals (user_id);
+create index if not exists idx_rentals_employee_id on rentals (employee_id);
+create index if not exists idx_rental_items_equipment_id on rental_items (equipment_id);
+
+-- поиск по каталогу оборудования (/equipment/search)
+create index if not exists idx_equipment_search_vector on equipment_search using gin (search_vector);
+create index if not exists idx_equipment_inventory_number_prefix on equipment (upper(inventory_number) text_pattern_ops);
+create index if not exists idx_equipment_model_id on equipment (model_id);
+
+-- pg_trgm (contrib) нужен для поиска с опечатками. Если расширения нет на
+-- сервере, поиск обходится полнотекстовым индексом и префиксом номера
+do $$
+begin
+    create extension if not exists pg_trgm;
+exception when others then
+    raise notice 'pg_trgm недоступен: %', sqlerrm;
+end;
+$$;
+
+do $$
+begin
+    if exists (select 1 from pg_extension where extname = 'pg_trgm') then
+        create index if not exists idx_equipment_inventory_number_trgm on equipment using gin (inventory_number gin_trgm_ops);
+        create index if not exists idx_equipment_models_name_trgm on equipment_models using gin (name gin_trgm_ops);
+    end if;
+end;
+$$;
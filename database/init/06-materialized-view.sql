@@ -0,0 +1,79 @@
+create materialized view if not exists mv_active_rentals as
+select * from v_active_rentals;
+
+create unique index if not exists idx_mv_active_rentals_rental_id on mv_active_rentals (rental_id);
+create index if not exists idx_mv_active_rentals_keyset on mv_active_rentals (end_date, rental_id);
+
+
+create materialized view if not exists mv_overdue_rentals as
+select * from v_overdue_rentals;
+
+create unique index if not exists idx_mv_overdue_rentals_rental_id on mv_overdue_rentals (rental_id);
+create index if not exists idx_mv_overdue_rentals_keyset on mv_overdue_rentals (days_overdue desc, rental_id);
+
+
+create materialized view if not exists mv_client_stats as
+select * from v_client_stats;
+
+create unique index if not exists idx_mv_client_stats_client_id on mv_client_stats (client_id);
+create index if not exists idx_mv_client_stats_keyset on mv_client_stats (total_rentals desc, client_id);
+
+
+create materialized view if not exists mv_monthly_revenue as
+select * from v_monthly_revenue;
+
+create unique index if not exists idx_mv_monthly_revenue_month on mv_monthly_revenue (month);
+
+
+create table if not exists report_refresh_log (
+    view_name varchar(50) primary key,
+    refreshed_at timestamptz not null default current_timestamp,
+    duration_ms int
+);
+
+insert into report_refresh_log (view_name) values
+    ('mv_active_rentals'),
+    ('mv_overdue_rentals'),
+    ('mv_client_stats'),
+    ('mv_monthly_revenue')
+on conflict (view_name) do update set refreshed_at = current_timestamp;
+
+
+create or replace function refresh_report_views(p_concurrently boolean default true)
+returns table (
+    view_name varchar(50),
+    refreshed_at timestamptz,
+    duration_ms int
+)
+language plpgsql
+as $$
+declare
+    target_view varchar(50);
+    started_at timestamptz;
+begin
+    -- Список представлений задан здесь, а не строками report_refresh_log:
+    -- очищенный журнал не должен останавливать обновление
+    foreach target_view in array array[
+        'mv_active_rentals', 'mv_client_stats', 'mv_monthly_revenue', 'mv_overdue_rentals'
+    ] loop
+        started_at := clock_timestamp();
+        if p_concurrently then
+            execute format('refresh materialized view concurrently %I', target_view);
+        else
+            execute format('refresh materialized view %I', target_view);
+        end if;
+
+        insert into report_refresh_log as l (view_name, refreshed_at, duration_ms)
+        values (target_view, started_at,
+            (extract(epoch from clock_timestamp() - started_at) * 1000)::int)
+        on conflict on constraint report_refresh_log_pkey do update
+        set refreshed_at = excluded.refreshed_at,
+            duration_ms = excluded.duration_ms;
+    end loop;
+
+    return query
+    select l.view_name, l.refreshed_at, l.duration_ms
+    from report_refresh_log l
+    order by l.view_name;
+end;
+$$;
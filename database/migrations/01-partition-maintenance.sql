@@ -0,0 +1,49 @@
+-- Функции обслуживания помесячных партиций audit_log и rentals.
+-- Применяется перед 02-audit-log-partitioning.sql и 03-rentals-partitioning.sql.
+
+create or replace function create_monthly_partitions(p_table text, p_from date, p_to date)
+returns int
+language plpgsql
+as $$
+declare
+    month_start date;
+    partition_name text;
+    created_count int default 0;
+begin
+    month_start := date_trunc('month', p_from)::date;
+    while month_start < p_to loop
+        partition_name := format('%s_p%s', p_table, to_char(month_start, 'YYYY_MM'));
+        if to_regclass(partition_name) is null then
+            execute format(
+                'create table %I partition of %I for values from (%L) to (%L)',
+                partition_name, p_table, month_start, (month_start + interval '1 month')::date
+            );
+            created_count := created_count + 1;
+        end if;
+        month_start := (month_start + interval '1 month')::date;
+    end loop;
+
+    return created_count;
+end;
+$$;
+
+
+create or replace function list_monthly_partitions(p_table text)
+returns table (
+    partition_name text,
+    month_start date,
+    row_estimate bigint
+)
+language sql
+stable
+as $$
+    select 
+        c.relname::text,
+        to_date(right(c.relname, 7), 'YYYY_MM'),
+        c.reltuples::bigint
+    from pg_inherits i
+    join pg_class c on c.oid = i.inhrelid
+    where i.inhparent = p_table::regclass
+      and c.relname ~ ('^' || p_table || '_p[0-9]{4}_[0-9]{2}$')
+    order by 2;
+$$;
@@ -0,0 +1,42 @@
+-- Перевод audit_log на помесячные партиции по changed_at.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/02-audit-log-partitioning.sql
+
+begin;
+
+lock table audit_log in access exclusive mode;
+
+alter table audit_log rename to audit_log_old;
+alter index audit_log_pkey rename to audit_log_old_pkey;
+
+create table audit_log (
+    id int not null default nextval('audit_log_id_seq'),
+    table_name varchar(50) not null,
+    record_id int not null,
+    operation varchar(10) not null check (operation in ('INSERT', 'UPDATE', 'DELETE')),
+    old_data jsonb,
+    new_data jsonb,
+    changed_at timestamp not null default current_timestamp,
+    primary key (id, changed_at)
+) partition by range (changed_at);
+
+alter sequence audit_log_id_seq owned by audit_log.id;
+
+create table audit_log_default partition of audit_log default;
+
+select create_monthly_partitions(
+    'audit_log',
+    coalesce((select min(changed_at) from audit_log_old), current_date)::date,
+    (date_trunc('month', current_date) + interval '3 months')::date
+);
+
+insert into audit_log (id, table_name, record_id, operation, old_data, new_data, changed_at)
+select id, table_name, record_id, operation, old_data, new_data, coalesce(changed_at, current_timestamp)
+from audit_log_old;
+
+drop table audit_log_old;
+
+create index if not exists idx_audit_log_record on audit_log (table_name, record_id, changed_at);
+
+commit;
+
+analyze audit_log;
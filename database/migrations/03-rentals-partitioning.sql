@@ -0,0 +1,407 @@
+-- Перевод rentals на помесячные партиции по start_date.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/03-rentals-partitioning.sql
+--
+-- Первичный ключ партиционированной таблицы обязан включать start_date,
+-- поэтому внешние ключи rental_items, payments и damages на rentals(id)
+-- заменяются триггерами уровня оператора: проверкой существования аренды
+-- и каскадным удалением. Уникальность id обеспечивает первичный ключ
+-- таблицы rental_ids, которую ведут триггеры вставки и удаления rentals.
+--
+-- Индексы и триггеры rentals, а также зависящие от неё представления
+-- (в том числе материализованные) пересоздаются на новой таблице по
+-- определениям из каталога базы, к которой применяется миграция.
+
+begin;
+
+lock table rentals in access exclusive mode;
+
+-- Отчёты группировали строки по одному r.id, полагаясь на первичный ключ
+-- (id). У партиционированной таблицы ключ (id, start_date), поэтому
+-- остальные столбцы rentals перечислены в group by явно.
+
+create or replace function get_rentals_period_report(p_start_date date, p_end_date date)
+returns table (
+    rental_id int,
+    client_name varchar(100),
+    start_date date,
+    end_date date,
+    status varchar(20),
+    total_cost decimal(10,2),
+    equipment_count int
+)
+language plpgsql
+as $$
+begin
+    return query
+    select 
+        r.id,
+        u.name,
+        r.start_date,
+        r.end_date,
+        r.status,
+        r.total_cost,
+        count(ri.id)::int as equipment_count
+    from rentals r
+    join users u on r.user_id = u.id
+    left join rental_items ri on r.id = ri.rental_id
+    where r.start_date between p_start_date and p_end_date
+    group by r.id, r.start_date, r.end_date, r.status, r.total_cost, u.name
+    order by r.start_date;
+end;
+$$;
+
+
+create or replace function get_monthly_revenue(p_start_date date, p_end_date date)
+returns table (
+    month timestamptz,
+    rental_count bigint,
+    equipment_count bigint,
+    total_revenue numeric,
+    damage_fees numeric
+)
+language sql
+stable
+as $$
+    select 
+        date_trunc('month', r.start_date) as month,
+        count(distinct r.id) as rental_count,
+        count(distinct ri.equipment_id) as equipment_count,
+        sum(r.total_cost) as total_revenue,
+        sum(ri.damage_fee) as damage_fees
+    from rentals r
+    left join rental_items ri on r.id = ri.rental_id
+    where r.status = 'Завершён'
+      and r.start_date >= date_trunc('month', p_start_date)::date
+      and r.start_date <= p_end_date
+    group by date_trunc('month', r.start_date)
+    order by month desc;
+$$;
+
+
+create or replace function get_rentals_ending_soon(p_days_left int default 2)
+returns table (
+    rental_id int,
+    client_name varchar(100),
+    client_phone varchar(20),
+    end_date date,
+    equipment_count int,
+    employee varchar(100)
+)
+language plpgsql
+as $$
+begin
+    return query
+    select 
+        r.id,
+        u.name,
+        u.phone,
+        r.end_date,
+        count(ri.id)::int,
+        e.name as employee
+    from rentals r
+    join users u on r.user_id = u.id
+    join users e on r.employee_id = e.id
+    left join rental_items ri on r.id = ri.rental_id
+    where r.status = 'Активен' and r.end_date between current_date and current_date + p_days_left
+    group by r.id, r.end_date, u.name, u.phone, e.name
+    order by r.end_date;
+end;
+$$;
+
+
+create or replace view v_active_rentals as
+select 
+    r.id as rental_id,
+    r.start_date,
+    r.end_date,
+    u.name as client_name,
+    u.phone as client_phone,
+    e.name as employee_name,
+    count(ri.equipment_id) as equipment_count
+from rentals r
+join users u on r.user_id = u.id
+join users e on r.employee_id = e.id
+left join rental_items ri on r.id = ri.rental_id
+where r.status = 'Активен'
+group by r.id, r.start_date, r.end_date, u.name, u.phone, e.name
+order by r.end_date;
+
+
+create or replace view v_overdue_rentals as
+select 
+    r.id as rental_id,
+    r.end_date,
+    u.name as client_name,
+    u.phone as client_phone,
+    u.email as client_email,
+    (current_date - r.end_date) as days_overdue,
+    count(ri.equipment_id) as equipment_count
+from rentals r
+join users u on r.user_id = u.id
+left join rental_items ri on r.id = ri.rental_id
+where r.status = 'Просрочен срок аренды'
+group by r.id, r.end_date, u.name, u.phone, u.email
+order by days_overdue desc;
+
+
+create temp table rentals_ddl (
+    id serial primary key,
+    kind text not null,
+    object_name text not null,
+    ddl text not null
+) on commit drop;
+
+-- Представления в порядке создания: зависимые создаются позже исходных
+insert into rentals_ddl (kind, object_name, ddl)
+with recursive dependent as (
+    select w.ev_class as oid
+    from pg_depend d
+    join pg_rewrite w on w.oid = d.objid
+    where d.classid = 'pg_rewrite'::regclass
+    and d.refobjid = 'rentals'::regclass
+    union
+    select w.ev_class
+    from dependent v
+    join pg_depend d on d.refobjid = v.oid and d.classid = 'pg_rewrite'::regclass
+    join pg_rewrite w on w.oid = d.objid
+    where w.ev_class <> v.oid
+)
+select
+    case c.relkind when 'm' then 'materialized view' else 'view' end,
+    c.oid::regclass::text,
+    format('create %s %s as %s',
+        case c.relkind when 'm' then 'materialized view' else 'view' end,
+        c.oid::regclass, pg_get_viewdef(c.oid))
+from dependent v
+join pg_class c on c.oid = v.oid
+where c.oid <> 'rentals'::regclass
+order by c.oid;
+
+insert into rentals_ddl (kind, object_name, ddl)
+select 'index', i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+from pg_index i
+where i.indrelid in (select object_name::regclass from rentals_ddl where kind = 'materialized view')
+order by i.indexrelid;
+
+insert into rentals_ddl (kind, object_name, ddl)
+select 'rentals index', i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+from pg_index i
+where i.indrelid = 'rentals'::regclass
+and not exists (select 1 from pg_constraint k where k.conindid = i.indexrelid)
+order by i.indexrelid;
+
+insert into rentals_ddl (kind, object_name, ddl)
+select 'trigger', t.tgname, pg_get_triggerdef(t.oid)
+from pg_trigger t
+where t.tgrelid = 'rentals'::regclass
+and not t.tgisinternal
+order by t.oid;
+
+do $$
+declare
+    r record;
+begin
+    for r in
+        select kind, object_name from rentals_ddl
+        where kind in ('view', 'materialized view')
+        order by id desc
+    loop
+        execute format('drop %s %s', r.kind, r.object_name);
+    end loop;
+end;
+$$;
+
+alter table rental_items drop constraint if exists rental_items_rental_id_fkey;
+alter table payments drop constraint if exists payments_rental_id_fkey;
+alter table damages drop constraint if exists damages_rental_id_fkey;
+
+alter table rentals rename to rentals_old;
+alter index rentals_pkey rename to rentals_old_pkey;
+
+create table rentals (
+    id int not null default nextval('rentals_id_seq'),
+    user_id int not null,
+    employee_id int not null,
+    start_date date not null,
+    end_date date not null,
+    check (end_date >= start_date),
+    return_date date default null,
+    check (return_date >= start_date or return_date is null),
+    status varchar(25) not null default 'Активен' 
+        check (status in ('Активен', 'Завершён', 'Отменён', 'Просрочен срок аренды')),
+    total_cost decimal(10, 2) check (total_cost >= 0),
+    created_at timestamp default current_timestamp,
+    updated_at timestamp default current_timestamp,
+    primary key (id, start_date),
+    foreign key (user_id) references users(id) on update cascade on delete restrict,
+    foreign key (employee_id) references users(id) on update cascade on delete restrict
+) partition by range (start_date);
+
+alter sequence rentals_id_seq owned by rentals.id;
+
+create table rentals_default partition of rentals default;
+
+select create_monthly_partitions(
+    'rentals',
+    coalesce((select min(start_date) from rentals_old), current_date),
+    (date_trunc('month', current_date) + interval '3 months')::date
+);
+
+-- Перенос данных не должен запускать триггеры пересчёта и аудита.
+select set_config('app.bulk_load', 'on', true);
+
+insert into rentals (id, user_id, employee_id, start_date, end_date, return_date, status, total_cost, created_at, updated_at)
+select id, user_id, employee_id, start_date, end_date, return_date, status, total_cost, created_at, updated_at
+from rentals_old;
+
+drop table rentals_old;
+
+select set_config('app.bulk_load', 'off', true);
+
+create index if not exists idx_rentals_id on rentals (id);
+
+create table rental_ids (
+    id int primary key
+);
+
+insert into rental_ids (id)
+select id from rentals;
+
+
+create or replace function check_rental_reference_func()
+returns trigger
+language plpgsql
+as $$
+declare
+    missing_rental_id int;
+begin
+    -- Как у внешнего ключа: блокировка не даёт параллельной транзакции
+    -- удалить аренду, пока ссылающиеся строки не зафиксированы
+    perform 1
+    from rentals r
+    where r.id in (select n.rental_id from new_rows n)
+    order by r.id
+    for key share;
+
+    select n.rental_id into missing_rental_id
+    from new_rows n
+    where not exists (select 1 from rentals r where r.id = n.rental_id)
+    limit 1;
+
+    if missing_rental_id is not null then
+        raise exception 'insert or update on table "%" violates reference to rentals', tg_table_name
+            using errcode = 'foreign_key_violation',
+                  detail = format('Key (rental_id)=(%s) is not present in table "rentals".', missing_rental_id);
+    end if;
+
+    return null;
+end;
+$$;
+
+create or replace function register_rental_id_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- Повторный id нарушает первичный ключ rental_ids
+    insert into rental_ids (id)
+    select id from new_rows;
+    return null;
+end;
+$$;
+
+create or replace function cascade_rental_delete_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    delete from rental_items where rental_id in (select id from old_rows);
+    delete from payments where rental_id in (select id from old_rows);
+    delete from damages where rental_id in (select id from old_rows);
+    delete from rental_ids where id in (select id from old_rows);
+    return null;
+end;
+$$;
+
+create or replace function restrict_rental_id_update_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.id <> old.id then
+        raise exception 'изменение id аренды не поддерживается'
+            using errcode = 'foreign_key_violation';
+    end if;
+    return new;
+end;
+$$;
+
+create or replace trigger check_rental_reference_items_insert_trigger
+after insert on rental_items
+referencing new table as new_rows
+for each statement
+execute function check_rental_reference_func();
+
+create or replace trigger check_rental_reference_items_update_trigger
+after update on rental_items
+referencing new table as new_rows
+for each statement
+execute function check_rental_reference_func();
+
+create or replace trigger check_rental_reference_payments_insert_trigger
+after insert on payments
+referencing new table as new_rows
+for each statement
+execute function check_rental_reference_func();
+
+create or replace trigger check_rental_reference_payments_update_trigger
+after update on payments
+referencing new table as new_rows
+for each statement
+execute function check_rental_reference_func();
+
+create or replace trigger check_rental_reference_damages_insert_trigger
+after insert on damages
+referencing new table as new_rows
+for each statement
+execute function check_rental_reference_func();
+
+create or replace trigger check_rental_reference_damages_update_trigger
+after update on damages
+referencing new table as new_rows
+for each statement
+execute function check_rental_reference_func();
+
+create or replace trigger register_rental_id_trigger
+after insert on rentals
+referencing new table as new_rows
+for each statement
+execute function register_rental_id_func();
+
+create or replace trigger cascade_rental_delete_trigger
+after delete on rentals
+referencing old table as old_rows
+for each statement
+execute function cascade_rental_delete_func();
+
+create or replace trigger restrict_rental_id_update_trigger
+before update of id on rentals
+for each row
+execute function restrict_rental_id_update_func();
+
+do $$
+declare
+    r record;
+begin
+    for r in
+        select ddl from rentals_ddl
+        order by case kind when 'rentals index' then 1 when 'trigger' then 2 else 3 end, id
+    loop
+        execute r.ddl;
+    end loop;
+end;
+$$;
+
+commit;
+
+analyze rentals;
@@ -0,0 +1,65 @@
+-- Проверка отсечения партиций после 02-audit-log-partitioning.sql и 03-rentals-partitioning.sql.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/04-partition-pruning.sql
+
+
+explain analyze
+select 
+    r.id,
+    u.name,
+    r.start_date,
+    r.end_date,
+    r.status,
+    r.total_cost,
+    count(ri.id)::int as equipment_count
+from rentals r
+join users u on r.user_id = u.id
+left join rental_items ri on r.id = ri.rental_id
+where r.start_date between current_date - 180 and current_date - 90
+group by r.id, r.start_date, r.end_date, r.status, r.total_cost, u.name
+order by r.start_date;
+
+
+explain analyze
+select * from get_monthly_revenue(current_date - 180, current_date - 90);
+
+
+explain analyze
+select * from audit_log
+where changed_at >= date_trunc('month', current_date)
+  and changed_at < date_trunc('month', current_date) + interval '1 month'
+  and table_name = 'rentals';
+
+
+do $$
+declare
+    checks text[][] := array[
+        ['rentals', 'get_rentals_period_report за квартал',
+         'select r.id from rentals r where r.start_date between current_date - 180 and current_date - 90'],
+        ['rentals', 'get_monthly_revenue за квартал',
+         'select * from get_monthly_revenue(current_date - 180, current_date - 90)'],
+        ['audit_log', 'audit_log за текущий месяц',
+         'select id from audit_log where changed_at >= date_trunc(''month'', current_date)
+              and changed_at < date_trunc(''month'', current_date) + interval ''1 month''']
+    ];
+    plan json;
+    total_partitions int;
+    scanned_partitions int;
+begin
+    for i in 1 .. array_length(checks, 1) loop
+        execute 'explain (format json) ' || checks[i][3] into plan;
+
+        select count(*) into total_partitions
+        from pg_inherits
+        where inhparent = checks[i][1]::regclass;
+
+        select count(distinct rel) into scanned_partitions
+        from regexp_matches(plan::text, '"Relation Name": "(' || checks[i][1] || '_[a-z0-9_]+)"', 'g') as rel;
+
+        if scanned_partitions = 0 or scanned_partitions >= total_partitions then
+            raise exception 'нет отсечения партиций: % (просмотрено % из %)',
+                checks[i][2], scanned_partitions, total_partitions;
+        end if;
+
+        raise notice '%: просмотрено партиций % из %', checks[i][2], scanned_partitions, total_partitions;
+    end loop;
+end $$;
@@ -0,0 +1,192 @@
+-- Периоды бронирования оборудования и запрет пересекающихся аренд.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/05-rental-item-periods.sql
+--
+-- rental_items.period заполняется из дат и статуса аренды, после чего
+-- добавляется исключающее ограничение. Если в данных уже есть
+-- пересекающиеся аренды одной единицы оборудования, миграция
+-- откатывается: такие аренды нужно исправить или отменить вручную
+-- (запрос для поиска приведён в подсказке ошибки).
+--
+-- Функции и триггеры заданы здесь в том виде, в каком их ввела эта
+-- миграция; заполнение периодов использует ту же rental_period, что и
+-- триггеры. Более поздние миграции заменяют эти определения.
+
+begin;
+
+lock table rental_items in share row exclusive mode;
+
+alter table rental_items add column if not exists period daterange;
+
+create or replace function rental_period(p_start_date date, p_end_date date, p_return_date date, p_status varchar)
+returns daterange
+language sql
+immutable
+as $$
+    select case
+        when p_status = 'Отменён' then null
+        else daterange(p_start_date, least(p_return_date, p_end_date), '[]')
+    end;
+$$;
+
+
+create or replace function is_equipment_available(p_equipment_id int, p_start_date date, p_end_date date)
+returns boolean
+language sql
+stable
+as $$
+    select exists (
+        select 1 from equipment
+        where id = p_equipment_id and status <> 'Списано'
+    )
+    and not exists (
+        select 1 from rental_items
+        where int4range(equipment_id, equipment_id, '[]') && int4range(p_equipment_id, p_equipment_id, '[]')
+        and period && daterange(p_start_date, p_end_date, '[]')
+    )
+    and not exists (
+        select 1 from repairs
+        where equipment_id = p_equipment_id
+        and status in ('Запланирован', 'В процессе')
+        and daterange(start_date, end_date, '[]') && daterange(p_start_date, p_end_date, '[]')
+    );
+$$;
+
+
+create or replace function get_available_equipment(p_start_date date, p_end_date date, p_category_id int default null)
+returns table (
+    equipment_id int,
+    inventory_number varchar(50),
+    category_id int,
+    model_name varchar(100),
+    rental_price_per_day decimal(10,2)
+)
+language sql
+stable
+as $$
+    select
+        e.id,
+        e.inventory_number,
+        e.category_id,
+        em.name,
+        em.rental_price_per_day
+    from equipment e
+    join equipment_models em on em.id = e.model_id
+    where e.status <> 'Списано'
+    and (p_category_id is null or e.category_id = p_category_id)
+    and not exists (
+        select 1 from rental_items ri
+        where int4range(ri.equipment_id, ri.equipment_id, '[]') && int4range(e.id, e.id, '[]')
+        and ri.period && daterange(p_start_date, p_end_date, '[]')
+    )
+    and not exists (
+        select 1 from repairs rp
+        where rp.equipment_id = e.id
+        and rp.status in ('Запланирован', 'В процессе')
+        and daterange(rp.start_date, rp.end_date, '[]') && daterange(p_start_date, p_end_date, '[]')
+    )
+    order by e.id;
+$$;
+
+
+create or replace function get_equipment_bookings(p_equipment_id int, p_start_date date, p_end_date date)
+returns table (
+    rental_id int,
+    start_date date,
+    end_date date
+)
+language sql
+stable
+as $$
+    select ri.rental_id, lower(ri.period), upper(ri.period) - 1
+    from rental_items ri
+    where int4range(ri.equipment_id, ri.equipment_id, '[]') && int4range(p_equipment_id, p_equipment_id, '[]')
+    and ri.period && daterange(p_start_date, p_end_date, '[]')
+    order by lower(ri.period);
+$$;
+
+
+create or replace function set_rental_item_period_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    select rental_period(r.start_date, r.end_date, r.return_date, r.status)
+    into new.period
+    from rentals r
+    where r.id = new.rental_id;
+
+    return new;
+end;
+$$;
+
+
+create or replace trigger set_rental_item_period_trigger
+before insert or update of rental_id on rental_items
+for each row
+execute function set_rental_item_period_func();
+
+
+create or replace function update_rental_item_period_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    update rental_items
+    set period = rental_period(new.start_date, new.end_date, new.return_date, new.status)
+    where rental_id = new.id
+    and period is distinct from rental_period(new.start_date, new.end_date, new.return_date, new.status);
+
+    return null;
+end;
+$$;
+
+
+create or replace trigger update_rental_item_period_trigger
+after update of start_date, end_date, return_date, status on rentals
+for each row
+when (old.start_date is distinct from new.start_date
+    or old.end_date is distinct from new.end_date
+    or old.return_date is distinct from new.return_date
+    or old.status is distinct from new.status)
+execute function update_rental_item_period_func();
+
+update rental_items ri
+set period = rental_period(r.start_date, r.end_date, r.return_date, r.status)
+from rentals r
+where r.id = ri.rental_id
+and ri.period is distinct from rental_period(r.start_date, r.end_date, r.return_date, r.status);
+
+do $$
+declare
+    v_conflicts int;
+begin
+    if exists (
+        select 1 from pg_constraint
+        where conname = 'rental_items_equipment_period_excl'
+    ) then
+        return;
+    end if;
+
+    select count(*) into v_conflicts
+    from rental_items a
+    join rental_items b on b.equipment_id = a.equipment_id
+        and b.id > a.id
+        and b.period && a.period;
+
+    if v_conflicts > 0 then
+        raise exception 'Найдено пересекающихся бронирований оборудования: %', v_conflicts
+            using hint = 'select a.equipment_id, a.rental_id, b.rental_id from rental_items a '
+                'join rental_items b on b.equipment_id = a.equipment_id and b.id > a.id and b.period && a.period';
+    end if;
+
+    alter table rental_items add constraint rental_items_equipment_period_excl
+    exclude using gist (
+        int4range(equipment_id, equipment_id, '[]') with &&,
+        period with &&
+    );
+end;
+$$;
+
+commit;
+
+analyze rental_items;
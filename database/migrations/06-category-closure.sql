@@ -0,0 +1,261 @@
+-- Таблица замыкания дерева категорий оборудования и версия кэша категорий.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/06-category-closure.sql
+--
+-- equipment_category_closure заполняется из parent_id рекурсивным
+-- запросом, дальше её поддерживают триггеры на equipment_categories.
+-- Если в parent_id уже есть цикл, миграция откатывается: входящие в него
+-- категории нужно перевесить вручную.
+
+begin;
+
+lock table equipment_categories in share row exclusive mode;
+
+create table if not exists equipment_category_closure (
+    ancestor_id int not null,
+    descendant_id int not null,
+    depth int not null check (depth >= 0),
+    primary key (ancestor_id, descendant_id),
+    foreign key (ancestor_id) references equipment_categories(id) on update cascade on delete cascade,
+    foreign key (descendant_id) references equipment_categories(id) on update cascade on delete cascade
+);
+
+create table if not exists cache_versions (
+    name varchar(50) primary key,
+    version bigint not null default 0,
+    changed_at timestamptz not null default current_timestamp
+);
+
+insert into cache_versions (name) values
+    ('equipment_categories')
+on conflict (name) do nothing;
+
+create or replace function get_available_equipment(p_start_date date, p_end_date date, p_category_id int default null)
+returns table (
+    equipment_id int,
+    inventory_number varchar(50),
+    category_id int,
+    model_name varchar(100),
+    rental_price_per_day decimal(10,2)
+)
+language sql
+stable
+as $$
+    select
+        e.id,
+        e.inventory_number,
+        e.category_id,
+        em.name,
+        em.rental_price_per_day
+    from equipment e
+    join equipment_models em on em.id = e.model_id
+    where e.status <> 'Списано'
+    and (p_category_id is null or e.category_id in (
+        select descendant_id from equipment_category_closure
+        where ancestor_id = p_category_id
+    ))
+    and not exists (
+        select 1 from rental_items ri
+        where int4range(ri.equipment_id, ri.equipment_id, '[]') && int4range(e.id, e.id, '[]')
+        and ri.period && daterange(p_start_date, p_end_date, '[]')
+    )
+    and not exists (
+        select 1 from repairs rp
+        where rp.equipment_id = e.id
+        and rp.status in ('Запланирован', 'В процессе')
+        and daterange(rp.start_date, rp.end_date, '[]') && daterange(p_start_date, p_end_date, '[]')
+    )
+    order by e.id;
+$$;
+
+
+create or replace function get_category_subtree_stats(p_category_id int, p_start_date date default null, p_end_date date default null)
+returns table (
+    category_id int,
+    name varchar(100),
+    parent_id int,
+    depth int,
+    equipment_count int,
+    rented_items int,
+    revenue decimal(12,2)
+)
+language sql
+stable
+as $$
+    with subtree as (
+        select s.descendant_id, s.depth
+        from equipment_category_closure s
+        where s.ancestor_id = p_category_id
+    ),
+    equipment_stats as (
+        select e.category_id, count(*) as equipment_count
+        from equipment e
+        join subtree s on s.descendant_id = e.category_id
+        group by e.category_id
+    ),
+    revenue_stats as (
+        select
+            e.category_id,
+            count(*) as rented_items,
+            sum(em.rental_price_per_day * greatest(
+                case
+                    when r.return_date is not null and r.return_date >= r.start_date then
+                        r.return_date - r.start_date + 1
+                    else
+                        r.end_date - r.start_date + 1
+                end, 0) + ri.damage_fee) as revenue
+        from rental_items ri
+        join rentals r on r.id = ri.rental_id
+        join equipment e on e.id = ri.equipment_id
+        join subtree s on s.descendant_id = e.category_id
+        join equipment_models em on em.id = e.model_id
+        where r.status <> 'Отменён'
+        and (p_start_date is null or r.start_date >= p_start_date)
+        and (p_end_date is null or r.start_date <= p_end_date)
+        group by e.category_id
+    )
+    select
+        c.id,
+        c.name,
+        c.parent_id,
+        s.depth,
+        coalesce(sum(es.equipment_count), 0)::int,
+        coalesce(sum(rs.rented_items), 0)::int,
+        coalesce(sum(rs.revenue), 0)::decimal(12,2)
+    from subtree s
+    join equipment_categories c on c.id = s.descendant_id
+    join equipment_category_closure d on d.ancestor_id = s.descendant_id
+    left join equipment_stats es on es.category_id = d.descendant_id
+    left join revenue_stats rs on rs.category_id = d.descendant_id
+    group by c.id, c.name, c.parent_id, s.depth
+    order by s.depth, c.id;
+$$;
+
+
+create or replace function insert_category_closure_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into equipment_category_closure (ancestor_id, descendant_id, depth)
+    select c.ancestor_id, new.id, c.depth + 1
+    from equipment_category_closure c
+    where c.descendant_id = new.parent_id
+    union all
+    select new.id, new.id, 0;
+
+    return null;
+end;
+$$;
+
+
+create or replace trigger insert_category_closure_trigger
+after insert on equipment_categories
+for each row
+execute function insert_category_closure_func();
+
+
+create or replace function move_category_closure_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    lock table equipment_category_closure in share row exclusive mode;
+
+    if exists (
+        select 1 from equipment_category_closure
+        where ancestor_id = new.id and descendant_id = new.parent_id
+    ) then
+        raise exception 'Категория % не может быть вложена в собственную подкатегорию %', new.id, new.parent_id;
+    end if;
+
+    delete from equipment_category_closure c
+    using equipment_category_closure sub
+    where sub.ancestor_id = new.id
+    and c.descendant_id = sub.descendant_id
+    and c.depth > sub.depth;
+
+    insert into equipment_category_closure (ancestor_id, descendant_id, depth)
+    select p.ancestor_id, sub.descendant_id, p.depth + sub.depth + 1
+    from equipment_category_closure p
+    join equipment_category_closure sub on sub.ancestor_id = new.id
+    where p.descendant_id = new.parent_id;
+
+    return null;
+end;
+$$;
+
+
+create or replace trigger move_category_closure_trigger
+after update of parent_id on equipment_categories
+for each row
+when (old.parent_id is distinct from new.parent_id)
+execute function move_category_closure_func();
+
+
+create or replace function bump_cache_version_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    update cache_versions
+    set version = version + 1,
+        changed_at = current_timestamp
+    where name = tg_table_name;
+
+    return null;
+end;
+$$;
+
+
+create or replace trigger equipment_categories_cache_version_trigger
+after insert or update or delete or truncate on equipment_categories
+for each statement
+execute function bump_cache_version_func();
+
+do $$
+declare
+    v_cycle int[];
+begin
+    with recursive tree as (
+        select id, parent_id
+        from equipment_categories
+        union all
+        select t.id, c.parent_id
+        from tree t
+        join equipment_categories c on c.id = t.parent_id
+    ) cycle id, parent_id set is_cycle using path
+    select array_agg(distinct id) into v_cycle
+    from tree
+    where is_cycle;
+
+    if v_cycle is not null then
+        raise exception 'Найден цикл в дереве категорий: %', v_cycle;
+    end if;
+end;
+$$;
+
+truncate equipment_category_closure;
+
+insert into equipment_category_closure (ancestor_id, descendant_id, depth)
+with recursive tree as (
+    select id as ancestor_id, id as descendant_id, 0 as depth
+    from equipment_categories
+    union all
+    select t.ancestor_id, c.id, t.depth + 1
+    from tree t
+    join equipment_categories c on c.parent_id = t.descendant_id
+)
+select ancestor_id, descendant_id, depth
+from tree;
+
+create index if not exists idx_category_closure_descendant on equipment_category_closure (descendant_id, ancestor_id);
+create index if not exists idx_equipment_category_id on equipment (category_id);
+
+update cache_versions
+set version = version + 1,
+    changed_at = current_timestamp
+where name = 'equipment_categories';
+
+commit;
+
+analyze equipment_category_closure;
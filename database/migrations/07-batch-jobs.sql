@@ -0,0 +1,27 @@
+-- Таблица фоновых задач загрузки данных (POST /batch/load_data).
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/07-batch-jobs.sql
+
+begin;
+
+create table if not exists batch_jobs (
+    id serial primary key,
+    kind varchar(30) not null,
+    status varchar(20) not null default 'queued'
+        check (status in ('queued', 'running', 'succeeded', 'failed', 'cancelled')),
+    params jsonb not null default '{}',
+    idempotency_key varchar(100) unique,
+    step varchar(50),
+    planned jsonb not null default '{}',
+    loaded jsonb not null default '{}',
+    cancel_requested boolean not null default false,
+    error text,
+    created_at timestamptz not null default current_timestamp,
+    started_at timestamptz,
+    updated_at timestamptz not null default current_timestamp,
+    finished_at timestamptz
+);
+
+create unique index if not exists batch_jobs_active_kind on batch_jobs (kind)
+where status in ('queued', 'running');
+
+commit;
@@ -0,0 +1,27 @@
+-- Запуски и контрольные точки инкрементальной загрузки данных
+-- (scripts/data_load.py --incremental / --append).
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/08-data-load-checkpoints.sql
+
+begin;
+
+create table if not exists data_load_runs (
+    id serial primary key,
+    status varchar(20) not null default 'running'
+        check (status in ('running', 'completed', 'failed')),
+    params jsonb not null,
+    started_at timestamptz not null default current_timestamp,
+    updated_at timestamptz not null default current_timestamp,
+    finished_at timestamptz
+);
+
+create table if not exists data_load_checkpoints (
+    run_id int not null references data_load_runs(id) on delete cascade,
+    step varchar(50) not null,
+    partition int not null default 0,
+    next_id bigint,
+    completed boolean not null default false,
+    updated_at timestamptz not null default current_timestamp,
+    primary key (run_id, step, partition)
+);
+
+commit;
@@ -0,0 +1,11 @@
+-- Индексы внешних ключей rentals.user_id, rentals.employee_id и
+-- rental_items.equipment_id, найденные scripts/plan_check.py.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/09-foreign-key-indexes.sql
+
+begin;
+
+create index if not exists idx_rentals_user_id on rentals (user_id);
+create index if not exists idx_rentals_employee_id on rentals (employee_id);
+create index if not exists idx_rental_items_equipment_id on rental_items (equipment_id);
+
+commit;
@@ -0,0 +1,150 @@
+-- Поиск по каталогу оборудования (/equipment/search): столбцы
+-- search_vector моделей и категорий, таблица equipment_search, триггеры
+-- пересчёта и индексы поиска.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/10-equipment-search.sql
+--
+-- pg_trgm создаётся, если расширение есть на сервере. Без него поиск
+-- работает, но не находит номера и модели с опечатками.
+
+begin;
+
+alter table equipment_categories add column if not exists search_vector tsvector generated always as (
+    setweight(to_tsvector('russian', coalesce(name, '')), 'C')
+) stored;
+
+alter table equipment_models add column if not exists search_vector tsvector generated always as (
+    setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(brand, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce(description, '')), 'D')
+) stored;
+
+create table if not exists equipment_search (
+    equipment_id int primary key,
+    search_vector tsvector not null,
+    foreign key (equipment_id) references equipment(id) on update cascade on delete cascade
+);
+
+create or replace function equipment_search_vector(p_inventory_number varchar, p_model_vector tsvector, p_category_vector tsvector)
+returns tsvector
+language sql
+immutable
+as $$
+    -- Тексты моделей и категорий уже разобраны в их search_vector:
+    -- для каждой единицы оборудования разбирается только номер. Без замены
+    -- разделителей парсер прочитал бы «INV-000123» как «inv» и число -000123
+    select
+        setweight(to_tsvector('simple', translate(coalesce(p_inventory_number, ''), '-_/.', '    ')), 'A') ||
+        p_model_vector || p_category_vector;
+$$;
+
+
+create or replace function refresh_equipment_search_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' then
+        insert into equipment_search (equipment_id, search_vector)
+        select n.id, equipment_search_vector(n.inventory_number, em.search_vector, ec.search_vector)
+        from new_rows n
+        join equipment_models em on em.id = n.model_id
+        join equipment_categories ec on ec.id = n.category_id;
+    else
+        -- Смена статуса вектор не меняет: пересчитываются только строки
+        -- с новой моделью, категорией или номером
+        insert into equipment_search (equipment_id, search_vector)
+        select n.id, equipment_search_vector(n.inventory_number, em.search_vector, ec.search_vector)
+        from new_rows n
+        join old_rows o on o.id = n.id
+        join equipment_models em on em.id = n.model_id
+        join equipment_categories ec on ec.id = n.category_id
+        where (n.model_id, n.category_id, n.inventory_number)
+            is distinct from (o.model_id, o.category_id, o.inventory_number)
+        on conflict (equipment_id) do update
+        set search_vector = excluded.search_vector;
+    end if;
+
+    return null;
+end;
+$$;
+
+
+create or replace trigger refresh_equipment_search_insert_trigger
+after insert on equipment
+referencing new table as new_rows
+for each statement
+execute function refresh_equipment_search_func();
+
+
+create or replace trigger refresh_equipment_search_update_trigger
+after update on equipment
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function refresh_equipment_search_func();
+
+
+create or replace function update_equipment_search_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    update equipment_search s
+    set search_vector = equipment_search_vector(e.inventory_number, em.search_vector, ec.search_vector)
+    from equipment e
+    join equipment_models em on em.id = e.model_id
+    join equipment_categories ec on ec.id = e.category_id
+    where s.equipment_id = e.id
+    and ((tg_table_name = 'equipment_models' and e.model_id = new.id)
+        or (tg_table_name = 'equipment_categories' and e.category_id = new.id));
+
+    return null;
+end;
+$$;
+
+
+create or replace trigger update_equipment_search_model_trigger
+after update on equipment_models
+for each row
+when (old.search_vector is distinct from new.search_vector)
+execute function update_equipment_search_func();
+
+
+create or replace trigger update_equipment_search_category_trigger
+after update on equipment_categories
+for each row
+when (old.search_vector is distinct from new.search_vector)
+execute function update_equipment_search_func();
+
+insert into equipment_search (equipment_id, search_vector)
+select e.id, equipment_search_vector(e.inventory_number, em.search_vector, ec.search_vector)
+from equipment e
+join equipment_models em on em.id = e.model_id
+join equipment_categories ec on ec.id = e.category_id
+on conflict (equipment_id) do update
+set search_vector = excluded.search_vector;
+
+-- поиск по каталогу оборудования (/equipment/search)
+create index if not exists idx_equipment_search_vector on equipment_search using gin (search_vector);
+create index if not exists idx_equipment_inventory_number_prefix on equipment (upper(inventory_number) text_pattern_ops);
+create index if not exists idx_equipment_model_id on equipment (model_id);
+
+-- pg_trgm (contrib) нужен для поиска с опечатками. Если расширения нет на
+-- сервере, поиск обходится полнотекстовым индексом и префиксом номера
+do $$
+begin
+    create extension if not exists pg_trgm;
+exception when others then
+    raise notice 'pg_trgm недоступен: %', sqlerrm;
+end;
+$$;
+
+do $$
+begin
+    if exists (select 1 from pg_extension where extname = 'pg_trgm') then
+        create index if not exists idx_equipment_inventory_number_trgm on equipment using gin (inventory_number gin_trgm_ops);
+        create index if not exists idx_equipment_models_name_trgm on equipment_models using gin (name gin_trgm_ops);
+    end if;
+end;
+$$;
+
+commit;
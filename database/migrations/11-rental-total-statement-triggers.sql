@@ -0,0 +1,125 @@
+-- Пересчёт стоимости аренды триггерами уровня выражения: построчный
+-- триггер calculate_rental_total_cost_items_trigger заменяется триггерами
+-- на вставку, изменение и удаление позиций с таблицами переходов.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/11-rental-total-statement-triggers.sql
+--
+-- Триггерная функция пересчитывает стоимость всех затронутых аренд одним
+-- вызовом recalculate_rental_total_cost, поэтому функция создаётся здесь же.
+
+begin;
+
+drop trigger if exists calculate_rental_total_cost_items_trigger on rental_items;
+
+create or replace function recalculate_rental_total_cost(p_rental_ids int[])
+returns int
+language plpgsql
+as $$
+declare
+    updated_count int;
+begin
+    update rentals r
+    set total_cost = t.new_total
+    from (
+        select 
+            rr.id,
+            coalesce(sum(em.rental_price_per_day * greatest(
+                case 
+                    when rr.return_date is not null and rr.return_date >= rr.start_date then 
+                        rr.return_date - rr.start_date + 1
+                    else 
+                        rr.end_date - rr.start_date + 1
+                end, 0) + ri.damage_fee), 0) as new_total
+        from rentals rr
+        left join rental_items ri on rr.id = ri.rental_id
+        left join equipment e on ri.equipment_id = e.id
+        left join equipment_models em on e.model_id = em.id
+        where rr.id = any(p_rental_ids)
+        group by rr.id
+    ) t
+    where r.id = t.id and r.total_cost is distinct from t.new_total;
+
+    get diagnostics updated_count = row_count;
+    return updated_count;
+end;
+$$;
+
+
+create or replace function calculate_rental_total_cost_func()
+returns trigger
+language plpgsql
+as $$
+declare
+    target_rental_ids int[];
+begin
+    if current_setting('app.bulk_load', true) = 'on' then
+        return null;
+    end if;
+
+    if tg_level = 'ROW' then
+        target_rental_ids := array[new.id];
+    elsif tg_table_name = 'rental_items' then
+        if tg_op = 'INSERT' then
+            select array_agg(distinct rental_id) into target_rental_ids
+            from new_items;
+        elsif tg_op = 'UPDATE' then
+            select array_agg(rental_id) into target_rental_ids
+            from (
+                select rental_id from new_items
+                union
+                select rental_id from old_items
+            ) changed;
+        else
+            select array_agg(distinct rental_id) into target_rental_ids
+            from old_items;
+        end if;
+    else
+        select array_agg(id) into target_rental_ids
+        from new_rentals;
+    end if;
+
+    if target_rental_ids is not null then
+        perform recalculate_rental_total_cost(target_rental_ids);
+    end if;
+
+    return null;
+end;
+$$;
+
+
+create or replace trigger calculate_rental_total_cost_insert_trigger
+after insert on rentals
+referencing new table as new_rentals
+for each statement
+execute function calculate_rental_total_cost_func();
+
+
+create or replace trigger calculate_rental_total_cost_date_trigger
+after update of start_date, end_date, return_date on rentals
+for each row
+when (old.start_date is distinct from new.start_date
+    or old.end_date is distinct from new.end_date
+    or old.return_date is distinct from new.return_date)
+execute function calculate_rental_total_cost_func();
+
+
+create or replace trigger calculate_rental_total_cost_items_insert_trigger
+after insert on rental_items
+referencing new table as new_items
+for each statement
+execute function calculate_rental_total_cost_func();
+
+
+create or replace trigger calculate_rental_total_cost_items_update_trigger
+after update on rental_items
+referencing old table as old_items new table as new_items
+for each statement
+execute function calculate_rental_total_cost_func();
+
+
+create or replace trigger calculate_rental_total_cost_items_delete_trigger
+after delete on rental_items
+referencing old table as old_items
+for each statement
+execute function calculate_rental_total_cost_func();
+
+commit;
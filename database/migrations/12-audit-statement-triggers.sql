@@ -0,0 +1,248 @@
+-- Очередь аудита и аудит триггерами уровня выражения: строки пишутся в
+-- нелогируемую audit_log_queue одним insert, фоновая задача API переносит
+-- их в audit_log функцией drain_audit_log_queue. Настройки audit_settings
+-- читаются один раз на выражение. Построчные триггеры log_audit_*_trigger
+-- заменяются триггерами на вставку, изменение и удаление с таблицами
+-- переходов.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/12-audit-statement-triggers.sql
+
+begin;
+
+create unlogged table if not exists audit_log_queue (
+    id bigserial primary key,
+    table_name varchar(50) not null,
+    record_id int not null,
+    operation varchar(10) not null,
+    old_data jsonb,
+    new_data jsonb,
+    changed_at timestamp default current_timestamp
+);
+
+create table if not exists audit_settings (
+    table_name varchar(50) primary key,
+    level varchar(10) not null default 'diff' check (level in ('full', 'diff', 'minimal', 'off')),
+    sample_rate decimal(4,3) not null default 1 check (sample_rate between 0 and 1)
+);
+
+insert into audit_settings (table_name, level, sample_rate) values
+    ('users', 'diff', 1),
+    ('equipment', 'diff', 1),
+    ('rentals', 'diff', 1),
+    ('payments', 'diff', 1),
+    ('repairs', 'diff', 1)
+on conflict (table_name) do nothing;
+
+create or replace function drain_audit_log_queue(p_batch_size int default 1000)
+returns int
+language plpgsql
+as $$
+declare
+    moved_count int;
+begin
+    with batch as (
+        delete from audit_log_queue
+        where id in (
+            select id
+            from audit_log_queue
+            order by id
+            limit p_batch_size
+            for update skip locked
+        )
+        returning id, table_name, record_id, operation, old_data, new_data, changed_at
+    )
+    insert into audit_log (table_name, record_id, operation, old_data, new_data, changed_at)
+    select table_name, record_id, operation, old_data, new_data, changed_at
+    from batch
+    order by id;
+
+    get diagnostics moved_count = row_count;
+    return moved_count;
+end;
+$$;
+
+
+drop trigger if exists log_audit_users_trigger on users;
+drop trigger if exists log_audit_equipment_trigger on equipment;
+drop trigger if exists log_audit_rentals_trigger on rentals;
+drop trigger if exists log_audit_payments_trigger on payments;
+drop trigger if exists log_audit_repairs_trigger on repairs;
+
+create or replace function log_audit_func()
+returns trigger
+language plpgsql
+as $$
+declare
+    audit_level varchar(10);
+    audit_sample_rate decimal(4,3);
+begin
+    if current_setting('app.bulk_load', true) = 'on' then
+        return null;
+    end if;
+
+    -- Настройки читаются один раз на выражение, строки пишутся в очередь
+    -- одним insert из таблиц переходов
+    select level, sample_rate
+    into audit_level, audit_sample_rate
+    from audit_settings
+    where table_name = tg_table_name;
+
+    audit_level := coalesce(audit_level, 'diff');
+    audit_sample_rate := coalesce(audit_sample_rate, 1);
+    if audit_level = 'off' or audit_sample_rate = 0 then
+        return null;
+    end if;
+
+    if tg_op = 'INSERT' then
+        -- На уровне diff вставка пишет только id: значения есть в самой
+        -- строке, а их последующие изменения сохраняют старые значения
+        insert into audit_log_queue (table_name, record_id, operation, old_data, new_data)
+        select tg_table_name, n.id, tg_op, null,
+            case when audit_level = 'full' then to_jsonb(n) end
+        from new_rows n
+        where random() < audit_sample_rate;
+    elsif tg_op = 'DELETE' then
+        -- Удалённую строку больше не из чего восстановить, поэтому на
+        -- уровне diff сохраняется её последнее состояние без null
+        insert into audit_log_queue (table_name, record_id, operation, old_data, new_data)
+        select tg_table_name, o.id, tg_op,
+            case audit_level
+                when 'full' then to_jsonb(o)
+                when 'diff' then jsonb_strip_nulls(to_jsonb(o))
+            end,
+            null
+        from old_rows o
+        where random() < audit_sample_rate;
+    elsif audit_level = 'full' then
+        insert into audit_log_queue (table_name, record_id, operation, old_data, new_data)
+        select tg_table_name, n.id, tg_op, to_jsonb(o), to_jsonb(n)
+        from new_rows n
+        join old_rows o on o.id = n.id
+        where random() < audit_sample_rate;
+    else
+        insert into audit_log_queue (table_name, record_id, operation, old_data, new_data)
+        select tg_table_name, n.id, tg_op,
+            case when audit_level = 'diff' then diff.old_values end,
+            case when audit_level = 'diff' then diff.new_values end
+        from new_rows n
+        join old_rows o on o.id = n.id
+        cross join lateral (
+            select jsonb_object_agg(nv.key, ov.value) as old_values,
+                jsonb_object_agg(nv.key, nv.value) as new_values
+            from jsonb_each(to_jsonb(n)) nv
+            join jsonb_each(to_jsonb(o)) ov on ov.key = nv.key
+            where nv.value is distinct from ov.value
+        ) diff
+        where diff.new_values is not null
+        and random() < audit_sample_rate;
+    end if;
+
+    return null;
+end;
+$$;
+
+
+create or replace trigger log_audit_users_insert_trigger
+after insert on users
+referencing new table as new_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_users_update_trigger
+after update on users
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_users_delete_trigger
+after delete on users
+referencing old table as old_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_equipment_insert_trigger
+after insert on equipment
+referencing new table as new_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_equipment_update_trigger
+after update on equipment
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_equipment_delete_trigger
+after delete on equipment
+referencing old table as old_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_rentals_insert_trigger
+after insert on rentals
+referencing new table as new_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_rentals_update_trigger
+after update on rentals
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_rentals_delete_trigger
+after delete on rentals
+referencing old table as old_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_payments_insert_trigger
+after insert on payments
+referencing new table as new_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_payments_update_trigger
+after update on payments
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_payments_delete_trigger
+after delete on payments
+referencing old table as old_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_repairs_insert_trigger
+after insert on repairs
+referencing new table as new_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_repairs_update_trigger
+after update on repairs
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function log_audit_func();
+
+
+create or replace trigger log_audit_repairs_delete_trigger
+after delete on repairs
+referencing old table as old_rows
+for each statement
+execute function log_audit_func();
+
+commit;
@@ -0,0 +1,163 @@
+-- Занятость просроченных и поздно возвращённых аренд.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/13-rental-period-overdue.sql
+--
+-- rental_period больше не обрезает период по end_date: у невозвращённой
+-- просроченной аренды верхняя граница открыта, у возвращённой период
+-- длится до return_date. Продление обрезается по началу бронирования той
+-- же единицы, принятого раньше (rental_item_period).
+
+begin;
+
+lock table rental_items in share row exclusive mode;
+
+create or replace function rental_period(p_start_date date, p_end_date date, p_return_date date, p_status varchar)
+returns daterange
+language sql
+immutable
+as $$
+    select case
+        when p_status = 'Отменён' then null
+        when p_return_date is not null then daterange(p_start_date, p_return_date, '[]')
+        -- Не возвращённое после срока оборудование занято до возврата
+        when p_status = 'Просрочен срок аренды' then daterange(p_start_date, null, '[)')
+        else daterange(p_start_date, p_end_date, '[]')
+    end;
+$$;
+
+
+-- Занятость позиции аренды. Продление после end_date (просрочка или поздний
+-- возврат) не заходит на бронирование той же единицы, принятое раньше:
+-- период обрезается по его началу, иначе пометка просрочки или возврат
+-- нарушили бы исключающее ограничение
+create or replace function rental_item_period(p_equipment_id int, p_start_date date, p_end_date date,
+                                              p_return_date date, p_status varchar)
+returns daterange
+language sql
+stable
+as $$
+    select case
+        when upper_inf(p.period) or upper(p.period) > p_end_date + 1 then
+            daterange(lower(p.period), least(upper(p.period), (
+                select min(lower(ri.period))
+                from rental_items ri
+                where int4range(ri.equipment_id, ri.equipment_id, '[]') && int4range(p_equipment_id, p_equipment_id, '[]')
+                and ri.period && daterange(p_end_date, null, '()')
+                and lower(ri.period) > p_end_date
+            )), '[)')
+        else p.period
+    end
+    from (select rental_period(p_start_date, p_end_date, p_return_date, p_status) as period) p;
+$$;
+
+
+create or replace function get_equipment_utilization(p_start_date date default null, p_end_date date default null, p_equipment_ids int[] default null)
+returns table (
+    equipment_id int,
+    inventory_number varchar(50),
+    model_name varchar(100),
+    rentals_count int,
+    booked_days int,
+    utilization decimal(6,4),
+    avg_rental_days decimal(5,1),
+    projected_revenue decimal(12,2)
+)
+language sql
+stable
+as $$
+    with usage as (
+        select
+            ri.equipment_id,
+            count(*) as rentals_count,
+            sum(b.days) as booked_days,
+            avg(r.end_date - r.start_date + 1) filter (where r.status = 'Завершён') as avg_rental_days,
+            sum(em.rental_price_per_day * b.days) as projected_revenue
+        from (select daterange(p_start_date, p_end_date, '[]') as period) w
+        join rental_items ri on ri.period && w.period
+        join rentals r on r.id = ri.rental_id
+        join equipment e on e.id = ri.equipment_id
+        join equipment_models em on em.id = e.model_id
+        -- Открытая занятость просроченной аренды считается по сегодняшний день
+        cross join lateral (
+            select coalesce(upper(ri.period * w.period), current_date + 1) - lower(ri.period * w.period) as days
+        ) b
+        where p_equipment_ids is null or ri.equipment_id = any(p_equipment_ids)
+        group by ri.equipment_id
+    )
+    select
+        e.id,
+        e.inventory_number,
+        em.name,
+        coalesce(u.rentals_count, 0)::int,
+        coalesce(u.booked_days, 0)::int,
+        case
+            when p_start_date is not null and p_end_date is not null then
+                round(coalesce(u.booked_days, 0)::decimal / (p_end_date - p_start_date + 1), 4)
+        end,
+        coalesce(u.avg_rental_days, 0)::decimal(5,1),
+        coalesce(u.projected_revenue, 0)::decimal(12,2)
+    from equipment e
+    join equipment_models em on em.id = e.model_id
+    left join usage u on u.equipment_id = e.id
+    where p_equipment_ids is null or e.id = any(p_equipment_ids);
+$$;
+
+
+create or replace function set_rental_item_period_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    select rental_item_period(new.equipment_id, r.start_date, r.end_date, r.return_date, r.status)
+    into new.period
+    from rentals r
+    where r.id = new.rental_id;
+
+    return new;
+end;
+$$;
+
+
+create or replace trigger set_rental_item_period_trigger
+before insert or update of rental_id, equipment_id on rental_items
+for each row
+execute function set_rental_item_period_func();
+
+
+create or replace function update_rental_item_period_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    update rental_items ri
+    set period = p.period
+    from (
+        select id, rental_item_period(equipment_id, new.start_date, new.end_date, new.return_date, new.status) as period
+        from rental_items
+        where rental_id = new.id
+    ) p
+    where ri.id = p.id
+    and ri.period is distinct from p.period;
+
+    return null;
+end;
+$$;
+
+
+create or replace trigger update_rental_item_period_trigger
+after update of start_date, end_date, return_date, status on rentals
+for each row
+when (old.start_date is distinct from new.start_date
+    or old.end_date is distinct from new.end_date
+    or old.return_date is distinct from new.return_date
+    or old.status is distinct from new.status)
+execute function update_rental_item_period_func();
+
+update rental_items ri
+set period = rental_item_period(ri.equipment_id, r.start_date, r.end_date, r.return_date, r.status)
+from rentals r
+where r.id = ri.rental_id
+and ri.period is distinct from rental_item_period(ri.equipment_id, r.start_date, r.end_date, r.return_date, r.status);
+
+commit;
+
+analyze rental_items;
@@ -0,0 +1,29 @@
+-- Версия кэша дерева категорий после очистки cache_versions.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/14-cache-version-upsert.sql
+--
+-- bump_cache_version_func создаёт недостающую строку вместо обновления,
+-- которое после TRUNCATE cache_versions ничего не находило.
+
+begin;
+
+create or replace function bump_cache_version_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- Строка может отсутствовать после очистки таблицы: тогда она создаётся
+    insert into cache_versions as v (name, version)
+    values (tg_table_name, 1)
+    on conflict (name) do update
+    set version = v.version + 1,
+        changed_at = current_timestamp;
+
+    return null;
+end;
+$$;
+
+insert into cache_versions (name) values
+    ('equipment_categories')
+on conflict (name) do nothing;
+
+commit;
@@ -0,0 +1,58 @@
+-- Быстрая загрузка data_load.py --fast.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/15-fast-load.sql
+--
+-- Триггер статуса оборудования пропускает строки сессий с app.bulk_load = on,
+-- mark_rented_equipment выставляет статусы после загрузки одним запросом.
+-- log_audit_func и calculate_rental_total_cost_func с той же проверкой и
+-- recalculate_rental_total_cost заданы миграциями 11 и 12.
+
+begin;
+
+create or replace function mark_rented_equipment(p_rental_ids int[])
+returns int
+language plpgsql
+as $$
+declare
+    updated_count int;
+begin
+    update equipment e
+    set status = 'В аренде'
+    where e.status <> 'В аренде'
+      and e.id in (
+        select ri.equipment_id
+        from rental_items ri
+        join rentals r on ri.rental_id = r.id
+        where r.id = any(p_rental_ids)
+          and r.status = 'Активен'
+    );
+
+    get diagnostics updated_count = row_count;
+    return updated_count;
+end;
+$$;
+
+
+create or replace function update_equipment_status_rental_insert_func()
+returns trigger
+language plpgsql
+as $$
+begin
+    if current_setting('app.bulk_load', true) = 'on' then
+        return new;
+    end if;
+
+    if exists (
+        select 1 from rentals 
+        where id = new.rental_id 
+        and status = 'Активен'
+    ) then
+        update equipment 
+        set status = 'В аренде'
+        where id = new.equipment_id;
+    end if;
+    
+    return new;
+end;
+$$;
+
+commit;
@@ -0,0 +1,17 @@
+-- Индексы для постраничной выдачи /reports/* по ключу.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/17-report-keyset-indexes.sql
+--
+-- Порядок столбцов совпадает с сортировкой эндпоинтов: следующая страница
+-- читается по индексу от последнего ключа предыдущей.
+
+begin;
+
+create index if not exists idx_mv_active_rentals_keyset on mv_active_rentals (end_date, rental_id);
+create index if not exists idx_mv_overdue_rentals_keyset on mv_overdue_rentals (days_overdue desc, rental_id);
+create index if not exists idx_mv_client_stats_keyset on mv_client_stats (total_rentals desc, client_id);
+
+-- v_active_rentals с пагинацией по ключу (end_date, rental_id)
+create index if not exists idx_rentals_active_end_date_id on rentals (end_date, id)
+where status = 'Активен';
+
+commit;
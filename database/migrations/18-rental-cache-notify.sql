@@ -0,0 +1,87 @@
+-- Уведомления rental_changes для кэша аренд в API.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/18-rental-cache-notify.sql
+--
+-- Триггеры уровня выражения на rentals и rental_items шлют NOTIFY со
+-- списком изменённых аренд; слушатель API сбрасывает их записи в кэше.
+
+begin;
+
+create or replace function notify_rental_change_func()
+returns trigger
+language plpgsql
+as $$
+declare
+    payload text;
+begin
+    if current_setting('app.bulk_load', true) = 'on' then
+        return null;
+    end if;
+
+    if tg_table_name = 'rental_items' then
+        if tg_op = 'INSERT' then
+            select string_agg(distinct rental_id::text, ',') into payload
+            from new_rows;
+        elsif tg_op = 'UPDATE' then
+            select string_agg(rental_id::text, ',') into payload
+            from (
+                select rental_id from new_rows
+                union
+                select rental_id from old_rows
+            ) changed;
+        else
+            select string_agg(distinct rental_id::text, ',') into payload
+            from old_rows;
+        end if;
+    elsif tg_op = 'UPDATE' then
+        select string_agg(id::text, ',') into payload
+        from new_rows;
+    else
+        select string_agg(id::text, ',') into payload
+        from old_rows;
+    end if;
+
+    -- Размер уведомления ограничен 8000 байт: при большом изменении
+    -- слушатели сбрасывают кэш целиком
+    if length(payload) > 7900 then
+        payload := '*';
+    end if;
+
+    if payload is not null then
+        perform pg_notify('rental_changes', payload);
+    end if;
+
+    return null;
+end;
+$$;
+
+create or replace trigger notify_rental_change_update_trigger
+after update on rentals
+referencing new table as new_rows
+for each statement
+execute function notify_rental_change_func();
+
+create or replace trigger notify_rental_change_delete_trigger
+after delete on rentals
+referencing old table as old_rows
+for each statement
+execute function notify_rental_change_func();
+
+create or replace trigger notify_rental_change_items_insert_trigger
+after insert on rental_items
+referencing new table as new_rows
+for each statement
+execute function notify_rental_change_func();
+
+create or replace trigger notify_rental_change_items_update_trigger
+after update on rental_items
+referencing old table as old_rows new table as new_rows
+for each statement
+execute function notify_rental_change_func();
+
+create or replace trigger notify_rental_change_items_delete_trigger
+after delete on rental_items
+referencing old table as old_rows
+for each statement
+execute function notify_rental_change_func();
+
+commit;
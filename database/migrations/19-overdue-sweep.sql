@@ -0,0 +1,57 @@
+-- Перевод просроченных аренд в «Просрочен срок аренды» без записи в них.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/19-overdue-sweep.sql
+--
+-- mark_overdue_rentals обновляет одну порцию, sweep_overdue_rentals
+-- проходит все порции и фиксирует каждую отдельно (для cron и pg_cron).
+
+begin;
+
+create or replace function mark_overdue_rentals(p_batch_size int default 1000)
+returns int
+language plpgsql
+as $$
+declare
+    updated_count int;
+begin
+    update rentals r
+    set status = 'Просрочен срок аренды'
+    from (
+        select id, start_date
+        from rentals
+        where status = 'Активен'
+        and end_date < current_date
+        and return_date is null
+        order by end_date
+        limit p_batch_size
+        for update skip locked
+    ) due
+    where r.id = due.id
+    and r.start_date = due.start_date;
+
+    get diagnostics updated_count = row_count;
+    return updated_count;
+end;
+$$;
+
+
+create or replace procedure sweep_overdue_rentals(p_batch_size int default 1000)
+language plpgsql
+as $$
+declare
+    batch_count int;
+    total_count int := 0;
+    started_at timestamptz := clock_timestamp();
+begin
+    loop
+        batch_count := mark_overdue_rentals(p_batch_size);
+        total_count := total_count + batch_count;
+        commit;
+        exit when batch_count < p_batch_size;
+    end loop;
+
+    raise notice 'Переведено в просроченные: % аренд за % мс', total_count,
+        round(extract(epoch from clock_timestamp() - started_at) * 1000);
+end;
+$$;
+
+commit;
@@ -0,0 +1,124 @@
+-- Пакетные расчёты штрафов и загрузки оборудования.
+-- Запуск: psql -d cp -v ON_ERROR_STOP=1 -f database/migrations/20-batch-report-functions.sql
+--
+-- calculate_late_fees считает штрафы по списку аренд одним запросом,
+-- повторы в списке не дают повторных строк. get_equipment_utilization
+-- заменяет версию миграции 13: дни периода обрезаются по окну, а не
+-- возвращённая просроченная аренда занимает оборудование только по
+-- сегодняшний день.
+
+begin;
+
+create or replace function calculate_late_fees(p_rental_ids int[] default null, p_daily_fee decimal(10,2) default 500.00, p_fixed_fee decimal(10,2) default 1000.00)
+returns table (
+    rental_id int,
+    end_date date,
+    status varchar(25),
+    days_overdue int,
+    total_cost decimal(10,2),
+    late_fee decimal(10,2),
+    projected_total decimal(12,2)
+)
+language sql
+stable
+as $$
+    with targets as (
+        select r.id, r.end_date, r.status, r.total_cost
+        from rentals r
+        where p_rental_ids is null
+        and r.status = 'Просрочен срок аренды'
+        union all
+        select r.id, r.end_date, r.status, r.total_cost
+        from rentals r
+        where r.id in (select distinct unnest(p_rental_ids))
+    ),
+    fees as (
+        select
+            t.*,
+            case
+                when t.status = 'Просрочен срок аренды' and t.end_date < current_date then
+                    current_date - t.end_date
+                else 0
+            end as late_days
+        from targets t
+    )
+    select
+        f.id,
+        f.end_date,
+        f.status,
+        f.late_days,
+        f.total_cost,
+        case
+            when f.late_days > 0 then p_fixed_fee + f.late_days * p_daily_fee
+            else 0
+        end::decimal(10,2),
+        (coalesce(f.total_cost, 0) + case
+            when f.late_days > 0 then p_fixed_fee + f.late_days * p_daily_fee
+            else 0
+        end)::decimal(12,2)
+    from fees f;
+$$;
+
+
+create or replace function get_equipment_utilization(p_start_date date default null, p_end_date date default null, p_equipment_ids int[] default null)
+returns table (
+    equipment_id int,
+    inventory_number varchar(50),
+    model_name varchar(100),
+    rentals_count int,
+    booked_days int,
+    utilization decimal(6,4),
+    avg_rental_days decimal(5,1),
+    projected_revenue decimal(12,2)
+)
+language sql
+stable
+as $$
+    with usage as (
+        select
+            ri.equipment_id,
+            count(*) as rentals_count,
+            sum(b.days) as booked_days,
+            avg(r.end_date - r.start_date + 1) filter (where r.status = 'Завершён') as avg_rental_days,
+            sum(em.rental_price_per_day * b.days) as projected_revenue
+        from (select daterange(p_start_date, p_end_date, '[]') as period) w
+        join rental_items ri on ri.period && w.period
+        join rentals r on r.id = ri.rental_id
+        join equipment e on e.id = ri.equipment_id
+        join equipment_models em on em.id = e.model_id
+        -- Период обрезается по границам окна, а занятость не возвращённой
+        -- просроченной аренды считается только по сегодняшний день: иначе
+        -- окно в будущем получало бы её дни или отрицательное число дней
+        cross join lateral (
+            select greatest(
+                least(
+                    coalesce(upper(ri.period) - 1, current_date),
+                    p_end_date,
+                    case when r.status = 'Просрочен срок аренды' and r.return_date is null then current_date end
+                ) - greatest(lower(ri.period), p_start_date) + 1,
+                0
+            ) as days
+        ) b
+        where (p_equipment_ids is null or ri.equipment_id = any(p_equipment_ids))
+        and b.days > 0
+        group by ri.equipment_id
+    )
+    select
+        e.id,
+        e.inventory_number,
+        em.name,
+        coalesce(u.rentals_count, 0)::int,
+        coalesce(u.booked_days, 0)::int,
+        case
+            when p_start_date is not null and p_end_date is not null then
+                round(coalesce(u.booked_days, 0)::decimal / (p_end_date - p_start_date + 1), 4)
+        end,
+        coalesce(u.avg_rental_days, 0)::decimal(5,1),
+        coalesce(u.projected_revenue, 0)::decimal(12,2)
+    from equipment e
+    join equipment_models em on em.id = e.model_id
+    left join usage u on u.equipment_id = e.id
+    where p_equipment_ids is null or e.id = any(p_equipment_ids);
+$$;
+
+commit;